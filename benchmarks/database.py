@@ -0,0 +1,94 @@
+"""
+Benchmark of database operations on the hot path of computations.
+
+Compares Database (SQLAlchemy, "sqlite:///") with RawSqliteDatabase
+(plain sqlite3 statements, "sqlite3:///") on announcing jobs, setting them
+running and finished, and reading their states and values.
+
+Usage: python3 benchmarks/database.py [--jobs N] [--plan-size N]
+"""
+
+import argparse
+import os
+import pickle
+import tempfile
+import time
+
+from orco.internals.database import open_database
+from orco.internals.plan import PlanNode
+
+
+class BenchmarkPlan:
+    def __init__(self, nodes):
+        self.nodes = nodes
+
+
+def make_plans(n_jobs, plan_size):
+    plans = []
+    for i in range(0, n_jobs, plan_size):
+        nodes = []
+        for j in range(i, min(i + plan_size, n_jobs)):
+            inputs = nodes[-2:]
+            nodes.append(
+                PlanNode("benchmark", "key-{}".format(j), {"x": j}, None, inputs, [])
+            )
+        plans.append(BenchmarkPlan(nodes))
+    return plans
+
+
+def measure(name, fn, n_ops):
+    start = time.time()
+    fn()
+    duration = time.time() - start
+    print(
+        "{:<12} {:8.3f} s {:10.0f} ops/s".format(name, duration, n_ops / duration)
+    )
+
+
+def run(db, n_jobs, plan_size):
+    plans = make_plans(n_jobs, plan_size)
+    nodes = [pn for plan in plans for pn in plan.nodes]
+    keys = [pn.key for pn in nodes]
+
+    def announce():
+        for plan in plans:
+            assert db.announce_jobs(plan)
+
+    def run_jobs():
+        for pn in nodes:
+            db.set_running(pn.job_id)
+            db.set_finished(pn.job_id, pickle.dumps(pn.config), None, 0)
+
+    def read_states():
+        for pn in nodes:
+            db.get_active_job_id_and_state(pn.key)
+        db.get_states([pn.job_id for pn in nodes])
+
+    def read_values():
+        finished = db.read_finished(keys)
+        assert len(finished) == n_jobs
+        db.read_blobs([job_id for job_id, _ in finished.values()])
+
+    measure("announce", announce, n_jobs)
+    measure("run", run_jobs, n_jobs)
+    measure("states", read_states, n_jobs)
+    measure("values", read_values, n_jobs)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=5000)
+    parser.add_argument("--plan-size", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for scheme in ("sqlite", "sqlite3"):
+            url = "{}:///{}".format(scheme, os.path.join(tmp, scheme + ".db"))
+            print(url.split(":")[0])
+            db = open_database(url)
+            db.init()
+            run(db, args.jobs, args.plan_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark of dropping and archiving jobs in a large graph of jobs.
+
+Compares a database with the current indexes with a database that has
+indexes of older versions (no indexes on job_deps, single column indexes
+on jobs.key and jobs.builder).
+
+Usage: python3 benchmarks/graph.py [--layers N] [--width N]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from orco.internals.database import JobState, open_database
+
+OLD_INDEXES = (
+    "DROP INDEX key_state_idx",
+    "DROP INDEX builder_state_idx",
+    "DROP INDEX job_deps_source_idx",
+    "DROP INDEX job_deps_target_idx",
+    "CREATE INDEX key_idx ON jobs (key)",
+    "CREATE INDEX builder_idx ON jobs (builder)",
+)
+
+
+def key(layer, i):
+    return "key-{}-{}".format(layer, i)
+
+
+def create_graph(db, n_layers, width):
+    """Layers of jobs, each job depends on two jobs of the previous layer"""
+    with db.conn.begin():
+        db.conn.execute(
+            db.jobs.insert(),
+            [
+                {
+                    "id": layer * width + i + 1,
+                    "state": JobState.FINISHED,
+                    "builder": "layer{}".format(layer),
+                    "key": key(layer, i),
+                    "config": {"layer": layer, "i": i},
+                }
+                for layer in range(n_layers)
+                for i in range(width)
+            ],
+        )
+        db.conn.execute(
+            db.job_deps.insert(),
+            [
+                {
+                    "source_id": (layer - 1) * width + (i + d) % width + 1,
+                    "target_id": layer * width + i + 1,
+                }
+                for layer in range(1, n_layers)
+                for i in range(width)
+                for d in (0, 1)
+            ],
+        )
+
+
+def measure(name, fn):
+    start = time.time()
+    fn()
+    print("{:<10} {:8.3f} s".format(name, time.time() - start))
+
+
+def run(db, n_layers, width):
+    mid = n_layers // 2
+
+    def lookups():
+        for i in range(width):
+            db.get_active_job_id_and_state(key(n_layers - 1, i))
+
+    measure("lookups", lookups)
+    # Archives a half of the graph (downstream of the middle layer)
+    measure("archive", lambda: db.archive_jobs_by_key([key(mid, 0)], False))
+    # Drops everything downstream and upstream of a single job
+    measure("drop", lambda: db.drop_jobs_by_key([key(mid + 1, 0)], True))
+    measure("drop layer", lambda: db.drop_builder("layer0", False))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--layers", type=int, default=50)
+    parser.add_argument("--width", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for indexes in ("current", "old"):
+            print("{} indexes".format(indexes))
+            db = open_database("sqlite:///" + os.path.join(tmp, indexes + ".db"))
+            db.init()
+            if indexes == "old":
+                for sql in OLD_INDEXES:
+                    db.conn.execute(sql)
+            create_graph(db, args.layers, args.width)
+            run(db, args.layers, args.width)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark of concurrent workers writing into one SQLite database.
+
+Each worker process announces, starts and finishes its own jobs while
+a reader process keeps reading finished jobs (as the browser does).
+Reports the throughput and the number of failed jobs for SQLite profiles
+and numbers of workers.
+
+Usage: python3 benchmarks/sqlite_profile.py [--jobs N] [--workers 1,2,4,8,16]
+"""
+
+import argparse
+import multiprocessing
+import os
+import pickle
+import tempfile
+import time
+
+from orco.internals.database import open_database
+from orco.internals.plan import PlanNode
+
+
+class BenchmarkPlan:
+    def __init__(self, nodes):
+        self.nodes = nodes
+
+
+def worker(url, index, n_jobs, result_queue):
+    db = open_database(url)
+    failed = 0
+    for i in range(n_jobs):
+        pn = PlanNode("benchmark", "key-{}-{}".format(index, i), i, None, [], [])
+        try:
+            assert db.announce_jobs(BenchmarkPlan([pn]))
+            db.set_running(pn.job_id)
+            db.set_finished(pn.job_id, pickle.dumps(i), None, 0)
+        except Exception:
+            failed += 1
+    result_queue.put(failed)
+
+
+def reader(url, stop_event):
+    db = open_database(url)
+    while not stop_event.is_set():
+        try:
+            db.read_finished(["key-0-{}".format(i) for i in range(100)])
+        except Exception:
+            pass
+
+
+def run(url, profile, n_workers, n_jobs):
+    db = open_database(url)
+    db.init()
+    db.set_sqlite_profile(profile)
+
+    result_queue = multiprocessing.Queue()
+    stop_event = multiprocessing.Event()
+    reader_process = multiprocessing.Process(target=reader, args=(url, stop_event))
+    reader_process.start()
+    start = time.time()
+    processes = [
+        multiprocessing.Process(target=worker, args=(url, i, n_jobs, result_queue))
+        for i in range(n_workers)
+    ]
+    for p in processes:
+        p.start()
+    failed = sum(result_queue.get() for _ in processes)
+    duration = time.time() - start
+    for p in processes:
+        p.join()
+    stop_event.set()
+    reader_process.join()
+    print(
+        "{:<8} {:3} workers {:8.2f} s {:8.0f} jobs/s {:6} failed".format(
+            profile,
+            n_workers,
+            duration,
+            (n_workers * n_jobs - failed) / duration,
+            failed,
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=200, help="Jobs per worker")
+    parser.add_argument("--workers", default="1,2,4,8,16")
+    parser.add_argument("--raw", action="store_true", help="Use 'sqlite3:///' urls")
+    args = parser.parse_args()
+
+    scheme = "sqlite3" if args.raw else "sqlite"
+    with tempfile.TemporaryDirectory() as tmp:
+        for profile in ("default", "fast"):
+            for n_workers in map(int, args.workers.split(",")):
+                path = os.path.join(tmp, "{}-{}.db".format(profile, n_workers))
+                url = "{}:///{}".format(scheme, path)
+                run(url, profile, n_workers, args.jobs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark of storing and loading large array values.
+
+Compares pickling a value into a single bytes object (the format used before
+out-of-band buffers) with pickle protocol 5 and out-of-band buffers.
+
+Usage: python3 benchmarks/values.py [--size MB] [--blob-store PATH]
+"""
+
+import argparse
+import os
+import pickle
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from orco import Runtime, consts
+from orco.internals.serialization import load_value, serialize, write_oob
+
+
+def store_legacy(db, job_id, value):
+    db.insert_blob(job_id, None, pickle.dumps(value), consts.MIME_PICKLE, None)
+
+
+def load_legacy(db, job_id):
+    data, mime = db.get_blob(job_id, None)
+    return pickle.loads(data)
+
+
+def store_oob(db, job_id, value):
+    data, buffers = serialize(value)
+    with tempfile.TemporaryFile() as f:
+        write_oob(f, data, buffers)
+        db.insert_blob_from_file(job_id, None, f, consts.MIME_PICKLE_OOB, None)
+
+
+def load_oob(db, job_id):
+    f, mime = db.open_blob(job_id, None)
+    with f:
+        return load_value(f, mime)
+
+
+def measure(name, fn, *args):
+    tracemalloc.start()
+    start = time.time()
+    result = fn(*args)
+    duration = time.time() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("{:<14} {:8.2f} s {:10.1f} MB peak".format(name, duration, peak / 1e6))
+    return result
+
+
+def create_job(db, name):
+    key = "benchmark-{}".format(name)
+    db.create_job_with_value("benchmark", key, {"name": name}, None, None)
+    return db.read_finished([key])[key][0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=1024, help="Size of array in MB")
+    parser.add_argument("--blob-store", default=None)
+    args = parser.parse_args()
+
+    value = np.random.randint(0, 255, args.size * 1024 * 1024, dtype=np.uint8)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_url = "sqlite:///" + os.path.join(tmp, "benchmark.db")
+        with Runtime(db_url, blob_store=args.blob_store) as runtime:
+            db = runtime.db
+            for name, store, load in (
+                ("legacy", store_legacy, load_legacy),
+                ("oob", store_oob, load_oob),
+            ):
+                job_id = create_job(db, name)
+                measure(name + " store", store, db, job_id, value)
+                loaded = measure(name + " load", load, db, job_id)
+                assert np.array_equal(loaded, value)
+                del loaded
+
+
+if __name__ == "__main__":
+    main()
@@ -16,6 +16,7 @@ interface JobSummary {
     key: string,
     size: number,
     comp_time: number,
+    value: string | null,
     config: any,
     state: string,
 }
@@ -130,6 +131,11 @@ class Builder extends React.Component<Props, State> {
                             Cell: this._cellStateRepr,
                             maxWidth: 45,
                         },
+                        {
+                            Header: "Value",
+                            accessor: "value",
+                            maxWidth: 200,
+                        },
                         {
                             id: "size",
                             Header: "Size",
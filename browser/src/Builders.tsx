@@ -13,6 +13,7 @@ interface BuilderSummary {
     name: string,
     count: number,
     size: number,
+    physical_size: number,
 }
 
 interface State {
@@ -42,6 +43,7 @@ class Builders extends React.Component<Props, State> {
     }
 
     _formatSize = (builder : BuilderSummary) => formatSize(builder.size)
+    _formatPhysicalSize = (builder : BuilderSummary) => formatSize(builder.physical_size)
     _builderCell = (cellInfo: CellInfo) => {
         const row: BuilderSummary = cellInfo.row;
         return (<Link to={"/builder/" + row.name}>{row.name}</Link>);
@@ -83,6 +85,12 @@ class Builders extends React.Component<Props, State> {
             Header: "Total Size",
             accessor: this._formatSize,
             maxWidth: 200
+        },
+        {
+            id: "PhysicalSize",
+            Header: "Stored Size",
+            accessor: this._formatPhysicalSize,
+            maxWidth: 200
         }
         ];
 
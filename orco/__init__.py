@@ -2,13 +2,16 @@ from .builder import Builder  # noqa
 from .cli import run_cli  # noqa
 from .globals import *  # noqa
 from .internals.executor import Executor, JobFailedException  # noqa
+from .internals.serialization import Serializer, register_serializer  # noqa
 from .job import JobState  # noqa
 from .jobfunctions import (
     attach_object,
     attach_bytes,
     attach_file,
     attach_directory,
+    attach_stream,
     attach_text,
+    deps_done,
 )  # noqa
 from .jobsetup import JobSetup  # noqa
 from .runtime import Runtime  # noqa
@@ -3,7 +3,7 @@ import inspect
 
 from .internals.context import _CONTEXT
 from .internals.key import make_key
-from .internals.utils import CloudWrapper
+from .internals.utils import CloudWrapper, run_coroutine
 from .job import Job
 from .jobsetup import JobSetup
 
@@ -12,6 +12,15 @@ def _generic_kwargs_fn(**_kwargs):
     pass
 
 
+class _DepsCollected(BaseException):
+    """
+    Raised from deps_done() to stop a coroutine after its dependency phase;
+    it is not an Exception, so it is not caught by `except Exception` in builders
+    """
+
+    pass
+
+
 class BuilderProxy:
     def __init__(self, name, has_fn, fn_signature, fn_argspec, fn_name, doc):
         self.name = name
@@ -56,8 +65,6 @@ class BuilderProxy:
         Calls `_CONTEXT.on_job` to register/check dependencies etc.
         """
         job = Job(self.name, make_key(self.name, config), config)
-        if not hasattr(_CONTEXT, "on_job"):
-            return job
         on_job = _CONTEXT.on_job
         if on_job:
             on_job(job)
@@ -76,15 +83,28 @@ class Builder:
     values can be accessed).
     Optionally updates resulting callable object to resemble the wrapped
     function (name, doc, etc.).
+
+    Values of an ephemeral builder are never stored in the database; they are
+    kept by the executor only until consumers in the current computation
+    finish, and the jobs are computed again when they are needed later.
+
+    The function must not modify values of its dependencies when caches of
+    values are enabled: the same deserialized object is then given to all
+    jobs that use it (see `value_cache_size` of `Runtime`).
     """
 
-    def __init__(self, fn, name: str = None, job_setup=None, is_frozen=False):
+    def __init__(
+        self, fn, name: str = None, job_setup=None, is_frozen=False, ephemeral=False
+    ):
         if not callable(fn) and fn is not None:
             raise TypeError("Fn must be callable or None, {!r} provided".format(fn))
 
         if fn is None and not is_frozen:
             raise Exception("When fn is None but builder is not frozen")
 
+        if is_frozen and ephemeral:
+            raise Exception("Frozen builder cannot be ephemeral")
+
         # Cloudwrapper
         if fn is not None and not isinstance(fn, CloudWrapper):
             fn = CloudWrapper(fn)
@@ -107,6 +127,7 @@ class Builder:
             )
         self.name = name
         self.is_frozen = is_frozen
+        self.ephemeral = ephemeral
 
         # Signature inference
         if self.fn is not None:
@@ -168,6 +189,13 @@ class Builder:
         if self.is_frozen:
             raise Exception("Frozen builder {!r} can't be run".format(self))
 
+        if self.is_coroutine_function():
+            return run_coroutine(
+                self.run_with_args_async(
+                    args, kwargs, only_deps=only_deps, after_deps=after_deps
+                )
+            )
+
         if inspect.isgeneratorfunction(self.fn):
             g = self.fn(*args, **kwargs)
             try:
@@ -201,6 +229,61 @@ class Builder:
             )
         return value
 
+    def is_coroutine_function(self):
+        return inspect.iscoroutinefunction(self.fn)
+
+    async def run_with_config_async(self, config, only_deps=False, after_deps=None):
+        """
+        Asynchronous variant of `run_with_config` for coroutine functions.
+        """
+        if self.is_frozen:
+            raise Exception("Frozen builder {!r} can't be run".format(self))
+
+        args, kwargs = self._create_args_from_config(config)
+        return await self.run_with_args_async(
+            args, kwargs, only_deps=only_deps, after_deps=after_deps
+        )
+
+    async def run_with_args_async(self, args, kwargs, only_deps=False, after_deps=None):
+        """
+        Asynchronous variant of `run_with_args` for coroutine functions.
+
+        The dependency phase of the coroutine ends by `await orco.deps_done()`.
+        With `only_deps=True` the coroutine is stopped there.
+        """
+        if self.is_frozen:
+            raise Exception("Frozen builder {!r} can't be run".format(self))
+        if not self.is_coroutine_function():
+            raise Exception("Builder {!r} is not a coroutine function".format(self))
+
+        deps_done_called = False
+
+        def on_deps_done():
+            nonlocal deps_done_called
+            if deps_done_called:
+                raise Exception("Computation function awaited deps_done() more than once")
+            deps_done_called = True
+            if only_deps:
+                raise _DepsCollected()
+            if after_deps is not None:
+                # Returns an awaitable when values are prefetched asynchronously
+                return after_deps()
+            return None
+
+        _CONTEXT.on_deps_done = on_deps_done
+        try:
+            value = await self.fn(*args, **kwargs)
+        except _DepsCollected:
+            return None
+        finally:
+            _CONTEXT.on_deps_done = None
+
+        if not deps_done_called:
+            raise Exception(
+                "Computation function is a coroutine but did not await deps_done()"
+            )
+        return value
+
     def __eq__(self, other):
         if not isinstance(other, Builder):
             return False
@@ -218,6 +301,8 @@ class Builder:
             job_setup = job_setup(config)
 
         if job_setup is None:
+            if self.is_coroutine_function():
+                return JobSetup("asyncio")
             return JobSetup("local")
         elif isinstance(job_setup, str):
             return JobSetup(job_setup)
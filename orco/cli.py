@@ -59,11 +59,27 @@ def _command_drop_builder(runtime, args):
     runtime.drop_builder(args.builder)
 
 
+def _command_worker(_runtime, args):
+    from .internals.remote import run_worker
+
+    host, _, port = args.address.rpartition(":")
+    if not host or not port.isdigit():
+        raise Exception("Invalid address {!r}, expected HOST:PORT".format(args.address))
+    secret = args.secret or os.environ.get("ORCO_SECRET")
+    run_worker(host, int(port), args.slots, secret)
+
+
+def _command_daemon(_runtime, args):
+    from .internals.daemon import run_daemon
+
+    run_daemon(args.socket, args.processes)
+
+
 def _parse_args():
     parser = argparse.ArgumentParser("orco", description="Organized Computing")
     parser.add_argument("-d", "--db", default=None, type=str)
     sp = parser.add_subparsers(title="command")
-    parser.set_defaults(command=None)
+    parser.set_defaults(command=None, needs_runtime=True)
 
     # SERVE
     p = sp.add_parser("serve")
@@ -99,6 +115,19 @@ def _parse_args():
     p.add_argument("builder")
     p.set_defaults(command=_command_drop_builder)
 
+    # WORKER
+    p = sp.add_parser("worker")
+    p.add_argument("address", help="Address of remote runner (HOST:PORT)")
+    p.add_argument("--slots", type=int, default=None)
+    p.add_argument("--secret", type=str, default=None)
+    p.set_defaults(command=_command_worker, needs_runtime=False)
+
+    # DAEMON
+    p = sp.add_parser("daemon")
+    p.add_argument("--socket", type=str, default=None)
+    p.add_argument("--processes", type=int, default=None)
+    p.set_defaults(command=_command_daemon, needs_runtime=False)
+
     return parser.parse_args()
 
 
@@ -112,6 +141,9 @@ def run_cli(runtime=None, db_path=None):
     """
     try:
         args = _parse_args()
+        if not args.needs_runtime:
+            args.command(None, args)
+            return
         if runtime is None:
             if args.db is not None:
                 db_path = args.db
@@ -1,3 +1,10 @@
 MIME_TEXT = "text/plain"
 MIME_PICKLE = "application/python.pickle"  # TODO: Is it correct?
 MIME_BYTES = "application/octet-stream"
+# Pickle (protocol 5) with out-of-band buffers, see orco.internals.serialization
+MIME_PICKLE_OOB = "application/python.pickle-oob"
+MIME_JSON = "application/json"
+MIME_MSGPACK = "application/msgpack"
+MIME_NPY = "application/x-npy"
+MIME_PARQUET = "application/vnd.apache.parquet"
+MIME_ARROW = "application/vnd.apache.arrow.file"
@@ -0,0 +1,121 @@
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+import orco
+from orco.consts import MIME_ARROW, MIME_PARQUET
+
+FORMATS = {"parquet": MIME_PARQUET, "arrow": MIME_ARROW}
+
+
+def _to_table(table):
+    if isinstance(table, pa.Table):
+        return table
+    # pandas.DataFrame
+    return pa.Table.from_pandas(table)
+
+
+def _to_expression(filter):
+    if filter is None or isinstance(filter, ds.Expression):
+        return filter
+    # Filter in disjunctive normal form, e.g. [("x", ">", 10)]
+    return pq.filters_to_expression(filter)
+
+
+def attach_table(name, table, format="parquet", row_group_size=None):
+    """
+    Attach a table (pyarrow.Table or pandas.DataFrame) to a current job.
+
+    The table is stored in Parquet format (default) or in Arrow IPC file format
+    (format="arrow"). Parquet files are split into row groups of
+    `row_group_size` rows, so readers may skip row groups that do not pass
+    a filter.
+    """
+    if format not in FORMATS:
+        raise ValueError(
+            "Invalid format {!r}, expected one of {}".format(
+                format, ", ".join(FORMATS)
+            )
+        )
+    table = _to_table(table)
+    repr_value = "<table {} rows, columns: {}>".format(
+        table.num_rows, ", ".join(table.column_names)
+    )
+    with orco.attach_stream(name, FORMATS[format], repr_value) as f:
+        if format == "parquet":
+            pq.write_table(table, f, row_group_size=row_group_size)
+        else:
+            with pa.ipc.new_file(f, table.schema) as writer:
+                writer.write_table(table)
+
+
+def _read_table(source, mime, columns, filter):
+    if mime == MIME_PARQUET:
+        return pq.read_table(source, columns=columns, filters=filter)
+    if mime != MIME_ARROW:
+        raise Exception("Blob exists, but is not a table, but {}".format(mime))
+    table = pa.ipc.open_file(source).read_all()
+    if filter is not None:
+        table = table.filter(_to_expression(filter))
+    if columns is not None:
+        table = table.select(columns)
+    return table
+
+
+def get_table(job, name, columns=None, filter=None):
+    """
+    Get a table attached by `attach_table` as pyarrow.Table.
+
+    Only given `columns` are read; `filter` is a pyarrow.dataset expression
+    or a filter in disjunctive normal form (see pyarrow.parquet.read_table).
+    When the table is stored uncompressed in a file-system blob store, it is
+    read directly from the file (Arrow files are memory-mapped), so only the
+    needed columns and row groups are read.
+    """
+    job._check_attached()
+    path, mime = job._db.get_blob_path(job._job_id, name)
+    if mime is None:
+        raise Exception("Blob '{}' not found".format(name))
+    if path is not None:
+        source = pa.memory_map(path) if mime == MIME_ARROW else path
+    else:
+        data, mime = job._db.get_blob(job._job_id, name)
+        source = pa.BufferReader(data)
+    return _read_table(source, mime, columns, filter)
+
+
+def concat_tables(runtime, jobs, name, columns=None, filter=None):
+    """
+    Concatenate tables with the given name attached to jobs.
+
+    Blobs of all jobs are found by batched queries. Tables in a file-system
+    blob store are scanned as a single pyarrow dataset, so only the needed
+    columns and row groups are read. Rows are not guaranteed to be in
+    the order of jobs. Returns None when `jobs` is empty.
+    """
+    job_ids = []
+    for job in jobs:
+        job._check_attached()
+        job_ids.append(job._job_id)
+    db = runtime.db
+    paths = db.get_blob_paths(job_ids, name)
+    missing = [job_id for job_id in job_ids if job_id not in paths]
+    if missing:
+        raise Exception("Blob '{}' not found in {} job(s)".format(name, len(missing)))
+    for _, mime in paths.values():
+        if mime not in (MIME_PARQUET, MIME_ARROW):
+            raise Exception("Blob exists, but is not a table, but {}".format(mime))
+    tables = []
+    for mime, format in ((MIME_PARQUET, "parquet"), (MIME_ARROW, "ipc")):
+        files = [path for path, m in paths.values() if path is not None and m == mime]
+        if files:
+            dataset = ds.dataset(files, format=format)
+            tables.append(
+                dataset.to_table(columns=columns, filter=_to_expression(filter))
+            )
+    in_db = [job_id for job_id, (path, _) in paths.items() if path is None]
+    for data, mime in db.read_blobs(in_db, name).values():
+        tables.append(_read_table(pa.BufferReader(data), mime, columns, filter))
+    if not tables:
+        return None
+    return pa.concat_tables(tables)
@@ -0,0 +1,38 @@
+import numpy as np
+
+import orco
+from orco.consts import MIME_NPY
+
+
+def attach_array(name, array):
+    """
+    Attach a NumPy array to a current job.
+
+    The array is stored in .npy format, so it can be memory-mapped
+    by `get_array` when it is stored in a file-system blob store.
+    Arrays of Python objects are not supported.
+    """
+    array = np.asanyarray(array)
+    repr_value = "<array {} {}>".format(array.dtype, array.shape)
+    with orco.attach_stream(name, MIME_NPY, repr_value) as f:
+        np.lib.format.write_array(f, array, allow_pickle=False)
+
+
+def get_array(job, name, mmap=True):
+    """
+    Get an array attached by `attach_array`.
+
+    If `mmap` is True and the array is stored uncompressed in a file-system
+    blob store, the file is memory-mapped (read-only) instead of being read
+    into memory. Otherwise the array is read into memory.
+    """
+    job._check_attached()
+    path, mime = job._db.get_blob_path(job._job_id, name)
+    if mime is None:
+        raise Exception("Blob '{}' not found".format(name))
+    if mime != MIME_NPY:
+        raise Exception("Blob exists, but is not an array, but {}".format(mime))
+    if mmap and path is not None:
+        return np.load(path, mmap_mode="r", allow_pickle=False)
+    with job.open_blob(name) as f:
+        return np.lib.format.read_array(f, allow_pickle=False)
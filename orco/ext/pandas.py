@@ -1,12 +1,22 @@
 import pandas as pd
 
+from orco.consts import MIME_PICKLE
+from orco.internals.serialization import loads_value
 
-def export_builder(runtime, builder_name, missing=pd.NA, arg_prefix="arg."):
+
+def export_builder(
+    runtime, builder_name, missing=pd.NA, arg_prefix="arg.", value_column=None
+):
     """
     Export builder into pandas  DataFrame
+
+    If `value_column` is set, values of jobs are exported into a column of this
+    name. Small values are read together with jobs, larger values are read by
+    a single additional query.
     """
 
     cols = {"comp_time": []}
+    values = []
     for i, job in enumerate(runtime.db.export_builder(builder_name)):
         cols["comp_time"].append(job.computation_time)
         for k, v in job.config.items():
@@ -17,9 +27,26 @@ def export_builder(runtime, builder_name, missing=pd.NA, arg_prefix="arg."):
             if len(c) != i:
                 c.extend([missing] * (i - len(c)))
             c.append(v)
+        values.append((job.id, job.value))
+    if value_column is not None:
+        large = runtime.db.read_blobs(
+            job_id for job_id, value in values if value is None
+        )
+        cols[value_column] = [
+            _load_value(value, MIME_PICKLE)
+            if value is not None
+            else _load_value(*large.get(job_id, (None, None)))
+            for job_id, value in values
+        ]
     return pd.DataFrame(cols)
 
 
+def _load_value(value, mime):
+    if value is None:
+        return None
+    return loads_value(value, mime)
+
+
 def unpack_frame(frame, unpack_column="config"):
     new = pd.DataFrame(list(frame[unpack_column]))
     new = pd.concat([frame, new], axis=1)
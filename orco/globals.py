@@ -6,9 +6,15 @@ _global_builders = {}
 _global_runtime = None
 
 
-def builder(*, name=None, job_setup=None, is_frozen=False):
+def builder(*, name=None, job_setup=None, is_frozen=False, ephemeral=False):
     def _register(fn):
-        b = Builder(fn, name=name, job_setup=job_setup, is_frozen=is_frozen)
+        b = Builder(
+            fn,
+            name=name,
+            job_setup=job_setup,
+            is_frozen=is_frozen,
+            ephemeral=ephemeral,
+        )
         _register_builder(b)
         return b.make_proxy()
 
@@ -29,7 +35,15 @@ def _get_global_builders():
     return _global_builders.values()
 
 
-def start_runtime(db_url, *, n_processes=None):
+def start_runtime(
+    db_url,
+    *,
+    n_processes=None,
+    daemon=None,
+    blob_store=None,
+    sqlite_profile=None,
+    value_cache_size=None,
+):
     """
     Create and start a global runtime,
 
@@ -40,15 +54,29 @@ def start_runtime(db_url, *, n_processes=None):
 
     >>> start_runtime("sqlite:///path/to/dbfile.db")
 
+    For an in-memory SQLite database (jobs are computed in threads):
+
+    >>> start_runtime("sqlite://")
+
     For Postgress:
 
     >>> start_runtime("postgresql://<USERNAME>:<PASSWORD>@<HOSTNAME>/<DATABASE>")
+
+    See `Runtime` for the description of `daemon`, `blob_store`, `sqlite_profile`
+    and `value_cache_size`.
     """
 
     global _global_runtime
     if _global_runtime is not None:
         _global_runtime.stop()
-    _global_runtime = Runtime(db_url, n_processes=n_processes)
+    _global_runtime = Runtime(
+        db_url,
+        n_processes=n_processes,
+        daemon=daemon,
+        blob_store=blob_store,
+        sqlite_profile=sqlite_profile,
+        value_cache_size=value_cache_size,
+    )
     return _global_runtime
 
 
@@ -0,0 +1,322 @@
+import logging
+import os
+import pickle
+import shlex
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures.process import ProcessPoolExecutor
+
+from .runner import JobError, JobRunner, _run_job
+
+logger = logging.getLogger(__name__)
+
+_TASKS_FILENAME = "tasks.pickle"
+_RESULTS_DIRNAME = "results"
+
+
+class _Allocation:
+    def __init__(self, path, futures):
+        self.path = path
+        self.futures = futures
+        self.batch_id = None
+        self.submit_time = None
+
+    def results_path(self):
+        return os.path.join(self.path, _RESULTS_DIRNAME)
+
+
+class BatchRunner(JobRunner):
+    """
+    Runner that executes jobs through a batch scheduler (SLURM by default).
+
+    Ready jobs are packed: jobs submitted within `batch_window` seconds are put
+    into a single allocation (at most `max_jobs` jobs per allocation). Each
+    allocation runs a worker loop (`python -m orco.internals.batch`) that executes
+    its jobs in a pool of `n_slots` processes. Futures are resolved as jobs finish,
+    not when the whole allocation ends.
+
+    `work_dir` has to be on a filesystem shared with the compute nodes, as well as
+    the database. `options` are written into the job script as scheduler
+    directives, e.g. `["--time=01:00:00", "--partition=short"]`.
+
+    Commands are lists of arguments; the path to the job script is appended to
+    `submit_command`. Output of `status_command` is expected to contain one line
+    per active batch job starting with its id; an allocation that is not listed
+    anymore is considered dead and its unfinished jobs fail. Allocations submitted
+    less than `status_grace_period` seconds ago are not checked, as schedulers
+    may list new batch jobs with a delay.
+    """
+
+    directive = "#SBATCH"
+
+    def __init__(
+        self,
+        work_dir=None,
+        n_slots=1,
+        max_jobs=64,
+        batch_window=0.5,
+        options=(),
+        poll_interval=1.0,
+        python=None,
+        submit_command=("sbatch", "--parsable"),
+        status_command=("squeue", "-h", "-o", "%i"),
+        cancel_command=("scancel",),
+        status_grace_period=10.0,
+    ):
+        self.work_dir = work_dir
+        self.n_slots = n_slots
+        self.max_jobs = max_jobs
+        self.batch_window = batch_window
+        self.options = list(options)
+        self.poll_interval = poll_interval
+        self.python = python or sys.executable
+        self.submit_command = list(submit_command)
+        self.status_command = list(status_command)
+        self.cancel_command = list(cancel_command)
+        self.status_grace_period = status_grace_period
+
+        self.pending = []
+        self.allocations = []
+        self.condition = threading.Condition()
+        self.thread = None
+        self.stopped = True
+        self.counter = 0
+
+    def start(self):
+        if self.work_dir is None:
+            self.work_dir = tempfile.mkdtemp(prefix="orco-batch-")
+        os.makedirs(self.work_dir, exist_ok=True)
+        self.stopped = False
+        self.thread = threading.Thread(target=self._main_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            pending = self.pending
+            self.pending = []
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        for future, _ in pending:
+            future.cancel()
+        for allocation in self.allocations:
+            if allocation.batch_id is not None:
+                self._call(self.cancel_command + [allocation.batch_id], check=False)
+            self._fail_jobs(allocation, "Runner was stopped")
+        self.allocations = []
+
+    def get_resources(self):
+        return "batch scheduler ({} slots per allocation)".format(self.n_slots)
+
+    def submit(self, runtime, plan_node):
+        builder = runtime.get_builder(plan_node.builder_name)
+        future = Future()
+        with self.condition:
+            self.pending.append(
+                (
+                    future,
+                    (
+                        runtime.db.url,
+                        builder,
+                        plan_node.job_id,
+                        plan_node.ephemeral_inputs,
+                    ),
+                )
+            )
+            self.condition.notify_all()
+        return future
+
+    def _main_loop(self):
+        last_poll = time.monotonic()
+        while True:
+            with self.condition:
+                if self.stopped:
+                    return
+                batch = self._take_batch()
+            if batch:
+                self._submit_allocation(batch)
+            now = time.monotonic()
+            if now - last_poll >= self.poll_interval:
+                last_poll = now
+                self._poll(check_status=True)
+            else:
+                self._poll(check_status=False)
+
+    def _take_batch(self):
+        # Has to be called with self.condition acquired
+        if not self.pending:
+            self.condition.wait(min(self.poll_interval, 0.2))
+            return None
+        # Wait for other jobs that become ready at the same time
+        end = time.monotonic() + self.batch_window
+        while len(self.pending) < self.max_jobs and not self.stopped:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                break
+            self.condition.wait(remaining)
+        batch = self.pending[: self.max_jobs]
+        del self.pending[: self.max_jobs]
+        return batch
+
+    def _submit_allocation(self, batch):
+        tasks = []
+        futures = {}
+        for future, task in batch:
+            if future.set_running_or_notify_cancel():
+                tasks.append(task)
+                futures[task[2]] = future
+        if not tasks:
+            return
+        self.counter += 1
+        path = os.path.abspath(
+            os.path.join(self.work_dir, "alloc-{}-{}".format(os.getpid(), self.counter))
+        )
+        allocation = _Allocation(path, futures)
+        os.makedirs(allocation.results_path())
+        with open(os.path.join(path, _TASKS_FILENAME), "wb") as f:
+            pickle.dump(tasks, f)
+        script_path = os.path.join(path, "job.sh")
+        with open(script_path, "w") as f:
+            f.write(self._make_script(allocation))
+        try:
+            output = self._call(self.submit_command + [script_path])
+        except Exception as e:
+            logger.error("Submitting allocation %s failed: %s", path, e)
+            self._fail_jobs(allocation, "Submitting batch job failed: {}".format(e))
+            return
+        allocation.batch_id = self._parse_batch_id(output)
+        allocation.submit_time = time.monotonic()
+        logger.info(
+            "Batch job %s submitted with %s jobs", allocation.batch_id, len(tasks)
+        )
+        self.allocations.append(allocation)
+
+    def _make_script(self, allocation):
+        lines = ["#!/bin/sh"]
+        lines.extend("{} {}".format(self.directive, opt) for opt in self.options)
+        lines.append(
+            "exec {} -m orco.internals.batch {} {}".format(
+                shlex.quote(self.python), shlex.quote(allocation.path), self.n_slots
+            )
+        )
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _parse_batch_id(output):
+        # sbatch --parsable prints "<id>[;<cluster>]", qsub prints "<id>.<server>"
+        return output.strip().split(";")[0]
+
+    @staticmethod
+    def _call(args, check=True):
+        return subprocess.run(
+            args, check=check, stdout=subprocess.PIPE, universal_newlines=True
+        ).stdout
+
+    def _active_batch_ids(self):
+        output = self._call(self.status_command)
+        return set(line.split()[0] for line in output.splitlines() if line.strip())
+
+    def _poll(self, check_status):
+        if not self.allocations:
+            return
+        active = None
+        if check_status:
+            try:
+                active = self._active_batch_ids()
+            except Exception as e:
+                logger.error("Checking status of batch jobs failed: %s", e)
+        now = time.monotonic()
+        finished = []
+        for allocation in self.allocations:
+            self._collect_results(allocation)
+            if not allocation.futures:
+                finished.append(allocation)
+            elif (
+                active is not None
+                and allocation.batch_id not in active
+                and now - allocation.submit_time >= self.status_grace_period
+            ):
+                # Results written just before the allocation ended
+                self._collect_results(allocation)
+                self._fail_jobs(
+                    allocation,
+                    "Batch job {} ended before the job was finished".format(
+                        allocation.batch_id
+                    ),
+                )
+                finished.append(allocation)
+        for allocation in finished:
+            self.allocations.remove(allocation)
+
+    @staticmethod
+    def _collect_results(allocation):
+        results_path = allocation.results_path()
+        for filename in os.listdir(results_path):
+            if not filename.endswith(".pickle"):
+                continue
+            job_id = int(filename[: -len(".pickle")])
+            future = allocation.futures.pop(job_id, None)
+            if future is None:
+                continue
+            with open(os.path.join(results_path, filename), "rb") as f:
+                future.set_result(pickle.load(f))
+
+    @staticmethod
+    def _fail_jobs(allocation, message):
+        futures = allocation.futures
+        allocation.futures = {}
+        for job_id, future in futures.items():
+            if not future.done():
+                future.set_result(JobError(job_id, message, "", stored=False))
+
+
+class PbsRunner(BatchRunner):
+    """BatchRunner for PBS/Torque schedulers"""
+
+    directive = "#PBS"
+
+    def __init__(self, work_dir=None, **kwargs):
+        kwargs.setdefault("submit_command", ("qsub",))
+        kwargs.setdefault("status_command", ("qselect", "-s", "QRHE"))
+        kwargs.setdefault("cancel_command", ("qdel",))
+        super().__init__(work_dir, **kwargs)
+
+
+def _write_result(results_path, job_id, result):
+    tmp_path = os.path.join(results_path, "{}.tmp".format(job_id))
+    with open(tmp_path, "wb") as f:
+        pickle.dump(result, f)
+    # Rename is atomic, the runner never sees a partially written result
+    os.rename(tmp_path, os.path.join(results_path, "{}.pickle".format(job_id)))
+
+
+def run_allocation(path, n_slots):
+    """Executes all jobs of an allocation created by BatchRunner"""
+    with open(os.path.join(path, _TASKS_FILENAME), "rb") as f:
+        tasks = pickle.load(f)
+    results_path = os.path.join(path, _RESULTS_DIRNAME)
+
+    def write_result(job_id, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            result = JobError(job_id, str(e), "", stored=False)
+        _write_result(results_path, job_id, result)
+
+    with ProcessPoolExecutor(max_workers=n_slots) as pool:
+        for db_url, builder, job_id, ephemeral_inputs in tasks:
+            future = pool.submit(_run_job, db_url, builder, job_id, ephemeral_inputs)
+            future.add_done_callback(
+                lambda f, job_id=job_id: write_result(job_id, f)
+            )
+
+
+if __name__ == "__main__":
+    run_allocation(sys.argv[1], int(sys.argv[2]))
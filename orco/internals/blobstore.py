@@ -0,0 +1,98 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+
+class BlobStore:
+    """
+    Storage of blob bodies outside of the database.
+
+    Bodies are addressed by a hash of their content, the database keeps only
+    the hash and metadata of a blob. Blob store is pickled into the database,
+    so every process that opens the database uses the same store.
+
+    Bodies smaller than `threshold` bytes are stored directly in the database.
+    """
+
+    def __init__(self, threshold=0):
+        self.threshold = threshold
+
+    def put(self, data):
+        """Store bytes and return their hash"""
+        raise NotImplementedError
+
+    def put_file(self, blob_hash, fileobj):
+        """Store the content of a binary file object; its hash is already known"""
+        stored_hash = self.put(fileobj.read())
+        assert stored_hash == blob_hash
+
+    def open(self, blob_hash):
+        """Return a binary file object with the body"""
+        raise NotImplementedError
+
+    def get_path(self, blob_hash):
+        """Return a path of a local file with the body, or None if there is none"""
+        return None
+
+    def remove(self, blob_hash):
+        raise NotImplementedError
+
+    def read(self, blob_hash):
+        with self.open(blob_hash) as f:
+            return f.read()
+
+
+class FsBlobStore(BlobStore):
+    """
+    Blob store that keeps bodies as files in a directory tree.
+
+    A body with hash 'abcdef...' is stored in '<path>/ab/cdef...'.
+    The directory has to be accessible from all workers.
+    """
+
+    def __init__(self, path, threshold=4096):
+        super().__init__(threshold)
+        self.path = os.path.abspath(path)
+
+    def _body_path(self, blob_hash):
+        return os.path.join(self.path, blob_hash[:2], blob_hash[2:])
+
+    def put(self, data):
+        blob_hash = hashlib.sha256(data).hexdigest()
+        self._write(blob_hash, lambda f: f.write(data))
+        return blob_hash
+
+    def put_file(self, blob_hash, fileobj):
+        self._write(blob_hash, lambda f: shutil.copyfileobj(fileobj, f))
+
+    def _write(self, blob_hash, write_fn):
+        # The body is written even if the file exists, as it may be just
+        # removed by a process that dropped the last blob using it
+        path = self._body_path(blob_hash)
+        dirname = os.path.dirname(path)
+        os.makedirs(dirname, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write_fn(f)
+            # Rename is atomic, readers never see a partially written body
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def open(self, blob_hash):
+        return open(self._body_path(blob_hash), "rb")
+
+    def get_path(self, blob_hash):
+        return self._body_path(blob_hash)
+
+    def remove(self, blob_hash):
+        try:
+            os.unlink(self._body_path(blob_hash))
+        except FileNotFoundError:
+            pass
+
+    def __repr__(self):
+        return "<FsBlobStore {}>".format(self.path)
@@ -5,7 +5,7 @@ from flask import Flask, Response
 from flask_cors import CORS
 from flask_restful import Resource, Api
 
-from .database import Database
+from .database import open_database
 
 STATIC_ROOT = os.path.join(
     os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static"
@@ -14,13 +14,19 @@ app = Flask(__name__, static_url_path=STATIC_ROOT)
 cors = CORS(app)
 api = Api(app, prefix="/rest")
 
-thread_local_db = threading.local()
+_db = None
+_db_lock = threading.Lock()
 
 
 def get_db():
-    # TODO: Do something better then creating a DB each time
-    db = Database(app.db_url)
-    return db
+    # Database is shared by threads of the server, each thread uses its own connection
+    global _db
+    with _db_lock:
+        if _db is None or _db.url != app.db_url:
+            if _db is not None:
+                _db.stop()
+            _db = open_database(app.db_url)
+        return _db
 
 
 class Builders(Resource):
@@ -0,0 +1,138 @@
+import io
+import lzma
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# codec name -> (compressor factory, decompressor factory)
+CODECS = {
+    "zlib": (zlib.compressobj, zlib.decompressobj),
+    "lzma": (lzma.LZMACompressor, lzma.LZMADecompressor),
+}
+
+if zstandard is not None:
+    CODECS["zstd"] = (
+        lambda: zstandard.ZstdCompressor().compressobj(),
+        lambda: zstandard.ZstdDecompressor().decompressobj(),
+    )
+
+KNOWN_CODECS = ("zlib", "lzma", "zstd")
+
+
+def check_codec(codec):
+    if codec not in KNOWN_CODECS:
+        raise ValueError(
+            "Invalid compression {!r}, expected one of {}".format(
+                codec, ", ".join(KNOWN_CODECS)
+            )
+        )
+    if codec not in CODECS:
+        raise ValueError(
+            "Compression {!r} needs package 'zstandard' to be installed".format(codec)
+        )
+
+
+def compress_blob(data, compression):
+    """
+    Compresses data according to a compression policy (a pair (codec, threshold)
+    or None). Returns compressed data and the used codec; data are kept
+    uncompressed when they are smaller than the threshold or when compression
+    does not save anything.
+    """
+    if compression is None:
+        return data, None
+    codec, threshold = compression
+    if len(data) < threshold:
+        return data, None
+    compressor = CODECS[codec][0]()
+    compressed = compressor.compress(data) + compressor.flush()
+    if len(compressed) >= len(data):
+        return data, None
+    return compressed, codec
+
+
+def compress_stream(src, dst, compression, size):
+    """
+    Streaming variant of `compress_blob`; compresses file `src` with `size` bytes
+    into file `dst`. Returns the used codec or None when data should be stored
+    uncompressed (the content of `dst` is then undefined).
+    """
+    if compression is None:
+        return None
+    codec, threshold = compression
+    if size < threshold:
+        return None
+    compressor = CODECS[codec][0]()
+    written = 0
+    while True:
+        data = src.read(io.DEFAULT_BUFFER_SIZE * 16)
+        if not data:
+            break
+        written += dst.write(compressor.compress(data))
+        if written >= size:
+            return None
+    written += dst.write(compressor.flush())
+    if written >= size:
+        return None
+    return codec
+
+
+def _get_decompressor(codec):
+    try:
+        return CODECS[codec][1]()
+    except KeyError:
+        check_codec(codec)
+        raise
+
+
+def _finish_decompressor(decompressor):
+    flush = getattr(decompressor, "flush", None)
+    if flush is None:
+        return b""
+    return flush()
+
+
+def decompress_blob(data, codec):
+    if codec is None:
+        return data
+    decompressor = _get_decompressor(codec)
+    return decompressor.decompress(data) + _finish_decompressor(decompressor)
+
+
+class _DecompressingReader(io.RawIOBase):
+    def __init__(self, fileobj, codec):
+        self.fileobj = fileobj
+        self.decompressor = _get_decompressor(codec)
+        self.buffer = b""
+        self.eof = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.buffer and not self.eof:
+            data = self.fileobj.read(io.DEFAULT_BUFFER_SIZE)
+            if data:
+                self.buffer = self.decompressor.decompress(data)
+            else:
+                self.buffer = _finish_decompressor(self.decompressor)
+                self.eof = True
+        size = min(len(b), len(self.buffer))
+        b[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self.fileobj.close()
+        super().close()
+
+
+def open_decompressed(fileobj, codec):
+    """Returns a file object that reads decompressed data from fileobj"""
+    if codec is None:
+        return fileobj
+    return io.BufferedReader(_DecompressingReader(fileobj, codec))
@@ -1,5 +1,43 @@
-import threading
+import contextvars
 
-# TODO: In future, change to ContextVar
-_CONTEXT = threading.local()
-_CONTEXT.on_job = None
+_ON_JOB = contextvars.ContextVar("orco_on_job", default=None)
+_JOB_CONTEXT = contextvars.ContextVar("orco_job_context", default=None)
+_ON_DEPS_DONE = contextvars.ContextVar("orco_on_deps_done", default=None)
+
+
+class _Context:
+    """
+    Access to the state of the current job.
+
+    Values are stored in context variables, hence every thread
+    (and every asyncio task) has its own independent state.
+    """
+
+    __slots__ = ()
+
+    @property
+    def on_job(self):
+        return _ON_JOB.get()
+
+    @on_job.setter
+    def on_job(self, value):
+        _ON_JOB.set(value)
+
+    @property
+    def job_context(self):
+        return _JOB_CONTEXT.get()
+
+    @job_context.setter
+    def job_context(self, value):
+        _JOB_CONTEXT.set(value)
+
+    @property
+    def on_deps_done(self):
+        return _ON_DEPS_DONE.get()
+
+    @on_deps_done.setter
+    def on_deps_done(self, value):
+        _ON_DEPS_DONE.set(value)
+
+
+_CONTEXT = _Context()
@@ -0,0 +1,331 @@
+import logging
+import os
+import socket
+import stat
+import struct
+import tempfile
+import threading
+import traceback
+
+import tqdm
+
+from .database import open_database
+from .executor import Executor, JobFailedException
+from .plan import PlanNode
+from .remote import _recv_message, _send_message
+
+logger = logging.getLogger(__name__)
+
+def _private_dir():
+    """
+    Returns a directory accessible only by the current user: $XDG_RUNTIME_DIR
+    or "orco-<uid>" in the temporary directory (created if it does not exist)
+    """
+    path = os.environ.get("XDG_RUNTIME_DIR")
+    if not path or not os.path.isdir(path):
+        path = os.path.join(tempfile.gettempdir(), "orco-{}".format(os.getuid()))
+        try:
+            os.mkdir(path, 0o700)
+        except FileExistsError:
+            pass
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise Exception(
+            "Directory {} is not a private directory of the current user".format(path)
+        )
+    return path
+
+
+def default_socket_path():
+    return os.path.join(_private_dir(), "orco.sock")
+
+
+def _check_peer(sock):
+    """
+    Checks that the other side of a connected Unix socket runs under the same user;
+    messages are pickled, so nobody else may be trusted
+    """
+    if not hasattr(socket, "SO_PEERCRED"):
+        return
+    size = struct.calcsize("3i")
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, size)
+    _, uid, _ = struct.unpack("3i", creds)
+    if uid != os.getuid():
+        raise Exception("Peer of the socket runs under another user ({})".format(uid))
+
+
+def _serialize_plan_nodes(nodes):
+    nodes = list(nodes)
+    indices = {pn: i for i, pn in enumerate(nodes)}
+    return [
+        (
+            pn.builder_name,
+            pn.key,
+            pn.config,
+            pn.job_setup,
+            [indices[inp] for inp in pn.inputs],
+            pn.existing_dep_ids,
+            pn.job_id,
+        )
+        for pn in nodes
+    ]
+
+
+def _deserialize_plan_nodes(data):
+    nodes = []
+    for builder_name, key, config, job_setup, _, existing_dep_ids, job_id in data:
+        pn = PlanNode(builder_name, key, config, job_setup, [], existing_dep_ids)
+        pn.job_id = job_id
+        nodes.append(pn)
+    for pn, (_, _, _, _, inputs, _, _) in zip(nodes, data):
+        pn.inputs = [nodes[i] for i in inputs]
+    return nodes
+
+
+class _RequestRuntime:
+    """The part of Runtime that runners need, for jobs submitted by a client"""
+
+    def __init__(self, db_url, builders):
+        self.db = open_database(db_url)
+        self.builders = builders
+
+    def get_builder(self, builder_name):
+        return self.builders[builder_name]
+
+
+class _RequestPlan:
+    def __init__(self, nodes, continue_on_error, leaf_keys):
+        self.nodes = nodes
+        self.continue_on_error = continue_on_error
+        self.error_keys = set() if continue_on_error else None
+        self.leaf_keys = leaf_keys
+        self.ephemeral_values = {}
+
+
+class Daemon:
+    """
+    Long-running executor that computes plans submitted by client runtimes.
+
+    Daemon listens on a Unix socket and keeps its runners (and their pools of
+    processes) alive between computations, so clients do not pay for starting
+    processes and importing libraries. Plans from more clients are computed
+    concurrently and share the runners.
+
+    It is usually started by `python3 -m orco daemon`; clients connect by
+    `Runtime(db_path, daemon=True)`.
+    """
+
+    def __init__(self, socket_path=None, runners=None, n_processes=None):
+        self.socket_path = socket_path or default_socket_path()
+        self.executor = Executor(None, runners, name="daemon", n_processes=n_processes)
+        self.server = None
+
+    def start(self):
+        self._remove_stale_socket()
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)
+        try:
+            # Clients send pickled data, so only the owner may connect
+            server.bind(self.socket_path)
+        finally:
+            os.umask(old_umask)
+        server.listen()
+        self.executor.start()
+        self.server = server
+        logger.info("Daemon listens on %s", self.socket_path)
+
+    def _remove_stale_socket(self):
+        if not os.path.exists(self.socket_path):
+            return
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            os.unlink(self.socket_path)
+            return
+        finally:
+            sock.close()
+        raise Exception("Daemon is already running on {}".format(self.socket_path))
+
+    def stop(self):
+        server = self.server
+        if server is None:
+            return
+        self.server = None
+        try:
+            # Wakes up accept() in serve_forever
+            server.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        server.close()
+        os.unlink(self.socket_path)
+        self.executor.stop()
+
+    def serve_forever(self):
+        server = self.server
+        while True:
+            try:
+                sock, _ = server.accept()
+            except OSError:
+                # Server socket was closed by stop()
+                return
+            thread = threading.Thread(target=self._handle_client, args=(sock,))
+            thread.daemon = True
+            thread.start()
+
+    def _handle_client(self, sock):
+        with sock:
+            try:
+                _check_peer(sock)
+            except Exception as e:
+                logger.error("Rejected client: %s", e)
+                return
+            try:
+                request = _recv_message(sock)
+            except Exception as e:
+                logger.error("Invalid request: %s", e)
+                try:
+                    _send_message(sock, ("error", "Invalid request: {}".format(e)))
+                except OSError:
+                    pass
+                return
+            if request is None:
+                # Ping from a client checking that the daemon is running
+                _send_message(sock, ("ok", None))
+                return
+            reply = self._compute(sock, request)
+            try:
+                _send_message(sock, reply)
+            except OSError:
+                logger.error("Client disconnected before the computation finished")
+
+    def _compute(self, sock, request):
+        try:
+            runtime = _RequestRuntime(request["db"], request["builders"])
+        except Exception:
+            return ("error", traceback.format_exc())
+        plan = _RequestPlan(
+            _deserialize_plan_nodes(request["nodes"]),
+            request["continue_on_error"],
+            request["leaf_keys"],
+        )
+
+        def on_progress():
+            try:
+                _send_message(sock, ("progress", None))
+            except OSError:
+                pass
+
+        logger.debug("Computing %s jobs of %s", len(plan.nodes), request["db"])
+        try:
+            self.executor.run(plan, False, runtime=runtime, on_progress=on_progress)
+        except JobFailedException as e:
+            return ("failed", str(e))
+        except Exception:
+            return ("error", traceback.format_exc())
+        finally:
+            runtime.db.stop()
+        return ("finished", (plan.error_keys, plan.ephemeral_values))
+
+
+def run_daemon(socket_path=None, n_processes=None):
+    daemon = Daemon(socket_path, n_processes=n_processes)
+    daemon.start()
+    print("Daemon listens on {}".format(daemon.socket_path))
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.stop()
+
+
+class DaemonExecutor:
+    """
+    Client side of a daemon; it is used by Runtime instead of Executor
+    when the runtime is connected to a daemon.
+    """
+
+    def __init__(self, runtime, socket_path):
+        self.runtime = runtime
+        self.socket_path = socket_path
+        self.id = None
+        self.stats = {}
+
+    def get_stats(self):
+        return self.stats
+
+    def start(self):
+        status, _ = self._request(None)
+        assert status == "ok"
+
+    def stop(self):
+        self.runtime = None
+
+    def _connect(self):
+        # Replies are unpickled, so the socket has to belong to the current user
+        try:
+            owner = os.stat(self.socket_path).st_uid
+        except OSError:
+            owner = None
+        if owner is not None and owner != os.getuid():
+            raise Exception(
+                "Socket {} belongs to another user ({})".format(self.socket_path, owner)
+            )
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.socket_path)
+        except OSError as e:
+            sock.close()
+            raise Exception(
+                "Cannot connect to daemon at {} ({}); is the daemon running?".format(
+                    self.socket_path, e
+                )
+            )
+        try:
+            _check_peer(sock)
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    def _request(self, request):
+        with self._connect() as sock:
+            _send_message(sock, request)
+            return _recv_message(sock)
+
+    def run(self, plan, verbose):
+        runtime = self.runtime
+        builder_names = set(pn.builder_name for pn in plan.nodes)
+        request = {
+            "db": runtime.db.url,
+            "builders": {name: runtime.get_builder(name) for name in builder_names},
+            "nodes": _serialize_plan_nodes(plan.nodes),
+            "continue_on_error": plan.continue_on_error,
+            "leaf_keys": plan.leaf_keys,
+        }
+        if verbose:
+            progressbar = tqdm.tqdm(total=len(plan.nodes))
+        else:
+            progressbar = None
+        try:
+            with self._connect() as sock:
+                _send_message(sock, request)
+                while True:
+                    status, data = _recv_message(sock)
+                    if status != "progress":
+                        break
+                    if progressbar:
+                        progressbar.update()
+        finally:
+            if progressbar:
+                progressbar.close()
+        if status == "finished":
+            error_keys, ephemeral_values = data
+            if error_keys:
+                plan.error_keys.update(error_keys)
+            plan.ephemeral_values.update(ephemeral_values)
+        elif status == "failed":
+            raise JobFailedException(data)
+        else:
+            raise Exception("Computation in daemon failed:\n{}".format(data))
@@ -1,10 +1,30 @@
 import base64
+import collections
+import contextlib
+import functools
+import hashlib
+import io
+import itertools
+import logging
+import sqlite3
+import tempfile
+import threading
+import time
 
 import sqlalchemy as sa
+from sqlalchemy.pool import StaticPool
 
 from orco import consts
+from orco.internals.compression import (
+    compress_blob,
+    compress_stream,
+    decompress_blob,
+    open_decompressed,
+)
 from orco.job import JobMetadata, Job, JobState, ACTIVE_STATES
 
+logger = logging.getLogger(__name__)
+
 
 def _set_sqlite_pragma(dbapi_connection, _connection_record):
     cursor = dbapi_connection.cursor()
@@ -12,6 +32,86 @@ def _set_sqlite_pragma(dbapi_connection, _connection_record):
     cursor.close()
 
 
+def _execute_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    for pragma in pragmas:
+        cursor.execute("PRAGMA " + pragma)
+    cursor.close()
+
+
+# Pragmas executed on each connection of a SQLite database; profile name -> pragmas.
+# The journal mode is stored in the database file, so WAL remains
+# even when the profile is switched back to "default".
+SQLITE_PROFILES = {
+    "default": (),
+    "fast": (
+        "journal_mode=WAL",
+        "synchronous=NORMAL",
+        "mmap_size=268435456",
+        "cache_size=-65536",
+        "busy_timeout=30000",
+    ),
+}
+
+# Writes into SQLite that fail because the database is locked are repeated;
+# the busy timeout does not help e.g. when a read transaction is upgraded
+LOCK_RETRIES = 10
+LOCK_RETRY_DELAY = 0.05
+
+
+def _retry_when_locked(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        local = self._local
+        if getattr(local, "retrying", False) or not self.is_sqlite or self.is_memory:
+            return method(self, *args, **kwargs)
+        attempt = 0
+        local.retrying = True
+        try:
+            while True:
+                try:
+                    return method(self, *args, **kwargs)
+                except (sa.exc.OperationalError, sqlite3.OperationalError) as e:
+                    if (
+                        attempt >= LOCK_RETRIES
+                        or "is locked" not in str(e)
+                        or self.conn.in_transaction()
+                    ):
+                        raise
+                attempt += 1
+                time.sleep(LOCK_RETRY_DELAY * attempt)
+        finally:
+            local.retrying = False
+
+    return wrapper
+
+
+def _removes_orphan_bodies(method):
+    """
+    Bodies put into the blob store by an operation that fails are removed again,
+    as the transaction that references them is rolled back
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        local = self._local
+        if getattr(local, "stored_bodies", None) is not None:
+            return method(self, *args, **kwargs)
+        local.stored_bodies = []
+        try:
+            return method(self, *args, **kwargs)
+        except BaseException:
+            try:
+                self._remove_store_bodies(local.stored_bodies)
+            except Exception:
+                logger.exception("Removing bodies of a failed operation failed")
+            raise
+        finally:
+            local.stored_bodies = None
+
+    return wrapper
+
+
 STATE_COUNTERS = {
     JobState.FINISHED: "n_finished",
     JobState.ERROR: "n_failed",
@@ -23,17 +123,216 @@ STATE_COUNTERS = {
 }
 
 
+# Smaller blob bodies are stored directly in blobs and they are not deduplicated
+DEDUP_THRESHOLD = 256
+
+# Larger blob bodies are split into chunks of this size
+CHUNK_SIZE = 4 * 1024 * 1024
+
+# Pickled results smaller than this are also stored in the jobs table,
+# so they are read together with jobs without querying blobs
+INLINE_VALUE_SIZE = 256
+
+# Maximal number of keys in a single "IN" query
+QUERY_BATCH_SIZE = 500
+
+# Indexes of older versions that are covered by newer ones; table -> names
+OBSOLETE_INDEXES = {"jobs": ("key_idx", "builder_idx")}
+
+
+# A finished dependency of a job; value is the inline value (if any),
+# value_hash, value_mime and value_size describe the value blob
+DepJob = collections.namedtuple(
+    "DepJob", ["job_id", "value", "value_hash", "value_mime", "value_size"]
+)
+
+
+# URLs of in-memory SQLite databases
+MEMORY_URLS = ("sqlite://", "sqlite:///:memory:")
+
+# Each Database created by a memory url gets a new in-memory database that
+# is registered under a private url "<memory url>#<id>"; other Database objects
+# of the process (e.g. in runner threads) open it by this url.
+# private url -> (engine, lock)
+_memory_engines = {}
+_memory_engines_lock = threading.Lock()
+_memory_ids = itertools.count()
+
+
+def is_memory_url(url):
+    return url.split("#", 1)[0] in MEMORY_URLS
+
+
+def _create_memory_engine(url):
+    # All threads share a single connection, the database lives
+    # as long as the connection
+    engine = sa.create_engine(
+        url,
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    sa.event.listen(engine, "connect", _set_sqlite_pragma)
+    item = (engine, threading.RLock())
+    with _memory_engines_lock:
+        private_url = "{}#{}".format(url, next(_memory_ids))
+        _memory_engines[private_url] = item
+    return private_url, item
+
+
+def _get_memory_engine(url):
+    with _memory_engines_lock:
+        item = _memory_engines.get(url)
+    if item is None:
+        raise Exception("In-memory database {!r} does not exist".format(url))
+    return item
+
+
+def _dispose_memory_engine(url):
+    with _memory_engines_lock:
+        engine, _ = _memory_engines.pop(url)
+    engine.dispose()
+
+
+class _BufferedResult:
+    """Result of a query with all rows fetched, so the cursor is not used later"""
+
+    def __init__(self, result):
+        self.result = result
+        self.rows = result.fetchall() if result.returns_rows else []
+        self.position = 0
+
+    def __iter__(self):
+        rows = self.rows[self.position :]
+        self.position = len(self.rows)
+        return iter(rows)
+
+    def fetchone(self):
+        if self.position >= len(self.rows):
+            return None
+        self.position += 1
+        return self.rows[self.position - 1]
+
+    def fetchall(self):
+        return list(self)
+
+    def first(self):
+        return self.rows[0] if self.rows else None
+
+    def scalar(self):
+        row = self.first()
+        return row[0] if row is not None else None
+
+    def __getattr__(self, name):
+        return getattr(self.result, name)
+
+
+class _LockedTransaction:
+    def __init__(self, transaction, lock):
+        self.transaction = transaction
+        self.lock = lock
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            return self.transaction.__exit__(exc_type, exc_val, exc_tb)
+        finally:
+            self.lock.release()
+
+    def commit(self):
+        self.transaction.commit()
+
+    def rollback(self):
+        self.transaction.rollback()
+
+
+class _LockedConnection:
+    """
+    Connection to an in-memory database that is shared by all threads
+    of the process; statements and whole transactions are serialized by a lock.
+    """
+
+    def __init__(self, conn, lock):
+        self.conn = conn
+        self.lock = lock
+
+    def execute(self, *args, **kwargs):
+        with self.lock:
+            return _BufferedResult(self.conn.execute(*args, **kwargs))
+
+    def begin(self):
+        self.lock.acquire()
+        try:
+            return _LockedTransaction(self.conn.begin(), self.lock)
+        except BaseException:
+            self.lock.release()
+            raise
+
+    def begin_nested(self):
+        self.lock.acquire()
+        try:
+            return _LockedTransaction(self.conn.begin_nested(), self.lock)
+        except BaseException:
+            self.lock.release()
+            raise
+
+
+class _NotLoaded:
+    pass
+
+
+_NOT_LOADED = _NotLoaded()
+
+
 class Database:
+    """
+    Access to the database of a runtime.
+
+    In-memory SQLite databases ("sqlite://") are supported only within a single
+    process. Each Database created by such url has its own database that is
+    dropped when the Database is stopped; `url` is then a private url by which
+    other Database objects of the process share its connection.
+
+    Connections to a SQLite file are configured by the SQLite profile stored
+    in the database (see `set_sqlite_profile`).
+
+    Database may be used from more threads; each thread gets its own connection
+    from the engine's pool when it accesses `conn` for the first time,
+    so transactions (`with db.conn.begin()`) are scoped to the thread.
+    """
+
     def __init__(self, url):
-        engine = sa.create_engine(url)
-        if "sqlite" in engine.dialect.name:
-            if url == "sqlite://":
-                raise Exception("In memory database is not supported.")
-            sa.event.listen(engine, "connect", _set_sqlite_pragma)
+        self.sqlite_profile = "default"
+        self._sqlite_pragmas = ()
+        self._local = threading.local()
+        # Connections of all threads, they are closed by stop()
+        self._conns = []
+        self._conns_lock = threading.Lock()
+        self._owns_memory_engine = False
+        if url in MEMORY_URLS:
+            url, (engine, lock) = _create_memory_engine(url)
+            self._owns_memory_engine = True
+            self.is_sqlite = True
+        elif is_memory_url(url):
+            engine, lock = _get_memory_engine(url)
             self.is_sqlite = True
         else:
-            self.is_sqlite = False
+            lock = None
+            if sa.engine.url.make_url(url).get_backend_name() == "sqlite":
+                # A connection is used only by its thread, but it may be
+                # released by another one when the thread ends
+                engine = sa.create_engine(
+                    url, connect_args={"check_same_thread": False}
+                )
+                sa.event.listen(engine, "connect", _set_sqlite_pragma)
+                sa.event.listen(engine, "connect", self._set_profile_pragmas)
+                self.is_sqlite = True
+            else:
+                engine = sa.create_engine(url)
+                self.is_sqlite = False
         self.url = url
+        self.is_memory = lock is not None
 
         metadata = sa.MetaData()
         self.jobs = sa.Table(
@@ -53,8 +352,13 @@ class Database:
             ),
             sa.Column("finished_date", sa.DateTime(timezone=True), nullable=True),
             sa.Column("computation_time", sa.Integer(), nullable=True),
-            sa.Index("builder_idx", "builder"),
-            sa.Index("key_idx", "key"),
+            # List of failed attempts when job was retried
+            sa.Column("attempts", sa.PickleType, nullable=True),
+            # Pickled result if it is smaller than INLINE_VALUE_SIZE
+            sa.Column("value", sa.LargeBinary, nullable=True),
+            # Lookups of active jobs by key and summaries of builders by state
+            sa.Index("key_state_idx", "key", "state"),
+            sa.Index("builder_state_idx", "builder", "state"),
             sa.Index("finished_date_idx", "finished_date"),
         )
 
@@ -77,6 +381,9 @@ class Database:
             sa.Column(
                 "target_id", sa.Integer(), sa.ForeignKey("jobs.id", ondelete="cascade")
             ),
+            # Traversing the graph of jobs in both directions
+            sa.Index("job_deps_source_idx", "source_id"),
+            sa.Index("job_deps_target_idx", "target_id"),
         )
 
         self.blobs = sa.Table(
@@ -84,39 +391,284 @@ class Database:
             metadata,
             sa.Column("job_id", sa.ForeignKey("jobs.id", ondelete="cascade")),
             sa.Column("name", sa.String, nullable=True),
+            # Empty when the body is stored in blob_bodies
             sa.Column("data", sa.LargeBinary, nullable=False),
             sa.Column("mime", sa.String(255), nullable=False),
             sa.Column("repr", sa.String(85), nullable=True),
+            # Hash of the body in blob_bodies
+            sa.Column("hash", sa.String(64), nullable=True),
+            # Size of the uncompressed body
+            sa.Column("size", sa.Integer(), nullable=True),
+            # Compression codec of the body, None = uncompressed
+            sa.Column("codec", sa.String(16), nullable=True),
             # !!! (job_id, name) CANNOT be primary_key because postgresql do not allow None in primary key
             # !!! but unqiue is ok
             sa.UniqueConstraint("job_id", "name"),
         )
 
+        # Deduplicated bodies of blobs shared by all blobs with the same content
+        self.blob_bodies = sa.Table(
+            "blob_bodies",
+            metadata,
+            sa.Column("hash", sa.String(64), primary_key=True),
+            # Size of the stored (i.e. compressed) body
+            sa.Column("size", sa.Integer(), nullable=False),
+            # Number of blobs that use the body
+            sa.Column("refs", sa.Integer(), nullable=False),
+            # None when the body is in the blob store or in chunks
+            sa.Column("data", sa.LargeBinary, nullable=True),
+            # Number of chunks in blob_chunks, None when the body is not chunked
+            sa.Column("n_chunks", sa.Integer(), nullable=True),
+        )
+
+        self.blob_chunks = sa.Table(
+            "blob_chunks",
+            metadata,
+            sa.Column("hash", sa.String(64), primary_key=True),
+            sa.Column("index", sa.Integer(), primary_key=True, autoincrement=False),
+            sa.Column("data", sa.LargeBinary, nullable=False),
+        )
+
+        self.settings = sa.Table(
+            "settings",
+            metadata,
+            sa.Column("name", sa.String(80), primary_key=True),
+            sa.Column("value", sa.PickleType),
+        )
+
         self.metadata = metadata
         self.engine = engine
-        self.conn = engine.connect()
+        if lock is not None:
+            self._shared_conn = _LockedConnection(engine.connect(), lock)
+        else:
+            self._shared_conn = None
+        self._lock = lock
+        self._stopped = False
+        self._blob_store = _NOT_LOADED
+        if self.is_sqlite and not self.is_memory:
+            self._load_sqlite_profile()
+
+    @property
+    def conn(self):
+        """Connection of the current thread"""
+        if self._stopped:
+            raise Exception("Database was already stopped")
+        if self._shared_conn is not None:
+            return self._shared_conn
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self.engine.connect()
+            self._local.conn = conn
+            with self._conns_lock:
+                self._conns.append(conn)
+        return conn
 
     def stop(self):
-        self.conn = None
+        if self._stopped:
+            return
+        self._stopped = True
+        self._shared_conn = None
+        self._local = threading.local()
+        with self._conns_lock:
+            conns = self._conns
+            self._conns = []
+        for conn in conns:
+            conn.close()
+        if self._owns_memory_engine:
+            # The in-memory database is dropped with its creator
+            _dispose_memory_engine(self.url)
+        elif not self.is_memory:
+            self.engine.dispose()
+
+    def _set_profile_pragmas(self, dbapi_connection, _connection_record):
+        _execute_pragmas(dbapi_connection, self._sqlite_pragmas)
+
+    def _load_sqlite_profile(self):
+        if not self.engine.dialect.has_table(self.conn, "settings"):
+            return
+        profile = self.get_setting("sqlite_profile")
+        if profile is not None:
+            self._use_sqlite_profile(profile)
+
+    def _use_sqlite_profile(self, profile):
+        self.sqlite_profile = profile
+        self._sqlite_pragmas = SQLITE_PROFILES[profile]
+        # The connection of the current thread may be already open
+        _execute_pragmas(self.conn.connection, self._sqlite_pragmas)
+
+    def set_sqlite_profile(self, profile):
+        """
+        Sets pragmas of connections to a SQLite file by a profile name
+        (see SQLITE_PROFILES); "fast" switches the database into WAL mode,
+        so readers do not block writers. The profile is stored in the database,
+        so it is used by all processes that open the database afterwards.
+        """
+        if profile not in SQLITE_PROFILES:
+            raise ValueError(
+                "Invalid SQLite profile {!r}, expected one of {}".format(
+                    profile, ", ".join(SQLITE_PROFILES)
+                )
+            )
+        if not self.is_sqlite or self.is_memory:
+            raise Exception("SQLite profile can be set only for a SQLite file")
+        self.set_setting("sqlite_profile", profile)
+        self._use_sqlite_profile(profile)
 
     def init(self):
-        self.metadata.create_all(self.engine)
+        with self._lock or contextlib.nullcontext():
+            self.metadata.create_all(self.engine)
+            self._upgrade_schema()
+
+    def _upgrade_schema(self):
+        """
+        Adds columns and indexes introduced by newer versions into tables
+        of an existing database and drops indexes replaced by newer ones.
+
+        Only nullable columns without constraints can be added this way.
+        """
+        inspector = sa.inspect(self.engine)
+        for table in self.metadata.sorted_tables:
+            indexes = set(i["name"] for i in inspector.get_indexes(table.name))
+            for name in OBSOLETE_INDEXES.get(table.name, ()):
+                if name in indexes:
+                    self.conn.execute("DROP INDEX {}".format(name))
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(self.engine)
+            existing = set(c["name"] for c in inspector.get_columns(table.name))
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                assert column.nullable
+                self.conn.execute(
+                    "ALTER TABLE {} ADD COLUMN {} {}".format(
+                        table.name,
+                        column.name,
+                        column.type.compile(dialect=self.engine.dialect),
+                    )
+                )
+
+    def get_setting(self, name, default=None):
+        c = self.settings.c
+        r = self.conn.execute(
+            sa.select([c.value]).where(c.name == name)
+        ).fetchone()
+        if r is None:
+            return default
+        return r.value
+
+    @_retry_when_locked
+    def set_setting(self, name, value):
+        c = self.settings.c
+        with self.conn.begin():
+            self.conn.execute(self.settings.delete().where(c.name == name))
+            self.conn.execute(self.settings.insert().values(name=name, value=value))
+
+    @property
+    def blob_store(self):
+        if self._blob_store is _NOT_LOADED:
+            self._blob_store = self.get_setting("blob_store")
+        return self._blob_store
+
+    def set_blob_store(self, blob_store):
+        self.set_setting("blob_store", blob_store)
+        self._blob_store = blob_store
+
+    def _get_blob_store(self):
+        blob_store = self.blob_store
+        if blob_store is None:
+            raise Exception(
+                "Blob is stored in a blob store, but no blob store is configured"
+            )
+        return blob_store
 
     def read_jobs(self, key, builder=None):
         c = self.jobs.c
         result = []
         for r in self.conn.execute(
-            sa.select([c.id, c.builder, c.config, c.state]).where(c.key == key)
+            sa.select([c.id, c.builder, c.config, c.state, c.value]).where(
+                c.key == key
+            )
         ):
             if builder is None:
                 builder = r.builder
             else:
                 assert builder == r.builder
             job = Job(builder, key, r.config)
-            job.set_job_id(r.id, self, r.state)
+            job.set_job_id(r.id, self, r.state, r.value)
             result.append(job)
         return result
 
+    def read_finished(self, keys):
+        """
+        Returns a dictionary that maps keys of finished jobs to pairs
+        (job_id, pickled value or None when the value is not stored inline).
+        """
+        c = self.jobs.c
+        keys = list(keys)
+        result = {}
+        for i in range(0, len(keys), QUERY_BATCH_SIZE):
+            query = sa.select([c.key, c.id, c.value]).where(
+                sa.and_(
+                    c.key.in_(keys[i : i + QUERY_BATCH_SIZE]),
+                    c.state == JobState.FINISHED,
+                )
+            )
+            for r in self.conn.execute(query):
+                result[r.key] = (r.id, r.value)
+        return result
+
+    def read_inline_values(self, job_ids):
+        """Returns a dictionary that maps job ids to values stored inline"""
+        c = self.jobs.c
+        job_ids = list(job_ids)
+        result = {}
+        for i in range(0, len(job_ids), QUERY_BATCH_SIZE):
+            query = sa.select([c.id, c.value]).where(
+                sa.and_(
+                    c.id.in_(job_ids[i : i + QUERY_BATCH_SIZE]), c.value.isnot(None)
+                )
+            )
+            for r in self.conn.execute(query):
+                result[r.id] = r.value
+        return result
+
+    def _blob_rows(self, job_ids, name):
+        """Reads rows of blobs with the given name of many jobs in batches"""
+        c = self.blobs.c
+        job_ids = list(job_ids)
+        name_cond = c.name.is_(None) if name is None else c.name == name
+        for i in range(0, len(job_ids), QUERY_BATCH_SIZE):
+            query = (
+                sa.select(
+                    [
+                        c.job_id,
+                        c.data,
+                        c.mime,
+                        c.hash,
+                        c.codec,
+                        self.blob_bodies.c.data.label("body"),
+                        self.blob_bodies.c.n_chunks,
+                    ]
+                )
+                .select_from(self._blobs_with_bodies())
+                .where(
+                    sa.and_(c.job_id.in_(job_ids[i : i + QUERY_BATCH_SIZE]), name_cond)
+                )
+            )
+            yield from self.conn.execute(query).fetchall()
+
+    def read_blobs(self, job_ids, name=None):
+        """
+        Returns a dictionary that maps job ids to pairs (data, mime) of their
+        blobs with the given name; the default name None reads values of jobs.
+        """
+        result = {}
+        for r in self._blob_rows(job_ids, name):
+            data = self._read_body(r.data, r.hash, r.body, r.n_chunks)
+            result[r.job_id] = (decompress_blob(data, r.codec), r.mime)
+        return result
+
     def get_active_state(self, key):
         js = self.jobs
         r = self.conn.execute(
@@ -150,17 +702,100 @@ class Database:
         else:
             return r
 
+    def _release_bodies(self, cond):
+        """
+        Decrements reference counters of bodies used by blobs that satisfy `cond`
+        and removes bodies that are not used anymore. It has to be called in a
+        transaction before the blobs are removed. Returns hashes of bodies that
+        have to be removed from the blob store after the transaction is committed.
+        """
+        c = self.blobs.c
+        counts = self.conn.execute(
+            sa.select([c.hash, sa.func.count().label("count")])
+            .where(sa.and_(cond, c.hash.isnot(None)))
+            .group_by(c.hash)
+        ).fetchall()
+        if not counts:
+            return ()
+        b = self.blob_bodies.c
+        self.conn.execute(
+            self.blob_bodies.update()
+            .where(b.hash == sa.bindparam("h"))
+            .values(refs=b.refs - sa.bindparam("n")),
+            [{"h": r.hash, "n": r.count} for r in counts],
+        )
+        unused = sa.and_(b.hash.in_([r.hash for r in counts]), b.refs <= 0)
+        in_store = []
+        chunked = []
+        for r in self.conn.execute(
+            sa.select([b.hash, b.n_chunks]).where(sa.and_(unused, b.data.is_(None)))
+        ):
+            if r.n_chunks is None:
+                in_store.append(r.hash)
+            else:
+                chunked.append(r.hash)
+        if chunked:
+            self.conn.execute(
+                self.blob_chunks.delete().where(self.blob_chunks.c.hash.in_(chunked))
+            )
+        self.conn.execute(self.blob_bodies.delete().where(unused))
+        return in_store
+
+    def _remove_store_bodies(self, hashes):
+        """
+        Removes bodies from the blob store; bodies that were meanwhile
+        inserted again by another process are kept
+        """
+        if not hashes:
+            return
+        hashes = list(hashes)
+        b = self.blob_bodies.c
+        used = set()
+        for i in range(0, len(hashes), QUERY_BATCH_SIZE):
+            used.update(
+                r.hash
+                for r in self.conn.execute(
+                    sa.select([b.hash]).where(
+                        b.hash.in_(hashes[i : i + QUERY_BATCH_SIZE])
+                    )
+                )
+            )
+        blob_store = self._get_blob_store()
+        for blob_hash in hashes:
+            if blob_hash not in used:
+                blob_store.remove(blob_hash)
+
+    def _put_store_body(self, blob_store, blob_hash, body):
+        blob_store.put_file(blob_hash, body)
+        stored = getattr(self._local, "stored_bodies", None)
+        if stored is not None:
+            stored.append(blob_hash)
+
     def _remove_jobs(self, cond):
+        """Removes jobs and returns hashes of bodies to remove from the blob store"""
+        job_ids = sa.select([self.jobs.c.id]).where(cond)
+        hashes = self._release_bodies(self.blobs.c.job_id.in_(job_ids))
         self.conn.execute(sa.delete(self.jobs).where(cond))
+        return hashes
 
+    def _remove_blobs(self, job_ids):
+        """Removes blobs of jobs and returns hashes of bodies to remove from the blob store"""
+        cond = self.blobs.c.job_id.in_(job_ids)
+        hashes = self._release_bodies(cond)
+        self.conn.execute(self.blobs.delete().where(cond))
+        return hashes
+
+    @_retry_when_locked
     def drop_unfinished_jobs(self):
         js = self.jobs
         with self.conn.begin():
             cond = sa.or_(
                 js.c.state == JobState.RUNNING, js.c.state == JobState.ANNOUNCED
             )
-            self._remove_jobs(cond)
+            hashes = self._remove_jobs(cond)
+        self._remove_store_bodies(hashes)
 
+    @_retry_when_locked
     def set_running(self, job_id):
         assert job_id is not None
         c = self.jobs.c
@@ -172,30 +807,189 @@ class Database:
             if r.rowcount != 1:
                 raise Exception("Setting a job into a running state failed")
 
-        job = self.conn.execute(
-            sa.select([c.config, c.job_setup]).where(c.id == job_id)
-        ).fetchone()
+            job = self.conn.execute(
+                sa.select([c.config, c.job_setup, c.attempts]).where(c.id == job_id)
+            ).fetchone()
 
-        d = self.job_deps.c
-        query = sa.select([c.id, c.key]).where(
-            c.id.in_(sa.select([d.source_id]).where(d.target_id == job_id))
-        )
+            d = self.job_deps.c
+            b = self.blobs.c
+            query = (
+                sa.select([c.id, c.key, c.value, b.hash, b.mime, b.size])
+                .select_from(
+                    self.jobs.outerjoin(
+                        self.blobs, sa.and_(b.job_id == c.id, b.name.is_(None))
+                    )
+                )
+                .where(
+                    c.id.in_(sa.select([d.source_id]).where(d.target_id == job_id))
+                )
+            )
 
-        keys_to_job_ids = {r.key: r.id for r in self.conn.execute(query)}
+            keys_to_deps = {
+                r.key: DepJob(r.id, r.value, r.hash, r.mime, r.size)
+                for r in self.conn.execute(query)
+            }
 
-        return job.job_setup, job.config, keys_to_job_ids
+        n_attempts = len(job.attempts) if job.attempts else 0
+        return job.job_setup, job.config, keys_to_deps, n_attempts
 
-    def insert_blob(self, job_id, name, value, mime, repr_value):
+    @_retry_when_locked
+    @_removes_orphan_bodies
+    def insert_blob(self, job_id, name, value, mime, repr_value, compression=None):
+        """
+        Inserts a blob; `compression` is a pair (codec, threshold) or None,
+        see `JobSetup.get_compression`. Returns the hash of the blob's body
+        or None for small blobs stored without a body.
+        """
+        size = len(value)
+        value, codec = compress_blob(value, compression)
+        if len(value) >= DEDUP_THRESHOLD:
+            blob_hash = hashlib.sha256(value).hexdigest()
+            self._insert_blob_with_body(
+                job_id,
+                name,
+                io.BytesIO(value),
+                len(value),
+                blob_hash,
+                mime,
+                repr_value,
+                size,
+                codec,
+            )
+            return blob_hash
+        self._insert_blob_row(job_id, name, value, mime, repr_value, None, size, codec)
+        return None
+
+    @_retry_when_locked
+    @_removes_orphan_bodies
+    def insert_blob_from_file(
+        self, job_id, name, fileobj, mime, repr_value, compression=None
+    ):
+        """
+        Inserts a blob with the content of a seekable binary file object.
+        Large files are never loaded into memory as a whole.
+        Returns the hash of the blob's body as `insert_blob`.
+        """
+        size = fileobj.seek(0, io.SEEK_END)
+        fileobj.seek(0)
+        if size < CHUNK_SIZE:
+            return self.insert_blob(
+                job_id, name, fileobj.read(), mime, repr_value, compression
+            )
+        with tempfile.TemporaryFile() as compressed:
+            codec = compress_stream(fileobj, compressed, compression, size)
+            if codec is not None:
+                body = compressed
+                body_size = compressed.tell()
+            else:
+                body = fileobj
+                body_size = size
+            body.seek(0)
+            blob_hash = _hash_file(body)
+            body.seek(0)
+            self._insert_blob_with_body(
+                job_id,
+                name,
+                body,
+                body_size,
+                blob_hash,
+                mime,
+                repr_value,
+                size,
+                codec,
+            )
+            return blob_hash
+
+    def _insert_blob_with_body(
+        self, job_id, name, body, body_size, blob_hash, mime, repr_value, size, codec
+    ):
+        with self.conn.begin():
+            self._insert_blob_row(
+                job_id, name, b"", mime, repr_value, blob_hash, size, codec
+            )
+            self._add_body_ref(blob_hash, body, body_size)
+
+    def _insert_blob_row(
+        self, job_id, name, data, mime, repr_value, blob_hash, size, codec
+    ):
         try:
             self.conn.execute(
                 sa.insert(self.blobs).values(
-                    job_id=job_id, name=name, data=value, mime=mime, repr=repr_value
+                    job_id=job_id,
+                    name=name,
+                    data=data,
+                    mime=mime,
+                    repr=repr_value,
+                    hash=blob_hash,
+                    size=size,
+                    codec=codec,
                 )
             )
         except sa.exc.IntegrityError:
             raise Exception("Blob '{}' already exists".format(name))
 
-    def set_finished(self, job_id, value, repr_value, computation_time, output=None):
+    def _add_body_ref(self, blob_hash, body, body_size):
+        b = self.blob_bodies.c
+        inc_refs = (
+            self.blob_bodies.update()
+            .where(b.hash == blob_hash)
+            .values(refs=b.refs + 1)
+        )
+        if self.conn.execute(inc_refs).rowcount == 1:
+            return
+        blob_store = self.blob_store
+        data = None
+        n_chunks = None
+        try:
+            # Savepoint, as a failed statement aborts the whole transaction
+            # e.g. in PostgreSQL
+            with self.conn.begin_nested():
+                if blob_store is not None and body_size >= blob_store.threshold:
+                    self._put_store_body(blob_store, blob_hash, body)
+                elif body_size > CHUNK_SIZE:
+                    n_chunks = 0
+                    while True:
+                        chunk = body.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        self.conn.execute(
+                            self.blob_chunks.insert().values(
+                                hash=blob_hash, index=n_chunks, data=chunk
+                            )
+                        )
+                        n_chunks += 1
+                else:
+                    data = body.read()
+                self.conn.execute(
+                    self.blob_bodies.insert().values(
+                        hash=blob_hash,
+                        size=body_size,
+                        refs=1,
+                        data=data,
+                        n_chunks=n_chunks,
+                    )
+                )
+        except sa.exc.IntegrityError:
+            # The same body was inserted concurrently
+            self.conn.execute(inc_refs)
+
+    @_retry_when_locked
+    @_removes_orphan_bodies
+    def set_finished(
+        self,
+        job_id,
+        value,
+        repr_value,
+        computation_time,
+        output=None,
+        compression=None,
+        mime=consts.MIME_PICKLE,
+    ):
+        """
+        Sets a job as finished; `value` is bytes or a binary file with
+        the serialized value (or None). Returns the hash of the value's body
+        or None.
+        """
         assert job_id is not None
         c = self.jobs.c
         with self.conn.begin():
@@ -207,16 +1001,63 @@ class Database:
                     state=JobState.FINISHED,
                     computation_time=computation_time,
                     finished_date=sa.func.now(),
+                    value=_inline_value(value, mime),
                 )
             )
             if r.rowcount != 1:
                 raise Exception("Setting a job into finished state failed")
-            if value is not None:
-                self.insert_blob(job_id, None, value, consts.MIME_PICKLE, repr_value)
+            if isinstance(value, bytes):
+                value_hash = self.insert_blob(
+                    job_id, None, value, mime, repr_value, compression
+                )
+            elif value is not None:
+                value_hash = self.insert_blob_from_file(
+                    job_id, None, value, mime, repr_value, compression
+                )
+            else:
+                value_hash = None
+            if output:
+                self.insert_blob(
+                    job_id, "!output", output, consts.MIME_TEXT, None, compression
+                )
+        return value_hash
+
+    @_retry_when_locked
+    @_removes_orphan_bodies
+    def set_ephemeral_finished(
+        self, job_id, computation_time, output=None, compression=None
+    ):
+        """
+        Sets a job of an ephemeral builder as computed. Its value is not stored
+        and the job is archived in freed state, so it is computed again
+        when it is needed by another computation.
+        """
+        assert job_id is not None
+        c = self.jobs.c
+        with self.conn.begin():
+            cond = sa.and_(c.id == job_id, c.state == JobState.RUNNING)
+            r = self.conn.execute(
+                sa.update(self.jobs)
+                .where(cond)
+                .values(
+                    state=JobState.A_FREED,
+                    computation_time=computation_time,
+                    finished_date=sa.func.now(),
+                )
+            )
+            if r.rowcount != 1:
+                raise Exception("Setting a job into freed state failed")
+            self.conn.execute(
+                self.announcements.delete().where(self.announcements.c.job_id == job_id)
+            )
             if output:
-                self.insert_blob(job_id, "!output", output, consts.MIME_TEXT, None)
+                self.insert_blob(
+                    job_id, "!output", output, consts.MIME_TEXT, None, compression
+                )
 
-    def set_error(self, job_id, message, computation_time, output):
+    @_retry_when_locked
+    @_removes_orphan_bodies
+    def set_error(self, job_id, message, computation_time, output, compression=None):
         assert job_id is not None
         c = self.jobs.c
         with self.conn.begin():
@@ -238,28 +1079,131 @@ class Database:
             if r.rowcount != 1:
                 raise Exception("Setting a job into finished state failed")
             if message is not None:
-                self.conn.execute(
-                    sa.insert(self.blobs).values(
-                        job_id=job_id,
-                        name="!message",
-                        data=message.encode(),
-                        mime=consts.MIME_TEXT,
-                    )
+                self.insert_blob(
+                    job_id, "!message", message.encode(), consts.MIME_TEXT, None
                 )
             if output:
-                self.insert_blob(job_id, "!output", output, consts.MIME_TEXT, None)
+                self.insert_blob(
+                    job_id, "!output", output, consts.MIME_TEXT, None, compression
+                )
 
-    def get_blob(self, job_id, name):
+    @_retry_when_locked
+    def set_retry(self, job_id, message, computation_time):
+        """
+        Returns a failed running job back into announced state and records the attempt.
+        Blobs attached during the attempt are removed.
+        """
+        assert job_id is not None
+        c = self.jobs.c
+        with self.conn.begin():
+            attempts = self.conn.execute(
+                sa.select([c.attempts]).where(c.id == job_id)
+            ).scalar()
+            attempts = list(attempts) if attempts else []
+            attempts.append({"computation_time": computation_time, "error": message})
+            cond = sa.and_(c.id == job_id, c.state == JobState.RUNNING)
+            r = self.conn.execute(
+                sa.update(self.jobs)
+                .where(cond)
+                .values(state=JobState.ANNOUNCED, attempts=attempts)
+            )
+            if r.rowcount != 1:
+                raise Exception("Setting a job into announced state failed")
+            hashes = self._remove_blobs([job_id])
+        self._remove_store_bodies(hashes)
+
+    def _blobs_with_bodies(self):
+        return self.blobs.outerjoin(
+            self.blob_bodies, self.blobs.c.hash == self.blob_bodies.c.hash
+        )
+
+    def _read_blob_row(self, job_id, name):
         c = self.blobs.c
-        r = self.conn.execute(
-            sa.select([c.data, c.mime]).where(
-                sa.and_(c.job_id == job_id, c.name == name)
+        return self.conn.execute(
+            sa.select(
+                [
+                    c.data,
+                    c.mime,
+                    c.hash,
+                    c.codec,
+                    self.blob_bodies.c.data.label("body"),
+                    self.blob_bodies.c.n_chunks,
+                ]
             )
+            .select_from(self._blobs_with_bodies())
+            .where(sa.and_(c.job_id == job_id, c.name == name))
         ).fetchone()
+
+    def _read_body(self, data, blob_hash, body, n_chunks):
+        if blob_hash is None:
+            return data
+        if body is not None:
+            return body
+        if n_chunks is not None:
+            return b"".join(self._read_chunk(blob_hash, i) for i in range(n_chunks))
+        return self._get_blob_store().read(blob_hash)
+
+    def _read_chunk(self, blob_hash, index):
+        c = self.blob_chunks.c
+        return self.conn.execute(
+            sa.select([c.data]).where(sa.and_(c.hash == blob_hash, c.index == index))
+        ).scalar()
+
+    def get_blob(self, job_id, name):
+        r = self._read_blob_row(job_id, name)
+        if r is None:
+            return None, None
+        data = self._read_body(r.data, r.hash, r.body, r.n_chunks)
+        return decompress_blob(data, r.codec), r.mime
+
+    def open_blob(self, job_id, name):
+        """
+        Returns a binary file object with the body of a blob and its mime type.
+        Bodies in the blob store are read directly from the store and chunked
+        bodies are read chunk by chunk.
+        """
+        r = self._read_blob_row(job_id, name)
+        if r is None:
+            return None, None
+        if r.hash is None:
+            f = io.BytesIO(r.data)
+        elif r.body is not None:
+            f = io.BytesIO(r.body)
+        elif r.n_chunks is not None:
+            f = io.BufferedReader(_ChunkReader(self, r.hash, r.n_chunks))
+        else:
+            f = self._get_blob_store().open(r.hash)
+        return open_decompressed(f, r.codec), r.mime
+
+    def get_blob_path(self, job_id, name):
+        """
+        Returns a path of a local file with the uncompressed body of a blob
+        (or None if there is no such file) and its mime type.
+        """
+        r = self._read_blob_row(job_id, name)
         if r is None:
             return None, None
-        return r.data, r.mime
+        return self._body_path(r), r.mime
 
+    def get_blob_paths(self, job_ids, name):
+        """Batched variant of `get_blob_path`; returns {job_id: (path, mime)}"""
+        return {
+            r.job_id: (self._body_path(r), r.mime)
+            for r in self._blob_rows(job_ids, name)
+        }
+
+    def _body_path(self, r):
+        if (
+            r.hash is None
+            or r.body is not None
+            or r.n_chunks is not None
+            or r.codec is not None
+        ):
+            return None
+        return self._get_blob_store().get_path(r.hash)
+
+    @_retry_when_locked
+    @_removes_orphan_bodies
     def create_job_with_value(self, builder_name, key, config, value, repr_value):
         conn = self.conn
         with conn.begin() as transaction:
@@ -271,6 +1215,7 @@ class Database:
                     config=config,
                     job_setup=None,
                     finished_date=sa.func.now(),
+                    value=_inline_value(value),
                 )
             )
             job_id = r.inserted_primary_key[0]
@@ -284,6 +1229,7 @@ class Database:
                 self.insert_blob(job_id, None, value, consts.MIME_PICKLE, repr_value)
             return True
 
+    @_retry_when_locked
     def announce_jobs(self, plan):
         """
             Because not all databases support partial indices, we are doing it
@@ -335,7 +1281,13 @@ class Database:
         c = self.jobs.c
         r = self.conn.execute(
             sa.select(
-                [c.created_date, c.finished_date, c.computation_time, c.job_setup]
+                [
+                    c.created_date,
+                    c.finished_date,
+                    c.computation_time,
+                    c.job_setup,
+                    c.attempts,
+                ]
             ).where(c.id == job_id)
         ).fetchone()
         if r is None:
@@ -345,8 +1297,10 @@ class Database:
             finished_date=r.finished_date,
             computation_time=r.computation_time,
             job_setup=r.job_setup,
+            attempts=r.attempts or [],
         )
 
+    @_retry_when_locked
     def unannounce_jobs(self, plan):
         c = self.jobs.c
         ids = [pn.job_id for pn in plan.nodes]
@@ -354,7 +1308,8 @@ class Database:
             cond = sa.and_(
                 c.id.in_(ids), c.state.in_((JobState.RUNNING, JobState.ANNOUNCED))
             )
-            self._remove_jobs(cond)
+            hashes = self._remove_jobs(cond)
+        self._remove_store_bodies(hashes)
 
     def get_run_stats(self, builder_name):
         c = self.jobs.c
@@ -395,6 +1350,8 @@ class Database:
             d = {name: 0 for name in STATE_COUNTERS.values()}
             d["name"] = name
             d["size"] = size
+            d["logical_size"] = 0
+            d["physical_size"] = 0
             return d
 
         result = {
@@ -408,18 +1365,28 @@ class Database:
         for r in self.conn.execute(query):
             result[r.builder][STATE_COUNTERS[r.state]] += r.count
 
+        # Logical size is the size of uncompressed blobs. Physical size is the size
+        # of stored data; a shared body is split evenly among blobs that use it.
+        b = self.blob_bodies.c
+        physical_size = sa.func.length(self.blobs.c.data) + sa.func.coalesce(
+            sa.cast(b.size, sa.Float) / b.refs, 0
+        )
         query = (
             sa.select(
                 [
                     c.builder,
-                    sa.func.sum(sa.func.length(self.blobs.c.data)).label("size"),
+                    sa.func.sum(self._blob_size()).label("size"),
+                    sa.func.sum(physical_size).label("physical_size"),
                 ]
             )
-            .select_from(self.blobs.join(self.jobs))
+            .select_from(self._blobs_with_bodies().join(self.jobs))
             .group_by(c.builder)
         )
         for row in self.conn.execute(query):
-            result[row.builder]["size"] += row.size
+            counter = result[row.builder]
+            counter["size"] += row.size
+            counter["logical_size"] = row.size
+            counter["physical_size"] = int(round(row.physical_size))
 
         for builder in registered_builders:
             if builder.name not in result:
@@ -439,6 +1406,9 @@ class Database:
                     c.finished_date,
                     c.computation_time,
                     sa.func.sum(sa.func.length(c.config)).label("size"),
+                    sa.func.max(
+                        sa.case([(self.blobs.c.name.is_(None), self.blobs.c.repr)])
+                    ).label("value"),
                 ]
             )
             .select_from(self.jobs.join(self.blobs, isouter=True))
@@ -453,42 +1423,55 @@ class Database:
                 "config": row.config,
                 "size": row.size,
                 "comp_time": row.computation_time,
+                "value": row.value,
                 "created": str(row.created_date),
                 "finished": str(row.finished_date),
             }
             for row in self.conn.execute(query)
         ]
 
+    def _blob_size(self):
+        c = self.blobs.c
+        return sa.func.coalesce(c.size, sa.func.length(c.data))
+
     def blob_summaries(self, job_id):
-        def process_value(value, mime):
-            if value is None:
+        def process_value(row):
+            if row.value is None:
                 return None
+            value = self._read_body(row.value, row.hash, row.body, row.n_chunks)
+            value = decompress_blob(value, row.codec)
+            mime = row.mime
             if mime == consts.MIME_TEXT:
                 return value.decode()
             return base64.b64encode(value).decode()
 
         c = self.blobs.c
-        query = sa.select(
-            [
-                c.name,
-                c.repr,
-                c.mime,
-                sa.func.length(c.data).label("size"),
-                sa.case(
-                    [
-                        (c.mime == consts.MIME_TEXT, c.data),
-                        (c.mime == "image/png", c.data),
-                    ],
-                    else_=sa.null(),
-                ).label("value"),
-            ]
-        ).where(c.job_id == job_id)
+        show_value = c.mime.in_((consts.MIME_TEXT, "image/png"))
+        query = (
+            sa.select(
+                [
+                    c.name,
+                    c.repr,
+                    c.mime,
+                    c.hash,
+                    c.codec,
+                    self._blob_size().label("size"),
+                    sa.case([(show_value, c.data)], else_=sa.null()).label("value"),
+                    sa.case(
+                        [(show_value, self.blob_bodies.c.data)], else_=sa.null()
+                    ).label("body"),
+                    self.blob_bodies.c.n_chunks,
+                ]
+            )
+            .select_from(self._blobs_with_bodies())
+            .where(c.job_id == job_id)
+        )
         return [
             {
                 "name": row.name,
                 "repr": row.repr,
                 "size": row.size,
-                "value": process_value(row.value, row.mime),
+                "value": process_value(row),
                 "mime": row.mime,
             }
             for row in self.conn.execute(query)
@@ -548,15 +1531,15 @@ class Database:
         query = sa.select([c.name]).where(c.job_id == job_id).order_by(c.name.asc())
         return [r[0] for r in self.conn.execute(query) if r[0] is not None]
 
+    @_retry_when_locked
     def drop_builder(self, builder_name, drop_inputs):
         with self.conn.begin():
             c = self.jobs.c
             base_query = sa.select([c.id]).where(c.builder == builder_name)
-            self.conn.execute(
-                self.jobs.delete().where(
-                    c.id.in_(self._closure(base_query, drop_inputs))
-                )
+            hashes = self._remove_jobs(
+                c.id.in_(self._closure(base_query, drop_inputs))
             )
+        self._remove_store_bodies(hashes)
 
     def _downstream(self, base_query, states=None):
         c = self.job_deps.c
@@ -592,13 +1575,17 @@ class Database:
             base_query = self._upstream(base_query, states)
         return self._downstream(base_query, states)
 
+    @_retry_when_locked
     def drop_jobs_by_key(self, keys, drop_inputs):
         c = self.jobs.c
         base_query = sa.select([c.id]).where(c.key.in_(keys))
-        self.conn.execute(
-            self.jobs.delete().where(c.id.in_(self._closure(base_query, drop_inputs)))
-        )
+        with self.conn.begin():
+            hashes = self._remove_jobs(
+                c.id.in_(self._closure(base_query, drop_inputs))
+            )
+        self._remove_store_bodies(hashes)
 
+    @_retry_when_locked
     def archive_jobs_by_key(self, keys, archive_inputs):
         c = self.jobs.c
         states = [
@@ -643,6 +1630,7 @@ class Database:
             #    state=JobState.A_FINISHED
             # ))
 
+    @_retry_when_locked
     def free_jobs_by_key(self, keys):
         # self._debug_jobs()
         c = self.jobs.c
@@ -650,10 +1638,13 @@ class Database:
             query = sa.select([c.id]).where(
                 sa.and_(c.key.in_(keys), c.state == JobState.FINISHED)
             )
-            self.conn.execute(self.blobs.delete().where(self.blobs.c.job_id.in_(query)))
+            hashes = self._remove_blobs(query)
             self.conn.execute(
-                self.jobs.update().where(c.id.in_(query)).values(state=JobState.FREED)
+                self.jobs.update()
+                .where(c.id.in_(query))
+                .values(state=JobState.FREED, value=None)
             )
+        self._remove_store_bodies(hashes)
         # self._debug_jobs()
 
     def _debug_jobs(self):
@@ -667,11 +1658,12 @@ class Database:
 
     def export_builder(self, builder_name):
         c = self.jobs.c
-        query = sa.select([c.config, c.computation_time]).where(
-            sa.and_(builder_name == builder_name, c.state == JobState.FINISHED)
+        query = sa.select([c.id, c.config, c.computation_time, c.value]).where(
+            sa.and_(c.builder == builder_name, c.state == JobState.FINISHED)
         )
         return self.conn.execute(query)
 
+    @_retry_when_locked
     def upgrade_builder(self, data):
         with self.conn.begin():
             stmt = (
@@ -686,3 +1678,58 @@ class Database:
                 .values(key=sa.bindparam("new_key"))
             )
             self.conn.execute(stmt, data)
+
+
+def open_database(url):
+    """Creates Database for the url; "sqlite3:///<path>" selects RawSqliteDatabase"""
+    from .rawsqlite import RawSqliteDatabase, is_raw_sqlite_url
+
+    if is_raw_sqlite_url(url):
+        return RawSqliteDatabase(url)
+    return Database(url)
+
+
+def _inline_value(value, mime=consts.MIME_PICKLE):
+    # Values read with jobs are always unpickled
+    if (
+        mime == consts.MIME_PICKLE
+        and isinstance(value, bytes)
+        and len(value) < INLINE_VALUE_SIZE
+    ):
+        return value
+    return None
+
+
+def _hash_file(fileobj):
+    h = hashlib.sha256()
+    while True:
+        data = fileobj.read(io.DEFAULT_BUFFER_SIZE * 16)
+        if not data:
+            return h.hexdigest()
+        h.update(data)
+
+
+class _ChunkReader(io.RawIOBase):
+    """Reads a chunked blob body; only one chunk is kept in memory"""
+
+    def __init__(self, db, blob_hash, n_chunks):
+        self.db = db
+        self.blob_hash = blob_hash
+        self.n_chunks = n_chunks
+        self.index = 0
+        self.buffer = memoryview(b"")
+        self.offset = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self.offset >= len(self.buffer) and self.index < self.n_chunks:
+            # memoryview and offset, so a chunk is not copied by small reads
+            self.buffer = memoryview(self.db._read_chunk(self.blob_hash, self.index))
+            self.offset = 0
+            self.index += 1
+        size = min(len(b), len(self.buffer) - self.offset)
+        b[:size] = self.buffer[self.offset : self.offset + size]
+        self.offset += size
+        return size
@@ -1,11 +1,21 @@
+import heapq
+import itertools
 import logging
 import platform
+import threading
+import time
 from concurrent.futures import wait, FIRST_COMPLETED
 from datetime import datetime
 
 import tqdm
 
-from orco.internals.runner import LocalProcessRunner, JobFailure
+from orco.internals.runner import (
+    LocalProcessRunner,
+    LocalThreadRunner,
+    LocalAsyncRunner,
+    JobFailure,
+    JobRetry,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -25,16 +35,30 @@ class Executor:
 
     Executor spawns LocalProcessRunner as default. By default it spawns at most N
     build functions where N is number of cpus of the local machine. This can be
-    configured via argument `n_processes` in the constructor.
+    configured via argument `n_processes` in the constructor. For an in-memory
+    database, the default runner is LocalThreadRunner, as other processes cannot
+    access the database. `value_cache_size` limits caches of deserialized values
+    of dependencies in default runners (0, the default, disables them).
+
+    Executor also spawns LocalThreadRunner under name "threads" that executes
+    jobs in threads of the current process and LocalAsyncRunner under name "asyncio"
+    that executes coroutine builders in an event loop.
+
+    Executor created without a runtime (used by daemon) computes plans of runtimes
+    passed to `run`.
     """
 
-    def __init__(self, runtime, runners=None, name=None, n_processes=None):
+    def __init__(
+        self, runtime, runners=None, name=None, n_processes=None, value_cache_size=None
+    ):
         self.name = name or "unnamed"
         self.hostname = platform.node() or "unknown"
         self.created = None
         self.id = None
         self.runtime = runtime
         self.stats = {}
+        # The daemon may run more computations of the executor concurrently
+        self.stats_lock = threading.Lock()
         self.n_processes = n_processes
 
         if runners is None:
@@ -44,14 +68,30 @@ class Executor:
 
         self.runners = runners
         if "local" not in self.runners:
-            runners["local"] = LocalProcessRunner(n_processes)
+            if runtime is not None and runtime.db.is_memory:
+                runners["local"] = LocalThreadRunner(n_processes, value_cache_size)
+            else:
+                runners["local"] = LocalProcessRunner(
+                    n_processes, value_cache_size=value_cache_size
+                )
+        if "threads" not in self.runners:
+            runners["threads"] = LocalThreadRunner(value_cache_size=value_cache_size)
+        if "asyncio" not in self.runners:
+            runners["asyncio"] = LocalAsyncRunner()
 
         self.resources = ",".join(
             "{} ({})".format(name, r.get_resources()) for name, r in runners.items()
         )
 
     def get_stats(self):
-        return self.stats
+        with self.stats_lock:
+            return self.stats.copy()
+
+    def add_stats(self, stats):
+        """Adds counters reported by a finished job (e.g. value cache hits)"""
+        with self.stats_lock:
+            for name, value in stats.items():
+                self.stats[name] = self.stats.get(name, 0) + value
 
     def stop(self):
         # self.runtime.db.stop_executor(self.id)
@@ -60,7 +100,6 @@ class Executor:
         self.runtime = None
 
     def start(self):
-        assert self.runtime
         assert self.id is None
         assert self.created is None
 
@@ -71,20 +110,27 @@ class Executor:
         for runner in self.runners.values():
             runner.start()
 
-    def run(self, plan, verbose):
-        ExecutorRun(self, plan, verbose).run()
+    def run(self, plan, verbose, runtime=None, on_progress=None):
+        ExecutorRun(self, plan, verbose, runtime, on_progress).run()
 
 
 class ExecutorRun:
 
-    def __init__(self, executor, plan, verbose):
+    def __init__(self, executor, plan, verbose, runtime=None, on_progress=None):
         self.executor = executor
+        self.runtime = runtime or executor.runtime
+        self.on_progress = on_progress
         self.unprocessed = []
         self.unprocessed_exclusives = []
         self.exclusive_mode = False
         self.waiting = set()
+        self.retries = []  # heap of (time, counter, plan_node)
+        self.retry_counter = itertools.count()
         self.plan = plan
         self.verbose = verbose
+        # Values of ephemeral jobs ({job_id: value}) kept until their consumers finish
+        self.ephemeral_values = {}
+        self.ephemeral_refs = {}
 
     def start(self, plan_node):
         runner_name = plan_node.job_setup.runner_name
@@ -95,7 +141,13 @@ class ExecutorRun:
                     plan_node.builder_name, plan_node.config, runner_name
                 )
             )
-        self.waiting.add(runner.submit(self.executor.runtime, plan_node))
+        if self.ephemeral_values:
+            plan_node.ephemeral_inputs = {
+                inp.job_id: self.ephemeral_values[inp.job_id]
+                for inp in plan_node.inputs
+                if inp.job_id in self.ephemeral_values
+            } or None
+        self.waiting.add(runner.submit(self.runtime, plan_node))
 
     def init(self):
         consumers = {}
@@ -129,8 +181,44 @@ class ExecutorRun:
         else:
             self.unprocessed_exclusives.append(plan_node)
 
+    def keep_ephemeral_value(self, plan_node, value, n_consumers, leaf_keys):
+        if plan_node.key in leaf_keys:
+            self.plan.ephemeral_values[plan_node.key] = (plan_node.job_id, value)
+        if n_consumers:
+            self.ephemeral_values[plan_node.job_id] = value
+            self.ephemeral_refs[plan_node.job_id] = n_consumers
+
+    def release_ephemeral_inputs(self, plan_node):
+        """Called when a job is finished or failed; releases values no longer needed"""
+        plan_node.ephemeral_inputs = None
+        for inp in plan_node.inputs:
+            n_refs = self.ephemeral_refs.get(inp.job_id)
+            if n_refs is None:
+                continue
+            if n_refs > 1:
+                self.ephemeral_refs[inp.job_id] = n_refs - 1
+            else:
+                del self.ephemeral_refs[inp.job_id]
+                del self.ephemeral_values[inp.job_id]
+
+    def schedule_retry(self, plan_node, delay):
+        heapq.heappush(
+            self.retries, (time.time() + delay, next(self.retry_counter), plan_node)
+        )
+
+    def start_retries(self):
+        now = time.time()
+        while self.retries and self.retries[0][0] <= now:
+            _, _, plan_node = heapq.heappop(self.retries)
+            self.start(plan_node)
+
+    def wait_timeout(self):
+        if not self.retries:
+            return None
+        return max(0, self.retries[0][0] - time.time())
+
     def check_waiting(self):
-        if self.waiting:
+        if self.waiting or self.retries:
             return True
 
         if self.unprocessed_exclusives:
@@ -146,9 +234,20 @@ class ExecutorRun:
             return True
         return False
 
+    def store_failure(self, job_id, message):
+        """
+        Marks a job as failed when its worker did not do it (e.g. the worker was
+        lost), otherwise the job would remain running in the database
+        """
+        try:
+            self.runtime.db.set_error(job_id, message, None, None)
+        except Exception:
+            logger.exception("Storing a failure of job %s failed", job_id)
+
     def run(self):
         plan = self.plan
         nodes_by_id = {pn.job_id: pn for pn in plan.nodes}
+        leaf_keys = plan.leaf_keys
         consumers, waiting_deps = self.init()
 
         if self.verbose:
@@ -158,21 +257,42 @@ class ExecutorRun:
 
         try:
             while self.check_waiting():
+                timeout = self.wait_timeout()
+                if not self.waiting:
+                    time.sleep(timeout)
+                    self.start_retries()
+                    continue
                 wait_result = wait(
                     self.waiting,
                     return_when=FIRST_COMPLETED,
-                    timeout=None,
+                    timeout=timeout,
                 )
                 self.waiting = wait_result.not_done
+                self.start_retries()
                 for f in wait_result.done:
+                    result = f.result()
+                    if isinstance(result, JobRetry):
+                        pn = nodes_by_id[result.job_id]
+                        logger.info(
+                            "Job %s/%s: %s",
+                            pn.builder_name,
+                            repr(pn.config),
+                            result.message(),
+                        )
+                        self.schedule_retry(pn, result.delay)
+                        continue
                     if progressbar:
                         progressbar.update()
-                    result = f.result()
+                    if self.on_progress:
+                        self.on_progress()
                     if isinstance(result, JobFailure):
                         pn = nodes_by_id[result.job_id]
+                        self.release_ephemeral_inputs(pn)
                         message = result.message()
+                        if not result.stored:
+                            self.store_failure(result.job_id, message)
                         if plan.continue_on_error:
-                            plan.error_keys.append(pn.key)
+                            plan.error_keys.add(pn.key)
                         else:
                             raise JobFailedException(
                                 "{} ({}/{})".format(
@@ -180,7 +300,13 @@ class ExecutorRun:
                                 )
                             )
                         continue
-                    pn = nodes_by_id[result]
+                    self.executor.add_stats(result.stats)
+                    pn = nodes_by_id[result.job_id]
+                    self.release_ephemeral_inputs(pn)
+                    if self.runtime.get_builder(pn.builder_name).ephemeral:
+                        self.keep_ephemeral_value(
+                            pn, result.value, len(consumers.get(pn, ())), leaf_keys
+                        )
                     logger.debug(
                         "Job %s finished: %s/%s", pn.job_id, pn.builder_name, pn.key
                     )
@@ -15,6 +15,7 @@ class PlanNode:
         "job_id",
         "inputs",
         "existing_dep_ids",
+        "ephemeral_inputs",
     )
 
     def __init__(self, builder_name, key, config, job_setup, inputs, existing_dep_ids):
@@ -25,6 +26,8 @@ class PlanNode:
         self.inputs = inputs
         self.existing_dep_ids = existing_dep_ids
         self.job_id = None
+        # Values of ephemeral inputs ({job_id: value}), set when the node is started
+        self.ephemeral_inputs = None
 
 
 class Plan:
@@ -38,6 +41,12 @@ class Plan:
             self.error_keys = None
         self._nodes = None
         self.conflicts = None
+        # Ephemeral leaf jobs computed by the executor ({key: (job_id, value)})
+        self.ephemeral_values = {}
+
+    @property
+    def leaf_keys(self):
+        return set(job.key for job in self.leaf_jobs)
 
     def is_finished(self):
         return not self.nodes and not self.conflicts
@@ -63,7 +72,7 @@ class Plan:
         existing_jobs = self.existing_jobs
         error_keys = self.error_keys
 
-        assert not hasattr(_CONTEXT, "on_job") or _CONTEXT.on_job is None
+        assert _CONTEXT.on_job is None
 
         def traverse(job):
             key = job.key
@@ -128,7 +137,9 @@ class Plan:
             return plan_node
 
         for job in self.leaf_jobs:
-            traverse(job)
+            # Ephemeral leaf jobs computed in a previous round are not in the database
+            if job.key not in self.ephemeral_values:
+                traverse(job)
 
     def _testing_fill_job_ids(self, runtime):
         db = runtime.db
@@ -148,21 +159,35 @@ class Plan:
             if set_finish is False then state of leaf nodes is read from db
         """
         read_jobs = []
+        finished_jobs = []
         db = runtime.db
         nodes = self._nodes
         for job in self.leaf_jobs:
             key = job.key
+            ephemeral = self.ephemeral_values.get(key)
+            if ephemeral is not None:
+                # Value of an ephemeral job is not in the database
+                job_id, value = ephemeral
+                job.set_job_id(job_id, db, JobState.FINISHED)
+                job._set_value(value)
+                continue
             job_id = self.existing_jobs.get(key)
             if job_id:
-                job.set_job_id(job_id, db, JobState.FINISHED)
+                finished_jobs.append((job, job_id))
 
             node = nodes.get(key)
             if node:
                 if set_finish:
-                    job.set_job_id(node.job_id, db, JobState.FINISHED)
+                    finished_jobs.append((job, node.job_id))
                 else:
                     read_jobs.append(job)
 
+        if finished_jobs:
+            # Small values are read in one query instead of one query per job
+            values = db.read_inline_values([job_id for _, job_id in finished_jobs])
+            for job, job_id in finished_jobs:
+                job.set_job_id(job_id, db, JobState.FINISHED, values.get(job_id))
+
         if read_jobs:
             job_ids = [nodes[job.key].job_id for job in read_jobs]
             state_map = db.get_states(job_ids)
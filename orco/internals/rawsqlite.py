@@ -0,0 +1,331 @@
+import collections
+import pickle
+import sqlite3
+
+from orco import consts
+from orco.job import JobState, ACTIVE_STATES
+
+from . import database
+from .database import (
+    Database,
+    DepJob,
+    _inline_value,
+    _removes_orphan_bodies,
+    _retry_when_locked,
+    is_memory_url,
+)
+
+RAW_SQLITE_PREFIX = "sqlite3://"
+
+# Columns of blobs needed to read their bodies; body and n_chunks come from blob_bodies
+_BlobRow = collections.namedtuple(
+    "_BlobRow", ["job_id", "data", "mime", "hash", "codec", "body", "n_chunks"]
+)
+
+_ACTIVE_STATE_NAMES = tuple(s.name for s in ACTIVE_STATES)
+
+_SELECT_BLOB_ROWS = (
+    "SELECT b.job_id, b.data, b.mime, b.hash, b.codec, bb.data, bb.n_chunks "
+    "FROM blobs AS b LEFT OUTER JOIN blob_bodies AS bb ON b.hash = bb.hash "
+)
+
+
+def is_raw_sqlite_url(url):
+    return url.startswith(RAW_SQLITE_PREFIX)
+
+
+def _dumps(value):
+    # The same format as sa.PickleType
+    if value is None:
+        return None
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def _loads(data):
+    if data is None:
+        return None
+    return pickle.loads(data)
+
+
+def _placeholders(n):
+    return ",".join("?" * n)
+
+
+class RawSqliteDatabase(Database):
+    """
+    Database on SQLite that runs operations on the hot path of computations
+    (announcing jobs, state changes, blobs) as plain sqlite3 statements
+    instead of building them by SQLAlchemy.
+
+    It is selected by urls "sqlite3:///<path>"; the database file has the same
+    schema as with "sqlite:///<path>", so both urls may be used for the same file.
+    Statements are constant strings, so they are prepared only once
+    by the statement cache of sqlite3. The other operations are inherited
+    from Database; raw statements use the same connection of the thread,
+    so they take part in its transactions.
+    """
+
+    def __init__(self, url):
+        assert is_raw_sqlite_url(url)
+        sa_url = "sqlite" + url[len("sqlite3") :]
+        if is_memory_url(sa_url):
+            raise Exception("In-memory database is not supported by {!r}".format(url))
+        super().__init__(sa_url)
+        self.url = url
+
+    @property
+    def raw(self):
+        """sqlite3 connection under the SQLAlchemy connection of the current thread"""
+        return self.conn.connection.connection
+
+    def _execute(self, sql, params=()):
+        conn = self.conn
+        raw = conn.connection.connection
+        cursor = raw.execute(sql, params)
+        if not conn.in_transaction():
+            raw.commit()
+        return cursor
+
+    def _executemany(self, sql, params):
+        conn = self.conn
+        raw = conn.connection.connection
+        raw.executemany(sql, params)
+        if not conn.in_transaction():
+            raw.commit()
+
+    def _query(self, sql, params=()):
+        return self.raw.execute(sql, params).fetchall()
+
+    def _query_batches(self, sql, values, params=()):
+        """Runs `sql` with "{}" replaced by placeholders for batches of values"""
+        values = list(values)
+        for i in range(0, len(values), database.QUERY_BATCH_SIZE):
+            batch = values[i : i + database.QUERY_BATCH_SIZE]
+            yield from self._query(
+                sql.format(_placeholders(len(batch))), tuple(batch) + params
+            )
+
+    def read_finished(self, keys):
+        return {
+            key: (job_id, value)
+            for key, job_id, value in self._query_batches(
+                "SELECT key, id, value FROM jobs WHERE key IN ({}) AND state = ?",
+                keys,
+                (JobState.FINISHED.name,),
+            )
+        }
+
+    def read_inline_values(self, job_ids):
+        return dict(
+            self._query_batches(
+                "SELECT id, value FROM jobs WHERE id IN ({}) AND value IS NOT NULL",
+                job_ids,
+            )
+        )
+
+    def _blob_rows(self, job_ids, name):
+        if name is None:
+            sql = _SELECT_BLOB_ROWS + "WHERE b.job_id IN ({}) AND b.name IS NULL"
+            params = ()
+        else:
+            sql = _SELECT_BLOB_ROWS + "WHERE b.job_id IN ({}) AND b.name = ?"
+            params = (name,)
+        for r in self._query_batches(sql, job_ids, params):
+            yield _BlobRow(*r)
+
+    def get_active_state(self, key):
+        return self.get_active_job_id_and_state(key)[1]
+
+    def get_states(self, job_ids):
+        return {
+            job_id: JobState[state]
+            for job_id, state in self._query_batches(
+                "SELECT id, state FROM jobs WHERE id IN ({})", job_ids
+            )
+        }
+
+    def get_active_job_id_and_state(self, key):
+        rows = self._query(
+            "SELECT id, state FROM jobs WHERE key = ? AND state IN ({})".format(
+                _placeholders(len(_ACTIVE_STATE_NAMES))
+            ),
+            (key,) + _ACTIVE_STATE_NAMES,
+        )
+        if not rows:
+            return None, JobState.DETACHED
+        job_id, state = rows[0]
+        return job_id, JobState[state]
+
+    @_retry_when_locked
+    def set_running(self, job_id):
+        assert job_id is not None
+        with self.conn.begin():
+            r = self._execute(
+                "UPDATE jobs SET state = ? WHERE id = ? AND state = ?",
+                (JobState.RUNNING.name, job_id, JobState.ANNOUNCED.name),
+            )
+            if r.rowcount != 1:
+                raise Exception("Setting a job into a running state failed")
+
+            config, job_setup, attempts = self._query(
+                "SELECT config, job_setup, attempts FROM jobs WHERE id = ?", (job_id,)
+            )[0]
+            keys_to_deps = {
+                key: DepJob(dep_id, value, value_hash, mime, size)
+                for dep_id, key, value, value_hash, mime, size in self._query(
+                    "SELECT j.id, j.key, j.value, b.hash, b.mime, b.size "
+                    "FROM jobs AS j LEFT OUTER JOIN blobs AS b "
+                    "ON b.job_id = j.id AND b.name IS NULL "
+                    "WHERE j.id IN "
+                    "(SELECT source_id FROM job_deps WHERE target_id = ?)",
+                    (job_id,),
+                )
+            }
+        attempts = _loads(attempts)
+        n_attempts = len(attempts) if attempts else 0
+        return _loads(job_setup), _loads(config), keys_to_deps, n_attempts
+
+    @_retry_when_locked
+    @_removes_orphan_bodies
+    def set_finished(
+        self,
+        job_id,
+        value,
+        repr_value,
+        computation_time,
+        output=None,
+        compression=None,
+        mime=consts.MIME_PICKLE,
+    ):
+        assert job_id is not None
+        with self.conn.begin():
+            r = self._execute(
+                "UPDATE jobs SET state = ?, computation_time = ?, "
+                "finished_date = CURRENT_TIMESTAMP, value = ? "
+                "WHERE id = ? AND state = ?",
+                (
+                    JobState.FINISHED.name,
+                    computation_time,
+                    _inline_value(value, mime),
+                    job_id,
+                    JobState.RUNNING.name,
+                ),
+            )
+            if r.rowcount != 1:
+                raise Exception("Setting a job into finished state failed")
+            if isinstance(value, bytes):
+                value_hash = self.insert_blob(
+                    job_id, None, value, mime, repr_value, compression
+                )
+            elif value is not None:
+                value_hash = self.insert_blob_from_file(
+                    job_id, None, value, mime, repr_value, compression
+                )
+            else:
+                value_hash = None
+            if output:
+                self.insert_blob(
+                    job_id, "!output", output, consts.MIME_TEXT, None, compression
+                )
+        return value_hash
+
+    def _insert_blob_row(
+        self, job_id, name, data, mime, repr_value, blob_hash, size, codec
+    ):
+        try:
+            self._execute(
+                "INSERT INTO blobs (job_id, name, data, mime, repr, hash, size, codec) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, name, data, mime, repr_value, blob_hash, size, codec),
+            )
+        except sqlite3.IntegrityError:
+            raise Exception("Blob '{}' already exists".format(name))
+
+    def _add_body_ref(self, blob_hash, body, body_size):
+        inc_refs = "UPDATE blob_bodies SET refs = refs + 1 WHERE hash = ?"
+        if self._execute(inc_refs, (blob_hash,)).rowcount == 1:
+            return
+        blob_store = self.blob_store
+        data = None
+        n_chunks = None
+        if blob_store is not None and body_size >= blob_store.threshold:
+            self._put_store_body(blob_store, blob_hash, body)
+        elif body_size > database.CHUNK_SIZE:
+            n_chunks = 0
+            while True:
+                chunk = body.read(database.CHUNK_SIZE)
+                if not chunk:
+                    break
+                # Chunks of the same hash are the same
+                self._execute(
+                    "INSERT OR IGNORE INTO blob_chunks (hash, \"index\", data) "
+                    "VALUES (?, ?, ?)",
+                    (blob_hash, n_chunks, chunk),
+                )
+                n_chunks += 1
+        else:
+            data = body.read()
+        # Upsert, the same body may be inserted concurrently
+        self._execute(
+            "INSERT INTO blob_bodies (hash, size, refs, data, n_chunks) "
+            "VALUES (?, ?, 1, ?, ?) ON CONFLICT (hash) DO UPDATE SET refs = refs + 1",
+            (blob_hash, body_size, data, n_chunks),
+        )
+
+    def _read_blob_row(self, job_id, name):
+        if name is None:
+            rows = self._query(
+                _SELECT_BLOB_ROWS + "WHERE b.job_id = ? AND b.name IS NULL", (job_id,)
+            )
+        else:
+            rows = self._query(
+                _SELECT_BLOB_ROWS + "WHERE b.job_id = ? AND b.name = ?", (job_id, name)
+            )
+        return _BlobRow(*rows[0]) if rows else None
+
+    def _read_chunk(self, blob_hash, index):
+        rows = self._query(
+            'SELECT data FROM blob_chunks WHERE hash = ? AND "index" = ?',
+            (blob_hash, index),
+        )
+        return rows[0][0] if rows else None
+
+    @_retry_when_locked
+    def announce_jobs(self, plan):
+        with self.conn.begin() as transaction:
+            for pn in plan.nodes:
+                r = self._execute(
+                    "INSERT INTO jobs (state, builder, key, config, job_setup) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (
+                        JobState.ANNOUNCED.name,
+                        pn.builder_name,
+                        pn.key,
+                        _dumps(pn.config),
+                        _dumps(pn.job_setup),
+                    ),
+                )
+                pn.job_id = r.lastrowid
+            try:
+                self._executemany(
+                    "INSERT INTO announcements (key, job_id) VALUES (?, ?)",
+                    [(pn.key, pn.job_id) for pn in plan.nodes],
+                )
+            except sqlite3.IntegrityError:
+                transaction.rollback()
+                for pn in plan.nodes:
+                    pn.job_id = None
+                return False
+
+            deps = []
+            for pn in plan.nodes:
+                job_id = pn.job_id
+                for inp in pn.inputs:
+                    deps.append((inp.job_id, job_id))
+                for j_id in pn.existing_dep_ids:
+                    deps.append((j_id, job_id))
+            if deps:
+                self._executemany(
+                    "INSERT INTO job_deps (source_id, target_id) VALUES (?, ?)", deps
+                )
+        return True
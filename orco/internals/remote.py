@@ -0,0 +1,332 @@
+import collections
+import hashlib
+import hmac
+import logging
+import os
+import pickle
+import platform
+import secrets
+import socket
+import struct
+import threading
+from concurrent.futures import Future
+from concurrent.futures.process import ProcessPoolExecutor
+
+from .runner import JobError, JobRunner, _run_job
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct("<Q")
+
+
+def _send_data(sock, data):
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(min(size, 1024 * 1024))
+        if not chunk:
+            raise ConnectionError("Connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def _recv_data(sock):
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return _recv_exact(sock, size)
+
+
+def _send_message(sock, message):
+    _send_data(sock, pickle.dumps(message))
+
+
+def _recv_message(sock):
+    return pickle.loads(_recv_data(sock))
+
+
+_NONCE_SIZE = 32
+
+
+def _auth_digest(secret, role, nonce):
+    return hmac.new(secret, role + nonce, hashlib.sha256).digest()
+
+
+def _authenticate_worker(sock, secret):
+    """
+    Runner side of a mutual challenge-response authentication; the secret itself
+    is never sent. Returns True when the worker knows the secret.
+    """
+    nonce = secrets.token_bytes(_NONCE_SIZE)
+    _send_data(sock, nonce)
+    response = _recv_data(sock)
+    worker_nonce = response[:_NONCE_SIZE]
+    expected = _auth_digest(secret, b"worker", nonce)
+    if not hmac.compare_digest(response[_NONCE_SIZE:], expected):
+        return False
+    _send_data(sock, _auth_digest(secret, b"runner", worker_nonce))
+    return True
+
+
+def _authenticate_runner(sock, secret):
+    """Worker side of the authentication, see `_authenticate_worker`"""
+    nonce = _recv_data(sock)
+    worker_nonce = secrets.token_bytes(_NONCE_SIZE)
+    _send_data(sock, worker_nonce + _auth_digest(secret, b"worker", nonce))
+    expected = _auth_digest(secret, b"runner", worker_nonce)
+    if not hmac.compare_digest(_recv_data(sock), expected):
+        raise Exception("Runner failed to prove the knowledge of the secret")
+
+
+class _RemoteWorker:
+    def __init__(self, sock, address, hostname, n_slots):
+        self.sock = sock
+        self.address = address
+        self.hostname = hostname
+        self.n_slots = n_slots
+        self.running = {}
+        self.send_lock = threading.Lock()
+
+    def free_slots(self):
+        return self.n_slots - len(self.running)
+
+    def __repr__(self):
+        return "<RemoteWorker {}:{} slots={}>".format(
+            self.hostname, self.address[1], self.n_slots
+        )
+
+
+class RemoteRunner(JobRunner):
+    """
+    Runner that executes jobs on remote workers.
+
+    Runner listens on a TCP port and workers connect to it. A worker is started by
+    `python3 -m orco worker HOST:PORT` command (see `run_worker`). Each worker announces
+    a number of slots and jobs are assigned to workers with the most free slots.
+    Jobs wait in a queue when there is no free slot.
+
+    Workers have to be able to reach the database of the runtime under the same URL.
+
+    Workers and the runner exchange pickled messages, hence workers have to
+    prove that they know `secret` (by HMAC challenge-response) before any message
+    is exchanged. When no secret is given, a random one is generated; it is
+    available as `runner.secret` and it has to be passed to workers.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, secret=None):
+        self.host = host
+        self.port = port
+        self.secret = secret or secrets.token_hex(16)
+        self.server = None
+        self.workers = []
+        self.queue = collections.deque()
+        self.lock = threading.Lock()
+        self.accept_thread = None
+
+    def start(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind((self.host, self.port))
+        server.listen()
+        self.port = server.getsockname()[1]
+        self.server = server
+        self.accept_thread = threading.Thread(target=self._accept_loop, args=(server,))
+        self.accept_thread.daemon = True
+        self.accept_thread.start()
+        logger.info("Remote runner listens on %s:%s", self.host, self.port)
+
+    def stop(self):
+        with self.lock:
+            server = self.server
+            self.server = None
+            workers = self.workers
+            self.workers = []
+            queue = self.queue
+            self.queue = collections.deque()
+        if server is not None:
+            server.close()
+        for worker in workers:
+            worker.sock.close()
+            self._fail_jobs(worker.running, "Runner was stopped")
+        for future, _ in queue:
+            future.cancel()
+
+    @property
+    def n_workers(self):
+        with self.lock:
+            return len(self.workers)
+
+    def get_resources(self):
+        with self.lock:
+            n_slots = sum(w.n_slots for w in self.workers)
+            return "{} remote workers ({} slots) at port {}".format(
+                len(self.workers), n_slots, self.port
+            )
+
+    def submit(self, runtime, plan_node):
+        builder = runtime.get_builder(plan_node.builder_name)
+        future = Future()
+        with self.lock:
+            self.queue.append(
+                (
+                    future,
+                    (
+                        runtime.db.url,
+                        builder,
+                        plan_node.job_id,
+                        plan_node.ephemeral_inputs,
+                    ),
+                )
+            )
+            to_send = self._dispatch()
+        self._send_tasks(to_send)
+        return future
+
+    def _dispatch(self):
+        """
+        Assigns queued jobs to workers; it has to be called with self.lock acquired.
+        Returns pairs (worker, task) that have to be sent by `_send_tasks`
+        after the lock is released, so a slow worker does not block the others.
+        """
+        to_send = []
+        while self.queue and self.workers:
+            worker = max(self.workers, key=lambda w: w.free_slots())
+            if worker.free_slots() <= 0:
+                break
+            future, task = self.queue.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+            job_id = task[2]
+            worker.running[job_id] = future
+            to_send.append((worker, task))
+        return to_send
+
+    @staticmethod
+    def _send_tasks(to_send):
+        for worker, task in to_send:
+            try:
+                with worker.send_lock:
+                    _send_message(worker.sock, task)
+            except OSError:
+                # Worker is lost, reader thread will fail its jobs
+                logger.error("Sending a job to %s failed", worker)
+
+    def _accept_loop(self, server):
+        while True:
+            try:
+                sock, address = server.accept()
+            except OSError:
+                return
+            thread = threading.Thread(
+                target=self._worker_loop, args=(sock, address)
+            )
+            thread.daemon = True
+            thread.start()
+
+    def _register_worker(self, sock, address):
+        if not _authenticate_worker(sock, self.secret.encode()):
+            logger.error("Worker from %s failed to authenticate", address)
+            sock.close()
+            return None
+        message = _recv_message(sock)
+        worker = _RemoteWorker(sock, address, message["hostname"], message["slots"])
+        with self.lock:
+            if self.server is None:
+                sock.close()
+                return None
+            self.workers.append(worker)
+            to_send = self._dispatch()
+        self._send_tasks(to_send)
+        logger.info("Worker %s registered", worker)
+        return worker
+
+    def _worker_loop(self, sock, address):
+        try:
+            worker = self._register_worker(sock, address)
+        except (OSError, ConnectionError):
+            sock.close()
+            return
+        if worker is None:
+            return
+        try:
+            while True:
+                job_id, result = _recv_message(sock)
+                with self.lock:
+                    future = worker.running.pop(job_id, None)
+                    to_send = self._dispatch()
+                self._send_tasks(to_send)
+                if future is not None:
+                    future.set_result(result)
+        except (OSError, ConnectionError):
+            pass
+        with self.lock:
+            if worker in self.workers:
+                self.workers.remove(worker)
+            running = worker.running
+            worker.running = {}
+            to_send = self._dispatch()
+        self._send_tasks(to_send)
+        sock.close()
+        logger.info("Worker %s disconnected", worker)
+        self._fail_jobs(running, "Worker {} disconnected".format(worker))
+
+    @staticmethod
+    def _fail_jobs(running, message):
+        for job_id, future in running.items():
+            if not future.done():
+                future.set_result(JobError(job_id, message, "", stored=False))
+
+
+def run_worker(host, port, n_slots=None, secret=None):
+    """
+    Connects to a RemoteRunner and executes jobs until the connection is closed.
+
+    Jobs are executed in a pool of `n_slots` processes (default: number of cpus).
+    `secret` has to be the secret of the runner.
+    """
+    if not secret:
+        raise Exception("Secret of the runner is not set")
+    n_slots = n_slots or os.cpu_count() or 1
+    # Pool processes are started before connecting, so they do not hold a copy
+    # of the connection and the runner notices when the worker dies
+    pool = ProcessPoolExecutor(max_workers=n_slots)
+    pool.submit(os.getpid).result()
+    try:
+        sock = socket.create_connection((host, port))
+    except BaseException:
+        pool.shutdown()
+        raise
+    sock.set_inheritable(False)
+    send_lock = threading.Lock()
+
+    def send_result(job_id, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            result = JobError(job_id, str(e), "", stored=False)
+        with send_lock:
+            try:
+                _send_message(sock, (job_id, result))
+            except OSError:
+                pass
+
+    try:
+        _authenticate_runner(sock, secret.encode())
+        _send_message(
+            sock, {"hostname": platform.node() or "unknown", "slots": n_slots}
+        )
+        logger.info("Worker connected to %s:%s with %s slots", host, port, n_slots)
+        while True:
+            try:
+                db_url, builder, job_id, ephemeral_inputs = _recv_message(sock)
+            except (OSError, ConnectionError):
+                break
+            future = pool.submit(_run_job, db_url, builder, job_id, ephemeral_inputs)
+            future.add_done_callback(
+                lambda f, job_id=job_id: send_result(job_id, f)
+            )
+    finally:
+        pool.shutdown()
+        sock.close()
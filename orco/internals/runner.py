@@ -1,26 +1,54 @@
+import asyncio
 import collections
+import functools
 import os
-import pickle
 import tempfile
 import threading
 import time
 import traceback
 import sys
 from concurrent.futures.process import ProcessPoolExecutor
+from concurrent.futures.thread import ThreadPoolExecutor
 
 import capturer
 
+from ..consts import MIME_PICKLE, MIME_PICKLE_OOB
 from .context import _CONTEXT
-from .database import Database
+from .database import open_database
 from .database import JobState
+from .serialization import find_serializer, loads_value, serialize, write_oob
+from .sharedmem import SharedSegments, SharedValues
 from .utils import make_repr
+from .valuecache import DEFAULT_VALUE_CACHE_SIZE, CachedValue, ValueCache
 
-JobContext = collections.namedtuple("JobContext", ["db", "job_id"])
+JobContext = collections.namedtuple("JobContext", ["db", "job_id", "job_setup"])
+
+
+class JobFinished:
+    """
+    Job was successfully computed; stats are counters collected in the worker,
+    shared_segments are pairs (name, size) of shared memory segments with
+    the value published by the worker, value is the value of an ephemeral job
+    (it is not stored in the database)
+    """
+
+    def __init__(self, job_id, stats, shared_segments=(), value=None):
+        self.job_id = job_id
+        self.stats = stats
+        self.shared_segments = shared_segments
+        self.value = value
 
 
 class JobFailure:
-    def __init__(self, job_id):
+    """
+    Job was not computed; `stored` is False when the failure was not written
+    into the database by the worker (e.g. the worker was lost), the executor
+    then stores it
+    """
+
+    def __init__(self, job_id, stored=True):
         self.job_id = job_id
+        self.stored = stored
 
     def message(self):
         raise NotImplementedError()
@@ -30,8 +58,8 @@ class JobFailure:
 
 
 class JobError(JobFailure):
-    def __init__(self, job_id, exception_str, traceback):
-        super().__init__(job_id)
+    def __init__(self, job_id, exception_str, traceback, stored=True):
+        super().__init__(job_id, stored)
         self.exception_str = exception_str
         self.traceback = traceback
 
@@ -54,6 +82,23 @@ class JobTimeout(JobFailure):
         return "timeout"
 
 
+class JobRetry(JobFailure):
+    """Job failed, but it was returned into announced state to be computed again"""
+
+    def __init__(self, job_id, delay, exception_str):
+        super().__init__(job_id)
+        self.delay = delay
+        self.exception_str = exception_str
+
+    def message(self):
+        return "Job failed and will be retried after {} seconds: {}".format(
+            self.delay, self.exception_str
+        )
+
+    def report_type(self):
+        return "retry"
+
+
 class JobRunner:
     def get_resources(self):
         raise NotImplementedError
@@ -76,117 +121,743 @@ class PoolJobRunner(JobRunner):
 
     def submit(self, runtime, plan_node):
         builder = runtime.get_builder(plan_node.builder_name)
-        return self.pool.submit(_run_job, runtime.db.url, builder, plan_node.job_id)
+        return self.pool.submit(
+            _run_job,
+            runtime.db.url,
+            builder,
+            plan_node.job_id,
+            plan_node.ephemeral_inputs,
+        )
 
 
 class LocalProcessRunner(PoolJobRunner):
-    def __init__(self, n_processes):
+    """
+    Runner that executes jobs in a pool of local processes.
+
+    If `shared_memory_size` is set, large values computed by the workers are
+    also published into shared memory segments and workers read values
+    of dependencies directly from them instead of the database.
+    At most `shared_memory_size` bytes of segments are kept; the oldest ones are
+    released first and all of them are released when the runner stops.
+
+    Each worker caches deserialized values of dependencies up to
+    `value_cache_size` bytes (of serialized data); 0 (the default) disables
+    the cache.
+    """
+
+    def __init__(self, n_processes, shared_memory_size=0, value_cache_size=None):
         super().__init__()
         self.n_processes = n_processes or os.cpu_count() or 1
+        self.shared_memory_size = shared_memory_size
+        self.shared_segments = None
+        if value_cache_size is None:
+            value_cache_size = DEFAULT_VALUE_CACHE_SIZE
+        self.value_cache_size = value_cache_size
 
     def _create_pool(self):
-        pool = ProcessPoolExecutor(max_workers=self.n_processes)
-        return pool
+        if self.shared_memory_size:
+            self.shared_segments = SharedSegments(self.shared_memory_size)
+        return ProcessPoolExecutor(
+            max_workers=self.n_processes,
+            initializer=_init_worker,
+            initargs=(self.value_cache_size, bool(self.shared_memory_size)),
+        )
+
+    def start(self):
+        super().start()
+        # Workers are forked now rather than by the first submit, when other
+        # threads of the runtime may be in the middle of a database operation
+        self.pool.submit(os.getpid).result()
+
+    def stop(self):
+        super().stop()
+        if self.shared_segments is not None:
+            self.shared_segments.release_all()
+            self.shared_segments = None
+
+    def submit(self, runtime, plan_node):
+        future = super().submit(runtime, plan_node)
+        if self.shared_segments is not None:
+            future.add_done_callback(self._add_shared_segments)
+        return future
+
+    def _add_shared_segments(self, future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        result = future.result()
+        if isinstance(result, JobFinished) and self.shared_segments is not None:
+            self.shared_segments.add(result.shared_segments)
 
     def get_resources(self):
         return "{} cpus".format(self.n_processes)
 
 
-_per_process_db = None
+class LocalThreadRunner(PoolJobRunner):
+    """
+    Runner that executes jobs in threads of the executor's process.
 
+    It avoids costs of spawning processes and pickling builders and it is
+    suitable for I/O-bound builders or builders that spend most of
+    their time in code that releases GIL.
 
-def _run_job_timed(db, job_id, builder, config, keys_to_job_ids, start_time, cpt):
-    deps = []
+    Jobs share the process with the executor, hence their output is not captured
+    and they should not change the current working directory.
+    They also share the value cache of the process, which is resized
+    to `value_cache_size` when the runner starts (0 disables it).
+    """
+
+    def __init__(self, n_threads=None, value_cache_size=None):
+        super().__init__()
+        self.n_threads = n_threads or min(32, (os.cpu_count() or 1) + 4)
+        if value_cache_size is None:
+            value_cache_size = DEFAULT_VALUE_CACHE_SIZE
+        self.value_cache_size = value_cache_size
+        # Databases shared by threads of the pool; url -> Database
+        self.dbs = {}
+        self.dbs_lock = threading.Lock()
+
+    def _create_pool(self):
+        _value_cache.resize(self.value_cache_size)
+        return ThreadPoolExecutor(max_workers=self.n_threads)
+
+    def stop(self):
+        super().stop()
+        with self.dbs_lock:
+            dbs = self.dbs
+            self.dbs = {}
+        for db in dbs.values():
+            db.stop()
+
+    def get_db(self, db_path):
+        # Database gives each thread its own connection
+        with self.dbs_lock:
+            db = self.dbs.get(db_path)
+            if db is None:
+                db = open_database(db_path)
+                self.dbs[db_path] = db
+            return db
+
+    def submit(self, runtime, plan_node):
+        builder = runtime.get_builder(plan_node.builder_name)
+        return self.pool.submit(
+            _run_job_in_thread,
+            functools.partial(self.get_db, runtime.db.url),
+            builder,
+            plan_node.job_id,
+            plan_node.ephemeral_inputs,
+        )
+
+    def get_resources(self):
+        return "{} threads".format(self.n_threads)
+
+
+class LocalAsyncRunner(JobRunner):
+    """
+    Runner that executes coroutine builders in an event loop.
+
+    The event loop runs in a separate thread of the executor's process and at most
+    `max_concurrency` jobs are executed concurrently.
+    Database operations and (de)serialization of values are blocking, hence they
+    are performed in the default executor of the loop, so they do not stall
+    the other jobs.
+    """
+
+    def __init__(self, max_concurrency=100):
+        self.max_concurrency = max_concurrency
+        self.loop = None
+        self.thread = None
+        self.db = None
+        self.db_lock = threading.Lock()
+        self.semaphore = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        pass
+
+    def stop(self):
+        with self.lock:
+            if self.loop is None:
+                return
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.loop = None
+            self.thread = None
+
+    def _start_loop(self):
+        with self.lock:
+            if self.loop is not None:
+                return
+            self.loop = asyncio.new_event_loop()
+            self.thread = threading.Thread(target=self._run_loop, args=(self.loop,))
+            self.thread.daemon = True
+            self.thread.start()
+
+    def _run_loop(self, loop):
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_forever()
+            tasks = asyncio.all_tasks(loop)
+            for task in tasks:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            loop.run_until_complete(loop.shutdown_default_executor())
+        finally:
+            if self.db is not None:
+                self.db.stop()
+            self.db = None
+            self.semaphore = None
+            loop.close()
+
+    def get_db(self, db_path):
+        with self.db_lock:
+            if self.db is None or self.db.url != db_path:
+                if self.db is not None:
+                    self.db.stop()
+                self.db = open_database(db_path)
+            return self.db
+
+    def submit(self, runtime, plan_node):
+        self._start_loop()
+        builder = runtime.get_builder(plan_node.builder_name)
+        return asyncio.run_coroutine_threadsafe(
+            _run_async_job(
+                self,
+                runtime.db.url,
+                builder,
+                plan_node.job_id,
+                plan_node.ephemeral_inputs,
+            ),
+            self.loop,
+        )
+
+    def get_resources(self):
+        return "{} async jobs".format(self.max_concurrency)
+
+
+class _FileCapture:
+    """
+    Captures stdout/stderr of the process by redirecting file descriptors
+    into a temporary file.
+
+    In contrast to capturer.CaptureOutput, it does not need a pseudo-terminal
+    nor a relay thread and the output is not kept in memory; only its end
+    (at most `limit` bytes) is read when the capture is finished.
+    """
+
+    COPY_CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, relay, limit=None):
+        self.relay = relay
+        self.limit = limit
+        self.file = None
+        self.saved_fds = None
+        self.output = b""
+
+    def start_capture(self):
+        sys.stdout.flush()
+        sys.stderr.flush()
+        self.file = tempfile.TemporaryFile()
+        self.saved_fds = (os.dup(1), os.dup(2))
+        os.dup2(self.file.fileno(), 1)
+        os.dup2(self.file.fileno(), 2)
+
+    def finish_capture(self):
+        if self.saved_fds is None:
+            return
+        sys.stdout.flush()
+        sys.stderr.flush()
+        stdout_fd, stderr_fd = self.saved_fds
+        self.saved_fds = None
+        os.dup2(stdout_fd, 1)
+        os.dup2(stderr_fd, 2)
+        os.close(stdout_fd)
+        os.close(stderr_fd)
+        if self.relay:
+            self.file.seek(0)
+            while True:
+                data = self.file.read(self.COPY_CHUNK_SIZE)
+                if not data:
+                    break
+                os.write(1, data)
+        self.file.seek(0, os.SEEK_END)
+        size = self.file.tell()
+        if self.limit is not None and size > self.limit:
+            self.file.seek(size - self.limit)
+        else:
+            self.file.seek(0)
+        self.output = _limit_output(self.file.read(), size, self.limit)
+        self.file.close()
+        self.file = None
+
+    def get_bytes(self):
+        return self.output
+
+
+def _limit_output(data, size, limit):
+    if limit is None or size <= limit:
+        return data
+    return "[... {} bytes of output truncated ...]\n".format(
+        size - limit
+    ).encode() + data[-limit:]
+
+
+def _start_capture(job_setup):
+    if job_setup.capture == "none":
+        return None
+    if job_setup.capture == "fd-to-file":
+        cpt = _FileCapture(job_setup.relay, job_setup.max_output_size)
+    else:
+        cpt = capturer.CaptureOutput(relay=job_setup.relay)
+    cpt.start_capture()
+    return cpt
 
+
+def _get_output(cpt, job_setup):
+    if cpt is None:
+        return None
+    if isinstance(cpt, _FileCapture):
+        return cpt.get_bytes()
+    # capturer keeps the whole output in memory, it is limited only here
+    data = cpt.get_bytes()
+    return _limit_output(data, len(data), job_setup.max_output_size)
+
+
+_per_process_db = None
+
+# Deserialized values of dependencies; shared by all jobs in a worker process
+_value_cache = ValueCache()
+
+# Values in shared memory; set in workers of runners with shared memory
+_shared_values = None
+
+
+def _init_worker(value_cache_size, shared_values):
+    global _shared_values
+    _value_cache.resize(value_cache_size)
+    if shared_values:
+        _shared_values = SharedValues()
+
+
+def _make_after_deps(
+    db,
+    job_id,
+    job_setup,
+    deps,
+    keys_to_deps,
+    stats,
+    ephemeral_inputs,
+    prefetch=None,
+):
+    """
+    Returns a function called at the end of the dependency phase of a job.
+    Values are prefetched by `prefetch` (default: `_prefetch_values`).
+    """
     def block_new_jobs(_):
         raise Exception("Builders cannot be called during computation phase")
 
     def after_deps():
         _CONTEXT.on_job = block_new_jobs
-        _CONTEXT.job_context = JobContext(db, job_id)
-        if set(e.key for e in deps) != set(keys_to_job_ids):
+        _CONTEXT.job_context = JobContext(db, job_id, job_setup)
+        if set(e.key for e in deps) != set(keys_to_deps):
             raise Exception(
                 "Builder function does not consistently return dependencies"
             )
+        to_prefetch = {}
         for e in deps:
-            e.set_job_id(keys_to_job_ids[e.key], db, JobState.FINISHED)
+            dep = keys_to_deps[e.key]
+            if dep.value_hash is not None:
+                if (
+                    _shared_values is not None
+                    and dep.value_size >= _shared_values.threshold
+                ):
+                    shared = _shared_values
+                else:
+                    shared = None
+                value_cache = CachedValue(
+                    _value_cache,
+                    (dep.value_hash, dep.value_mime),
+                    dep.value_size,
+                    stats,
+                    shared,
+                )
+            else:
+                value_cache = None
+            e.set_job_id(dep.job_id, db, JobState.FINISHED, dep.value, value_cache)
+            if ephemeral_inputs and dep.job_id in ephemeral_inputs:
+                # Values of ephemeral jobs are not in the database
+                e._set_value(ephemeral_inputs[dep.job_id])
+            elif job_setup.prefetch and dep.value is None:
+                to_prefetch.setdefault(dep.job_id, (value_cache, []))[1].append(e)
+        if to_prefetch:
+            (prefetch or _prefetch_values)(
+                db, to_prefetch, job_setup.prefetch_threads
+            )
+
+    return after_deps
+
+
+def _prefetch_values(db, to_prefetch, n_threads):
+    """
+    Loads values of dependencies by batched queries;
+    `to_prefetch` maps job ids to pairs (CachedValue or None, list of jobs)
+    """
+    values = {}
+    for job_id, (value_cache, _) in to_prefetch.items():
+        if value_cache is not None:
+            found, value = value_cache.lookup()
+            if found:
+                values[job_id] = value
+    blobs = list(
+        db.read_blobs(job_id for job_id in to_prefetch if job_id not in values).items()
+    )
 
-    original_cwd = os.getcwd()
+    def load(item):
+        data, mime = item[1]
+        return loads_value(data, mime)
+
+    if n_threads:
+        with ThreadPoolExecutor(n_threads) as pool:
+            loaded = list(pool.map(load, blobs))
+    else:
+        loaded = [load(item) for item in blobs]
+
+    for (job_id, _), value in zip(blobs, loaded):
+        values[job_id] = value
+        value_cache = to_prefetch[job_id][0]
+        if value_cache is not None:
+            value_cache.store(value)
+    for job_id, (_, jobs) in to_prefetch.items():
+        # Jobs without a value blob have value None
+        value = values.get(job_id)
+        for job in jobs:
+            job._set_value(value)
+
+
+def _finish_job(db, job_id, builder, job_setup, value, start_time, output):
+    """Stores the result of a job; returns the value if it is handed over in memory"""
+    if builder.ephemeral:
+        db.set_ephemeral_finished(
+            job_id, time.time() - start_time, output, job_setup.get_compression()
+        )
+        return value
+    _store_result(db, job_id, job_setup, value, start_time, output)
+    return None
+
+
+def _store_result(db, job_id, job_setup, value, start_time, output):
+    computation_time = time.time() - start_time
+    if value is None:
+        db.set_finished(
+            job_id, None, None, computation_time, output, job_setup.get_compression()
+        )
+        return
+    value_repr = make_repr(value)
+    serializer = find_serializer(value, job_setup.serializer)
+    if serializer.mime != MIME_PICKLE:
+        data = serializer.dumps(value)
+        value_hash = db.set_finished(
+            job_id,
+            data,
+            value_repr,
+            computation_time,
+            output,
+            job_setup.get_compression(),
+            serializer.mime,
+        )
+        _share_value(value_hash, data)
+        return
+    data, buffers = serialize(value)
+    if not buffers:
+        value_hash = db.set_finished(
+            job_id,
+            data,
+            value_repr,
+            computation_time,
+            output,
+            job_setup.get_compression(),
+        )
+        _share_value(value_hash, data)
+        return
+    # Large buffers are written directly into a file without joining them
+    # with the pickled data into a single bytes object
+    with tempfile.TemporaryFile() as f:
+        write_oob(f, data, buffers)
+        value_hash = db.set_finished(
+            job_id,
+            f,
+            value_repr,
+            computation_time,
+            output,
+            job_setup.get_compression(),
+            MIME_PICKLE_OOB,
+        )
+    _share_value(value_hash, data, buffers)
+
+
+def _share_value(value_hash, data, buffers=()):
+    # The value is published only after it is stored in the database,
+    # so the database is always a valid fallback for consumers
+    if _shared_values is not None and value_hash is not None:
+        _shared_values.publish(value_hash, data, buffers)
+
+
+def _job_failed(db, job_id, job_setup, n_attempts, exception, start_time, output):
+    computation_time = time.time() - start_time
+    # The exception is not handled in the current thread for async jobs
+    tb = "".join(
+        traceback.format_exception(type(exception), exception, exception.__traceback__)
+    )
+    t = JobError(job_id, str(exception), tb)
+    if (
+        job_setup is not None
+        and n_attempts < job_setup.retries
+        and isinstance(exception, job_setup.retry_on)
+    ):
+        db.set_retry(job_id, t.message(), computation_time)
+        return JobRetry(job_id, job_setup.get_retry_delay(n_attempts), str(exception))
+    compression = job_setup.get_compression() if job_setup is not None else None
+    db.set_error(job_id, t.message(), computation_time, output, compression)
+    return t
+
+
+def _run_job_timed(
+    db,
+    job_id,
+    builder,
+    job_setup,
+    config,
+    keys_to_deps,
+    start_time,
+    cpt,
+    isolated,
+    stats,
+    ephemeral_inputs,
+):
+    deps = []
+    after_deps = _make_after_deps(
+        db, job_id, job_setup, deps, keys_to_deps, stats, ephemeral_inputs
+    )
     try:
         _CONTEXT.on_job = deps.append
-        with tempfile.TemporaryDirectory() as tmp_dir:
-            os.chdir(tmp_dir)
+        if isolated:
+            original_cwd = os.getcwd()
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                os.chdir(tmp_dir)
+                try:
+                    value = builder.run_with_config(
+                        config, only_deps=False, after_deps=after_deps
+                    )
+                finally:
+                    os.chdir(original_cwd)
+        else:
             value = builder.run_with_config(
                 config, only_deps=False, after_deps=after_deps
             )
     finally:
-        os.chdir(original_cwd)
         _CONTEXT.on_job = None
         _CONTEXT.job_context = None
-        cpt.finish_capture()
-
-    if value is None:
-        value_repr = None
-    else:
-        value_repr = make_repr(value)
-        value = pickle.dumps(value)
-    _per_process_db.set_finished(
-        job_id, value, value_repr, time.time() - start_time, cpt.get_bytes()
+        if cpt:
+            cpt.finish_capture()
+
+    return _finish_job(
+        db,
+        job_id,
+        builder,
+        job_setup,
+        value,
+        start_time,
+        _get_output(cpt, job_setup),
     )
 
 
-def _run_job(db_path, builder_fn, job_id):
-    # Workaround of the clash between jupyter & capturer
-    sys.stdout = sys.__stdout__
-    sys.stderr = sys.__stderr__
+def _execute_job(get_db, builder_fn, job_id, isolated, ephemeral_inputs):
+    """
+    Runs a job and stores its result in the database.
 
+    If isolated is True, the job has the whole process for itself, i.e. its
+    output is captured and it is executed in a temporary working directory.
+    """
     start_time = time.time()
     cpt = None
-    global _per_process_db
+    db = None
+    job_setup = None
+    n_attempts = 0
+    stats = collections.Counter()
     try:
-        if _per_process_db is None:
-            _per_process_db = Database(db_path)
-        job_setup, config, keys_to_job_ids = _per_process_db.set_running(job_id)
-        cpt = capturer.CaptureOutput(relay=job_setup.relay)
-        cpt.start_capture()
+        db = get_db()
+        job_setup, config, keys_to_deps, n_attempts = db.set_running(job_id)
+        if isolated:
+            cpt = _start_capture(job_setup)
+        args = (
+            db,
+            job_id,
+            builder_fn,
+            job_setup,
+            config,
+            keys_to_deps,
+            start_time,
+            cpt,
+            isolated,
+            stats,
+            ephemeral_inputs,
+        )
         if job_setup.timeout is not None:
+            results = []
             thread = threading.Thread(
-                target=_run_job_timed,
-                args=(
-                    _per_process_db,
-                    job_id,
-                    builder_fn,
-                    config,
-                    keys_to_job_ids,
-                    start_time,
-                    cpt,
-                ),
+                target=lambda: results.append(_run_job_timed(*args))
             )
             thread.daemon = True
             thread.start()
             thread.join(job_setup.timeout)
             if thread.is_alive():
                 t = JobTimeout(job_id, job_setup.timeout)
-                _per_process_db.set_error(job_id, t.message(), time.time() - start_time)
+                db.set_error(job_id, t.message(), time.time() - start_time, None)
                 return t
+            value = results[0] if results else None
         else:
-            _run_job_timed(
-                _per_process_db,
+            value = _run_job_timed(*args)
+        if _shared_values is not None:
+            shared_segments = _shared_values.take_published()
+        else:
+            shared_segments = ()
+        return JobFinished(job_id, dict(stats), shared_segments, value)
+    except Exception as exception:
+        if db:
+            return _job_failed(
+                db,
                 job_id,
-                builder_fn,
-                config,
-                keys_to_job_ids,
+                job_setup,
+                n_attempts,
+                exception,
                 start_time,
-                cpt,
+                _get_output(cpt, job_setup),
             )
-        return job_id
-    except Exception as exception:
-        t = JobError(job_id, str(exception), traceback.format_exc())
-        if _per_process_db:
-            _per_process_db.set_error(
+        return JobError(job_id, str(exception), traceback.format_exc(), stored=False)
+
+
+def _run_job(db_path, builder_fn, job_id, ephemeral_inputs=None):
+    # Workaround of the clash between jupyter & capturer
+    sys.stdout = sys.__stdout__
+    sys.stderr = sys.__stderr__
+
+    def get_db():
+        global _per_process_db
+        if _per_process_db is None or _per_process_db.url != db_path:
+            if _per_process_db is not None:
+                _per_process_db.stop()
+            _per_process_db = open_database(db_path)
+        return _per_process_db
+
+    return _execute_job(get_db, builder_fn, job_id, True, ephemeral_inputs)
+
+
+def _run_job_in_thread(get_db, builder_fn, job_id, ephemeral_inputs=None):
+    return _execute_job(get_db, builder_fn, job_id, False, ephemeral_inputs)
+
+
+async def _run_async_job_body(
+    db, job_id, builder, job_setup, config, keys_to_deps, stats, ephemeral_inputs
+):
+    loop = asyncio.get_running_loop()
+    deps = []
+    to_prefetch = []
+    after_deps = _make_after_deps(
+        db,
+        job_id,
+        job_setup,
+        deps,
+        keys_to_deps,
+        stats,
+        ephemeral_inputs,
+        lambda *args: to_prefetch.append(args),
+    )
+
+    async def after_deps_async():
+        after_deps()
+        if to_prefetch:
+            await loop.run_in_executor(None, _prefetch_values, *to_prefetch[0])
+
+    try:
+        _CONTEXT.on_job = deps.append
+        return await builder.run_with_config_async(
+            config, after_deps=after_deps_async
+        )
+    finally:
+        _CONTEXT.on_job = None
+        _CONTEXT.job_context = None
+
+
+async def _run_async_job(runner, db_path, builder, job_id, ephemeral_inputs):
+    # Semaphore is created lazily as it has to be created in the loop's thread
+    if runner.semaphore is None:
+        runner.semaphore = asyncio.Semaphore(runner.max_concurrency)
+    loop = asyncio.get_running_loop()
+    async with runner.semaphore:
+        start_time = time.time()
+        db = None
+        job_setup = None
+        n_attempts = 0
+        stats = collections.Counter()
+        try:
+            db = await loop.run_in_executor(None, runner.get_db, db_path)
+            job_setup, config, keys_to_deps, n_attempts = await loop.run_in_executor(
+                None, db.set_running, job_id
+            )
+            if not builder.is_coroutine_function():
+                raise Exception(
+                    "Builder {!r} is not a coroutine function".format(builder.name)
+                )
+            coro = _run_async_job_body(
+                db,
                 job_id,
-                t.message(),
-                time.time() - start_time,
-                cpt.get_bytes() if cpt else None,
+                builder,
+                job_setup,
+                config,
+                keys_to_deps,
+                stats,
+                ephemeral_inputs,
+            )
+            if job_setup.timeout is not None:
+                try:
+                    value = await asyncio.wait_for(coro, job_setup.timeout)
+                except asyncio.TimeoutError:
+                    t = JobTimeout(job_id, job_setup.timeout)
+                    await loop.run_in_executor(
+                        None,
+                        db.set_error,
+                        job_id,
+                        t.message(),
+                        time.time() - start_time,
+                        None,
+                    )
+                    return t
+            else:
+                value = await coro
+            value = await loop.run_in_executor(
+                None,
+                _finish_job,
+                db,
+                job_id,
+                builder,
+                job_setup,
+                value,
+                start_time,
+                None,
+            )
+            return JobFinished(job_id, dict(stats), (), value)
+        except Exception as exception:
+            if db:
+                return await loop.run_in_executor(
+                    None,
+                    _job_failed,
+                    db,
+                    job_id,
+                    job_setup,
+                    n_attempts,
+                    exception,
+                    start_time,
+                    None,
+                )
+            return JobError(
+                job_id, str(exception), traceback.format_exc(), stored=False
             )
-        return t
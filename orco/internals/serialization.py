@@ -0,0 +1,271 @@
+import io
+import json
+import pickle
+import struct
+
+from orco.consts import (
+    MIME_JSON,
+    MIME_MSGPACK,
+    MIME_NPY,
+    MIME_PARQUET,
+    MIME_PICKLE,
+    MIME_PICKLE_OOB,
+)
+
+# Buffers smaller than this are pickled in-band
+OOB_THRESHOLD = 64 * 1024
+
+_LENGTH = struct.Struct("<Q")
+
+
+def serialize(obj):
+    """
+    Pickles an object by protocol 5. Returns pickled data and a list of
+    large out-of-band buffers (memoryviews into the object, e.g. data
+    of numpy arrays); the list is empty for objects without large buffers.
+    """
+    buffers = []
+
+    def buffer_callback(buffer):
+        try:
+            raw = buffer.raw()
+        except BufferError:
+            # Non-contiguous buffer
+            return True
+        if raw.nbytes < OOB_THRESHOLD:
+            return True
+        buffers.append(raw)
+        return False
+
+    data = pickle.dumps(obj, protocol=5, buffer_callback=buffer_callback)
+    return data, buffers
+
+
+def write_oob(fileobj, data, buffers):
+    """
+    Writes pickled data and out-of-band buffers into a file (MIME_PICKLE_OOB).
+
+    Layout: number of buffers, length of the pickled data, lengths of buffers
+    (all as 64b little-endian integers), pickled data, buffers.
+    """
+    fileobj.write(_LENGTH.pack(len(buffers)))
+    fileobj.write(_LENGTH.pack(len(data)))
+    for buffer in buffers:
+        fileobj.write(_LENGTH.pack(buffer.nbytes))
+    fileobj.write(data)
+    for buffer in buffers:
+        fileobj.write(buffer)
+
+
+def _read_exactly(fileobj, size):
+    data = bytearray(size)
+    view = memoryview(data)
+    pos = 0
+    while pos < size:
+        n = fileobj.readinto(view[pos:])
+        if not n:
+            raise Exception("Unexpected end of a pickled value")
+        pos += n
+    return data
+
+
+def _read_length(fileobj):
+    return _LENGTH.unpack(_read_exactly(fileobj, _LENGTH.size))[0]
+
+
+class Serializer:
+    """
+    Converts values into blobs and back.
+
+    A serializer is selected by its name (see `JobSetup(serializer=...)`)
+    or by the type of a value (see `register_serializer`). The mime type
+    is stored with the blob and it selects the serializer for loading.
+    """
+
+    name = None
+    mime = None
+
+    def dumps(self, value):
+        """Returns bytes with the serialized value"""
+        raise NotImplementedError
+
+    def loads(self, data):
+        raise NotImplementedError
+
+    def load(self, fileobj):
+        """Loads a value from a binary file object"""
+        return self.loads(fileobj.read())
+
+
+class PickleSerializer(Serializer):
+    name = "pickle"
+    mime = MIME_PICKLE
+
+    def dumps(self, value):
+        return pickle.dumps(value, protocol=5)
+
+    def loads(self, data):
+        return pickle.loads(data)
+
+    def load(self, fileobj):
+        return pickle.load(fileobj)
+
+
+class JsonSerializer(Serializer):
+    name = "json"
+    mime = MIME_JSON
+
+    def dumps(self, value):
+        return json.dumps(value).encode()
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class MsgpackSerializer(Serializer):
+    name = "msgpack"
+    mime = MIME_MSGPACK
+
+    def dumps(self, value):
+        import msgpack
+
+        return msgpack.packb(value)
+
+    def loads(self, data):
+        import msgpack
+
+        return msgpack.unpackb(data)
+
+
+class NpySerializer(Serializer):
+    """NumPy arrays in .npy format"""
+
+    name = "npy"
+    mime = MIME_NPY
+
+    def dumps(self, value):
+        import numpy as np
+
+        buf = io.BytesIO()
+        np.lib.format.write_array(buf, np.asanyarray(value), allow_pickle=False)
+        return buf.getvalue()
+
+    def loads(self, data):
+        return self.load(io.BytesIO(data))
+
+    def load(self, fileobj):
+        import numpy as np
+
+        return np.lib.format.read_array(fileobj, allow_pickle=False)
+
+
+class ParquetSerializer(Serializer):
+    """Pandas DataFrames in Parquet format (needs 'pyarrow' or 'fastparquet')"""
+
+    name = "parquet"
+    mime = MIME_PARQUET
+
+    def dumps(self, value):
+        buf = io.BytesIO()
+        value.to_parquet(buf)
+        return buf.getvalue()
+
+    def loads(self, data):
+        import pandas as pd
+
+        return pd.read_parquet(io.BytesIO(data))
+
+
+_SERIALIZERS = {}
+_MIME_SERIALIZERS = {}
+_TYPE_SERIALIZERS = []
+
+
+def register_serializer(serializer, types=()):
+    """
+    Registers a serializer; values of `types` (and their subclasses) are
+    serialized by it when a job does not select a serializer explicitly.
+    Later registrations take precedence. Serializers have to be registered
+    also in processes that load values.
+    """
+    _SERIALIZERS[serializer.name] = serializer
+    _MIME_SERIALIZERS[serializer.mime] = serializer
+    for t in types:
+        _TYPE_SERIALIZERS.append((t, serializer))
+
+
+for _serializer in (
+    PickleSerializer(),
+    JsonSerializer(),
+    MsgpackSerializer(),
+    NpySerializer(),
+    ParquetSerializer(),
+):
+    register_serializer(_serializer)
+
+
+def check_serializer(name):
+    if name not in _SERIALIZERS:
+        raise ValueError(
+            "Invalid serializer {!r}, expected one of {}".format(
+                name, ", ".join(sorted(_SERIALIZERS))
+            )
+        )
+
+
+def find_serializer(value, name=None):
+    """Returns a serializer of the given name or a serializer for the value"""
+    if name is not None:
+        check_serializer(name)
+        return _SERIALIZERS[name]
+    for t, serializer in reversed(_TYPE_SERIALIZERS):
+        if isinstance(value, t):
+            return serializer
+    return _SERIALIZERS["pickle"]
+
+
+def load_value(fileobj, mime):
+    """Loads an object from a binary file with a blob of the given mime"""
+    if mime != MIME_PICKLE_OOB:
+        serializer = _MIME_SERIALIZERS.get(mime)
+        if serializer is None:
+            raise Exception(
+                "Blob exists, but it is not a serialized object, but {}".format(mime)
+            )
+        return serializer.load(fileobj)
+    n_buffers = _read_length(fileobj)
+    data_size = _read_length(fileobj)
+    sizes = [_read_length(fileobj) for _ in range(n_buffers)]
+    data = _read_exactly(fileobj, data_size)
+    # Buffers are read directly into their final memory
+    buffers = [_read_exactly(fileobj, size) for size in sizes]
+    return pickle.loads(data, buffers=buffers)
+
+
+def loads_oob(view):
+    """
+    Loads MIME_PICKLE_OOB data from a memoryview; out-of-band buffers are
+    not copied, they are read-only views into `view`
+    """
+    n_buffers = _LENGTH.unpack_from(view, 0)[0]
+    data_size = _LENGTH.unpack_from(view, _LENGTH.size)[0]
+    pos = _LENGTH.size * 2
+    sizes = [
+        _LENGTH.unpack_from(view, pos + i * _LENGTH.size)[0] for i in range(n_buffers)
+    ]
+    pos += _LENGTH.size * n_buffers
+    data = view[pos : pos + data_size]
+    pos += data_size
+    buffers = []
+    for size in sizes:
+        buffers.append(view[pos : pos + size].toreadonly())
+        pos += size
+    return pickle.loads(data, buffers=buffers)
+
+
+def loads_value(data, mime):
+    """Loads an object from bytes of a blob with the given mime"""
+    serializer = _MIME_SERIALIZERS.get(mime)
+    if serializer is not None:
+        return serializer.loads(data)
+    return load_value(io.BytesIO(data), mime)
@@ -0,0 +1,181 @@
+import collections
+import os
+import struct
+import sys
+import threading
+from multiprocessing import resource_tracker, shared_memory
+
+from orco.consts import MIME_PICKLE_OOB
+
+from .serialization import loads_oob, loads_value, write_oob
+
+# Smaller values are not worth a segment
+SHARED_VALUE_THRESHOLD = 1024 * 1024
+
+# Header of a segment: size of the payload, it is zero until the payload is written
+_HEADER = struct.Struct("<Q")
+
+
+def segment_name(blob_hash):
+    # Names of POSIX shared memory are limited to 31 characters on some systems
+    return "orco-" + blob_hash[:24]
+
+
+def _open_segment(name, size=0):
+    """Creates (size > 0) or attaches a segment that is not tracked by the process"""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, size > 0, size, track=False)
+    shm = shared_memory.SharedMemory(name, size > 0, size)
+    if os.name == "posix":
+        # Segments are owned by the runner that published them, otherwise
+        # the resource tracker of the worker would unlink them at its exit
+        resource_tracker.unregister("/" + shm.name, "shared_memory")
+    return shm
+
+
+def unlink_segment(name):
+    try:
+        # Attached segment is tracked, so unlink() may unregister it
+        shm = shared_memory.SharedMemory(name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+
+class _SegmentWriter:
+    def __init__(self, view):
+        self.view = view
+        self.pos = 0
+
+    def write(self, data):
+        size = memoryview(data).nbytes
+        self.view[self.pos : self.pos + size] = memoryview(data).cast("B")
+        self.pos += size
+        return size
+
+
+class SharedValues:
+    """
+    Host-local store of serialized values in shared memory segments;
+    it lives in each worker process of a runner with shared memory.
+
+    A value is published under the hash of its blob after the job is finished
+    in the database, so the database remains the source of truth and consumers
+    that do not find a segment (or find it incomplete) read the database.
+    Out-of-band buffers of pickled values (e.g. NumPy arrays) are mapped
+    directly into the segment as read-only buffers.
+    """
+
+    def __init__(self, threshold=SHARED_VALUE_THRESHOLD):
+        self.threshold = threshold
+        self.published = []
+        # Attached segments that may be still referenced by loaded values
+        self.attached = {}
+
+    def publish(self, blob_hash, data, buffers=()):
+        if buffers:
+            size = (
+                _HEADER.size * (2 + len(buffers))
+                + len(data)
+                + sum(b.nbytes for b in buffers)
+            )
+        else:
+            size = len(data)
+        if size < self.threshold:
+            return
+        name = segment_name(blob_hash)
+        try:
+            shm = _open_segment(name, _HEADER.size + size)
+        except OSError:
+            # The same value was already published or there is no space for it
+            return
+        view = shm.buf[_HEADER.size : _HEADER.size + size]
+        try:
+            if buffers:
+                write_oob(_SegmentWriter(view), data, buffers)
+            else:
+                view[:] = data
+        except BaseException:
+            view.release()
+            shm.close()
+            unlink_segment(name)
+            raise
+        view.release()
+        _HEADER.pack_into(shm.buf, 0, size)
+        shm.close()
+        self.published.append((name, size))
+
+    def take_published(self):
+        published = self.published
+        self.published = []
+        return published
+
+    def load(self, blob_hash, mime):
+        """Returns a pair (True, value) if the value is published, otherwise (False, None)"""
+        self._release_unused()
+        name = segment_name(blob_hash)
+        try:
+            shm = _open_segment(name)
+        except FileNotFoundError:
+            return False, None
+        size = _HEADER.unpack_from(shm.buf, 0)[0]
+        if size == 0:
+            # The value is being written
+            shm.close()
+            return False, None
+        view = shm.buf[_HEADER.size : _HEADER.size + size]
+        if mime != MIME_PICKLE_OOB:
+            try:
+                return True, loads_value(bytes(view), mime)
+            finally:
+                view.release()
+                shm.close()
+        self.attached[name] = shm
+        return True, loads_oob(view)
+
+    def _release_unused(self):
+        for name, shm in list(self.attached.items()):
+            try:
+                shm.close()
+            except BufferError:
+                # A loaded value still uses the segment
+                continue
+            del self.attached[name]
+
+
+class SharedSegments:
+    """
+    Segments published by workers of a runner; the runner unlinks the oldest
+    ones when their total size exceeds `max_size` and all of them when it stops.
+    Consumers that already mapped a segment are not affected by unlinking.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.segments = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def add(self, segments):
+        to_unlink = []
+        with self.lock:
+            for name, size in segments:
+                if name in self.segments:
+                    continue
+                self.segments[name] = size
+                self.size += size
+            while self.size > self.max_size:
+                name, size = self.segments.popitem(last=False)
+                self.size -= size
+                to_unlink.append(name)
+        for name in to_unlink:
+            unlink_segment(name)
+
+    def release_all(self):
+        with self.lock:
+            names = list(self.segments)
+            self.segments.clear()
+            self.size = 0
+        for name in names:
+            unlink_segment(name)
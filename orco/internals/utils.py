@@ -15,11 +15,43 @@ def make_repr(value):
     return repr_value
 
 
+import asyncio
+import contextvars
 import inspect
+import threading
 
 import cloudpickle
 
 
+def run_coroutine(coro):
+    """
+    Run a coroutine to completion from a synchronous code and return its result.
+
+    If an event loop is already running in the current thread (e.g. in Jupyter),
+    the coroutine is executed in a new event loop in a helper thread.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+
+    context = contextvars.copy_context()
+    result = [None, None]
+
+    def run():
+        try:
+            result[0] = context.run(asyncio.run, coro)
+        except BaseException as e:
+            result[1] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    if result[1] is not None:
+        raise result[1]
+    return result[0]
+
+
 class CloudWrapper:
     """
     Wraps a callable so that cloudpickle is used to pickle it, caching the pickle.
@@ -36,8 +68,8 @@ class CloudWrapper:
         # Forget pickled_fn if it should not be cached
         if pickled_fn is not None and not cache:
             pickled_fn = None
-        if inspect.isasyncgen(fn):
-            raise TypeError("async functions not supported")
+        if inspect.isasyncgenfunction(fn):
+            raise TypeError("async generator functions not supported")
 
         self.fn = fn
         self.pickled_fn = pickled_fn
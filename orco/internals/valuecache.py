@@ -0,0 +1,107 @@
+import collections
+import threading
+
+# Default limit of the total (serialized) size of cached values in bytes;
+# 0 disables the cache. The cache is opt-in because cached objects are shared
+# by all jobs computed by a worker.
+DEFAULT_VALUE_CACHE_SIZE = 0
+
+
+class ValueCache:
+    """
+    LRU cache of deserialized values of finished jobs.
+
+    Values are keyed by the hash and mime type of the stored value, so a cached
+    value cannot become stale (values of finished jobs are immutable and a job
+    with a reused id has a different hash). The size of a value is
+    approximated by the size of its serialized form.
+
+    Note that cached objects are shared by all jobs of a worker that read them,
+    hence jobs must not modify values of their dependencies.
+    The cache is disabled when `max_size` is 0.
+    """
+
+    def __init__(self, max_size=DEFAULT_VALUE_CACHE_SIZE):
+        self.max_size = max_size
+        self.size = 0
+        self.values = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            item = self.values.get(key)
+            if item is None:
+                return default
+            self.values.move_to_end(key)
+            return item[0]
+
+    def put(self, key, value, size):
+        if not self.max_size or size > self.max_size:
+            return
+        with self.lock:
+            old = self.values.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self.values[key] = (value, size)
+            self.size += size
+            while self.size > self.max_size:
+                _, (_, s) = self.values.popitem(last=False)
+                self.size -= s
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+            self.size = 0
+
+    def resize(self, max_size):
+        with self.lock:
+            self.max_size = max_size
+            while self.size > max_size:
+                _, (_, s) = self.values.popitem(last=False)
+                self.size -= s
+
+
+class CachedValue:
+    """
+    Loads a value of a dependency through a value cache and counts hits;
+    values missing in the cache are looked up in `shared` (SharedValues) if given.
+    """
+
+    __slots__ = ("cache", "key", "size", "stats", "shared")
+
+    def __init__(self, cache, key, size, stats, shared=None):
+        self.cache = cache
+        self.key = key
+        self.size = size
+        self.stats = stats
+        self.shared = shared
+
+    def get(self, load_fn):
+        found, value = self.lookup()
+        if found:
+            return value
+        value = load_fn()
+        self.store(value)
+        return value
+
+    def lookup(self):
+        """Returns a pair (True, value) on a hit and (False, None) on a miss"""
+        value = self.cache.get(self.key, _MISSING)
+        if value is not _MISSING:
+            self.stats["value_cache_hits"] += 1
+            return True, value
+        if self.shared is not None:
+            found, value = self.shared.load(*self.key)
+            if found:
+                self.stats["shared_memory_hits"] += 1
+                self.cache.put(self.key, value, self.size)
+                return True, value
+        return False, None
+
+    def store(self, value):
+        """Stores a value loaded after a miss"""
+        self.stats["value_cache_misses"] += 1
+        self.cache.put(self.key, value, self.size)
+
+
+_MISSING = object()
@@ -1,11 +1,12 @@
 import collections
 import enum
-import io
 import os
 import pickle
+import shutil
 import tarfile
 
-from orco.consts import MIME_PICKLE, MIME_TEXT
+from orco.consts import MIME_TEXT
+from orco.internals.serialization import load_value
 
 
 class JobState(enum.Enum):
@@ -27,7 +28,8 @@ ACTIVE_STATES = (
 )
 
 JobMetadata = collections.namedtuple(
-    "EntryMetadata", ["created_date", "computation_time", "finished_date", "job_setup"]
+    "EntryMetadata",
+    ["created_date", "computation_time", "finished_date", "job_setup", "attempts"],
 )
 
 
@@ -57,7 +59,17 @@ class Job:
     * comp_time - time of computation when job was created, or None if job was inserted
     """
 
-    __slots__ = ("builder_name", "key", "config", "state", "_value", "_job_id", "_db")
+    __slots__ = (
+        "builder_name",
+        "key",
+        "config",
+        "state",
+        "_value",
+        "_pickled_value",
+        "_value_cache",
+        "_job_id",
+        "_db",
+    )
 
     def __init__(self, builder_name, key, config):
         self.builder_name = builder_name
@@ -68,6 +80,8 @@ class Job:
         self._job_id = None
         self._db = None
         self._value = _NO_VALUE
+        self._pickled_value = None
+        self._value_cache = None
 
     @property
     def value(self):
@@ -77,39 +91,65 @@ class Job:
         value = self._value
         if value is not _NO_VALUE:
             return value
-        value, mime = self._db.get_blob(self._job_id, None)
-        if value is None:
-            self._value = None
-            return None
-        value = pickle.loads(value)
+        if self._pickled_value is not None:
+            # Small value read together with the job
+            value = pickle.loads(self._pickled_value)
+            self._pickled_value = None
+        elif self._value_cache is not None:
+            value = self._value_cache.get(self._load_value)
+        else:
+            value = self._load_value()
         self._value = value
         return value
 
+    def _set_value(self, value):
+        """Sets an already loaded value of a finished job"""
+        self._value = value
+        self._pickled_value = None
+
+    def _load_value(self):
+        f, mime = self._db.open_blob(self._job_id, None)
+        if f is None:
+            return None
+        with f:
+            return load_value(f, mime)
+
     def is_attached(self):
         return self._job_id is not None
 
     def detach(self):
         self._job_id = None
         self._db = None
+        self._pickled_value = None
+        self._value_cache = None
         self.state = JobState.DETACHED
 
-    def set_job_id(self, job_id, db, state):
+    def set_job_id(self, job_id, db, state, pickled_value=None, value_cache=None):
+        """
+        Attaches the job to a job in the database; `pickled_value` is the value
+        of a finished job if it was already read from the database and
+        `value_cache` is a `CachedValue` used for loading the value.
+        """
         assert self._job_id is None
         self.state = state
         self._job_id = job_id
         self._db = db
+        self._pickled_value = pickled_value
+        self._value_cache = value_cache
 
     def metadata(self):
         self._check_attached()
         return self._db.read_metadata(self._job_id)
 
     def get_object(self, name, default=_NO_VALUE):
-        value, mime = self.get_blob(name, default)
-        if mime != MIME_PICKLE:
-            raise Exception(
-                "Blob exists, but is not pickled object, but {}".format(mime)
-            )
-        return pickle.loads(value)
+        self._check_attached()
+        f, mime = self._db.open_blob(self._job_id, name)
+        if f is None:
+            if default is _NO_VALUE:
+                raise Exception("Blob '{}' not found".format(name))
+            return default
+        with f:
+            return load_value(f, mime)
 
     def get_text(self, name):
         value, mime = self.get_blob(name)
@@ -130,23 +170,57 @@ class Job:
             return default
         return value, mime
 
+    def open_blob(self, name):
+        """
+        Returns a binary file object with the content of a blob.
+
+        Blobs in a blob store are read directly from the store
+        without loading them into memory.
+        """
+        self._check_attached()
+        f, mime = self._db.open_blob(self._job_id, name)
+        if f is None:
+            raise Exception("Blob '{}' not found".format(name))
+        return f
+
+    def get_array(self, name, mmap=True):
+        """
+        Returns a NumPy array attached by `orco.ext.numpy.attach_array`.
+        See `orco.ext.numpy.get_array`.
+        """
+        from orco.ext.numpy import get_array
+
+        return get_array(self, name, mmap)
+
+    def get_table(self, name, columns=None, filter=None):
+        """
+        Returns a table attached by `orco.ext.arrow.attach_table`.
+        See `orco.ext.arrow.get_table`.
+        """
+        from orco.ext.arrow import get_table
+
+        return get_table(self, name, columns, filter)
+
     def get_blob_as_file(self, name, target=None):
-        value, _ = self.get_blob(name)
         if target is None:
             target = name
-        with open(target, "wb") as f:
-            f.write(value)
+        with self.open_blob(name) as src, open(target, "wb") as f:
+            shutil.copyfileobj(src, f)
 
     def extract_tar(self, name, target=None):
-        value, mime = self.get_blob(name)
-        if mime != "application/tar":
-            raise Exception("Blob is not tar archive")
-        if target is None:
-            target = name
-        if not os.path.isdir(target):
-            os.makedirs(target)
-        with tarfile.TarFile(fileobj=io.BytesIO(value)) as tf:
-            tf.extractall(target)
+        self._check_attached()
+        f, mime = self._db.open_blob(self._job_id, name)
+        if f is None:
+            raise Exception("Blob '{}' not found".format(name))
+        with f:
+            if mime != "application/tar":
+                raise Exception("Blob is not tar archive")
+            if target is None:
+                target = name
+            if not os.path.isdir(target):
+                os.makedirs(target)
+            with tarfile.open(fileobj=f, mode="r|") as tf:
+                tf.extractall(target)
 
     def _check_attached(self):
         if self._job_id is None:
@@ -1,16 +1,19 @@
 import io
 import mimetypes
 import os
-import pickle
+import shutil
 import tarfile
+import tempfile
 
-from .consts import MIME_PICKLE, MIME_BYTES, MIME_TEXT
+from .consts import MIME_PICKLE, MIME_PICKLE_OOB, MIME_BYTES, MIME_TEXT
 from .internals.context import _CONTEXT
+from .internals.database import CHUNK_SIZE
+from .internals.serialization import find_serializer, serialize, write_oob
 from .internals.utils import make_repr
 
 
 def _get_job_context(caller):
-    if not hasattr(_CONTEXT, "job_context") or _CONTEXT.job_context is None:
+    if _CONTEXT.job_context is None:
         raise Exception(
             "Function '{}' cannot be called outside of computation part of a builder's function".format(
                 caller
@@ -19,6 +22,35 @@ def _get_job_context(caller):
     return _CONTEXT.job_context
 
 
+def _insert_blob(jc, name, data, mime, repr_value):
+    jc.db.insert_blob(
+        jc.job_id, name, data, mime, repr_value, jc.job_setup.get_compression()
+    )
+
+
+async def deps_done():
+    """
+    Finish the dependency phase of a coroutine builder.
+
+    It has to be awaited exactly once in every coroutine builder; builders called
+    before it are dependencies of the job, the code after it is the computation phase.
+
+    >>> @orco.builder()
+    ... async def my_builder(x):
+    ...     dep = other_builder(x)
+    ...     await orco.deps_done()
+    ...     return await process(dep.value)
+    """
+    on_deps_done = _CONTEXT.on_deps_done
+    if on_deps_done is None:
+        raise Exception(
+            "Function 'deps_done' can be awaited only in a coroutine builder"
+        )
+    result = on_deps_done()
+    if result is not None:
+        await result
+
+
 def _validate_name(name):
     if not isinstance(name, str):
         raise Exception("Name has to be a string, not {}".format(type(name)))
@@ -33,11 +65,23 @@ def attach_object(name, obj):
     Attach object to a current job.
 
     Object is pickled and save under specified name.
-    Mime type is set to 'application/python.pickle'
+    Mime type is set to 'application/python.pickle'; objects with large
+    buffers (e.g. numpy arrays) are stored with out-of-band buffers
+    and mime type 'application/python.pickle-oob'. Objects of types with
+    a registered serializer (see `register_serializer`) are stored by it.
     """
     _validate_name(name)
     jc = _get_job_context("attach_object")
-    jc.db.insert_blob(jc.job_id, name, pickle.dumps(obj), MIME_PICKLE, make_repr(obj))
+    serializer = find_serializer(obj)
+    if serializer.mime != MIME_PICKLE:
+        _insert_blob(jc, name, serializer.dumps(obj), serializer.mime, make_repr(obj))
+        return
+    data, buffers = serialize(obj)
+    if not buffers:
+        _insert_blob(jc, name, data, MIME_PICKLE, make_repr(obj))
+        return
+    with BlobWriter(jc, name, MIME_PICKLE_OOB, make_repr(obj)) as w:
+        write_oob(w, data, buffers)
 
 
 def attach_bytes(name, data, mime=MIME_BYTES, repr=None):
@@ -48,7 +92,7 @@ def attach_bytes(name, data, mime=MIME_BYTES, repr=None):
     """
     _validate_name(name)
     jc = _get_job_context("attach_bytes")
-    jc.db.insert_blob(jc.job_id, name, data, mime, repr)
+    _insert_blob(jc, name, data, mime, repr)
 
 
 def attach_text(name, text):
@@ -59,39 +103,101 @@ def attach_text(name, text):
     """
     _validate_name(name)
     jc = _get_job_context("attach_text")
-    jc.db.insert_blob(jc.job_id, name, text.encode(), MIME_TEXT, None)
+    _insert_blob(jc, name, text.encode(), MIME_TEXT, None)
+
+
+class BlobWriter(io.RawIOBase):
+    """
+    Writable file object returned by `attach_stream`.
+
+    Written data are spooled into a temporary file (small data stay in memory)
+    and the blob is inserted when the writer is closed.
+    """
+
+    def __init__(self, jc, name, mime, repr):
+        self.jc = jc
+        self.name = name
+        self.mime = mime
+        self.repr = repr
+        self.file = tempfile.SpooledTemporaryFile(max_size=CHUNK_SIZE)
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.file.write(data)
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            jc = self.jc
+            jc.db.insert_blob_from_file(
+                jc.job_id,
+                self.name,
+                self.file,
+                self.mime,
+                self.repr,
+                jc.job_setup.get_compression(),
+            )
+        finally:
+            self.file.close()
+            super().close()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            # Discard incomplete data
+            self.file.close()
+            super().close()
+        else:
+            self.close()
+
+
+def attach_stream(name, mime=MIME_BYTES, repr=None):
+    """
+        Attach data written into a file object to a current job.
+
+        Returns a writable binary file object; the blob is stored when it is
+        closed. Data are never kept in memory as a whole, so the function
+        may be used for data larger than memory.
+
+        >>> with orco.attach_stream("output") as f:
+        ...     for part in parts:
+        ...         f.write(part)
+    """
+    _validate_name(name)
+    jc = _get_job_context("attach_stream")
+    return BlobWriter(jc, name, mime, repr)
 
 
 def attach_directory(path, name=None, repr=None):
     """
         Attach a directory to a current job as tar archive.
     """
-    jc = _get_job_context("attach_directory")
+    _get_job_context("attach_directory")
     if not os.path.isdir(path):
         raise Exception("Path '{}' is not a directory.".format(path))
     if name is None:
         name = path
-    _validate_name(name)
-    buf = io.BytesIO()
-    with tarfile.TarFile(mode="x", fileobj=buf) as tf:
-        for f in os.listdir(path):
-            tf.add(os.path.join(path, f), f)
-    buf.seek(0)
-    jc.db.insert_blob(jc.job_id, name, buf.read(), "application/tar", repr)
+    with attach_stream(name, "application/tar", repr) as w:
+        with tarfile.open(fileobj=w, mode="w|") as tf:
+            for f in os.listdir(path):
+                tf.add(os.path.join(path, f), f)
 
 
 def attach_file(filename, name=None, mime=None, repr=None):
     """
         Attach a file to a current job.
     """
-    jc = _get_job_context("attach_file")
-    with open(filename, "rb") as f:
-        data = f.read()
+    _get_job_context("attach_file")
     if name is None:
         name = filename
-    _validate_name(name)
     if mime is None:
         mime, _encoding = mimetypes.guess_type(filename)
         if mime is None:
             mime = MIME_BYTES
-    jc.db.insert_blob(jc.job_id, name, data, mime, repr)
+    with open(filename, "rb") as f, attach_stream(name, mime, repr) as w:
+        shutil.copyfileobj(f, w)
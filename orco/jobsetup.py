@@ -1,3 +1,9 @@
+from .internals.compression import check_codec
+from .internals.serialization import check_serializer
+
+CAPTURE_MODES = ("none", "fd-to-file", "pty")
+
+
 class JobSetup:
     """
     Structure for configuring Job computation.
@@ -7,22 +13,128 @@ class JobSetup:
     - timeout (int|None): Time limit (in seconds) for computation. If the computation is not finished
                before the limit, an exception is thrown. Default: No time limit.
     - relay (bool): If true, stdout/stderr, redirect output also into the executor's console.
+    - capture (str): How stdout/stderr of the job is captured:
+               "pty" (default) - output is captured through a pseudo-terminal
+                   (the whole output is kept in memory),
+               "fd-to-file" - output is redirected into a temporary file,
+               "none" - output is not captured.
+    - max_output_size (int|None): Maximal size (in bytes) of captured output stored with the job.
+               When the output is larger, only its end is stored. Default: No limit.
+    - retries (int): How many times a failed job is computed again before it is marked as failed.
+    - retry_delay (float): Delay (in seconds) before the first retry.
+    - retry_backoff (float): Multiplier of the delay for each next retry.
+    - retry_on (tuple): Exception types that cause a retry. Default: All exceptions.
+               Timeouts are never retried.
+    - compression (str|None): Codec used for compressing the value, attached blobs and
+               captured output of the job: "zlib", "lzma" or "zstd" (needs package
+               'zstandard'). Default: No compression.
+    - compression_threshold (int): Blobs smaller than this size (in bytes) are not compressed.
+    - serializer (str|None): Name of a serializer of the job's value: "pickle", "json",
+               "msgpack", "npy", "parquet" or a name of a registered serializer.
+               Default: Serializer registered for the type of the value, otherwise pickle.
+    - prefetch (bool): If true, values of all dependencies are loaded by batched queries
+               when the computation phase of the job starts.
+    - prefetch_threads (int): If positive, prefetched values are deserialized in a pool
+               of threads of this size.
     """
 
-    __slots__ = ("runner_name", "timeout", "setup", "relay", "exclusive")
+    __slots__ = (
+        "runner_name",
+        "timeout",
+        "setup",
+        "relay",
+        "exclusive",
+        "capture",
+        "max_output_size",
+        "retries",
+        "retry_delay",
+        "retry_backoff",
+        "retry_on",
+        "compression",
+        "compression_threshold",
+        "serializer",
+        "prefetch",
+        "prefetch_threads",
+    )
 
-    def __init__(self, runner_name="local", *, timeout=None, relay=False, setup=None, exclusive=False):
+    def __init__(
+        self,
+        runner_name="local",
+        *,
+        timeout=None,
+        relay=False,
+        setup=None,
+        exclusive=False,
+        capture="pty",
+        max_output_size=None,
+        retries=0,
+        retry_delay=1.0,
+        retry_backoff=2.0,
+        retry_on=(Exception,),
+        compression=None,
+        compression_threshold=1024,
+        serializer=None,
+        prefetch=False,
+        prefetch_threads=0
+    ):
         assert timeout is None or isinstance(timeout, float) or isinstance(timeout, int)
         assert isinstance(relay, bool)
         assert isinstance(exclusive, bool)
+        assert max_output_size is None or isinstance(max_output_size, int)
+        assert isinstance(retries, int) and retries >= 0
+        assert retry_delay >= 0 and retry_backoff >= 1
+        if isinstance(retry_on, type):
+            retry_on = (retry_on,)
+        assert isinstance(retry_on, tuple)
+        assert isinstance(compression_threshold, int) and compression_threshold >= 0
+        assert isinstance(prefetch, bool)
+        assert isinstance(prefetch_threads, int) and prefetch_threads >= 0
+        if compression is not None:
+            check_codec(compression)
+        if serializer is not None:
+            check_serializer(serializer)
+        if capture not in CAPTURE_MODES:
+            raise ValueError(
+                "Invalid capture mode {!r}, expected one of {}".format(
+                    capture, ", ".join(CAPTURE_MODES)
+                )
+            )
 
         self.runner_name = runner_name
         self.timeout = timeout
         self.setup = setup
         self.relay = relay
         self.exclusive = exclusive
+        self.capture = capture
+        self.max_output_size = max_output_size
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.retry_backoff = retry_backoff
+        self.retry_on = retry_on
+        self.compression = compression
+        self.compression_threshold = compression_threshold
+        self.serializer = serializer
+        self.prefetch = prefetch
+        self.prefetch_threads = prefetch_threads
+
+    def get_retry_delay(self, attempt):
+        """Returns the delay before the retry that follows the given (0-based) attempt"""
+        return self.retry_delay * self.retry_backoff ** attempt
+
+    def get_compression(self):
+        """Returns compression policy for Database.insert_blob"""
+        if self.compression is None:
+            return None
+        return self.compression, self.compression_threshold
+
+    def __setstate__(self, state):
+        # Job setups pickled by older versions do not contain all attributes
+        self.__init__()
+        _, slots = state
+        for name, value in slots.items():
+            setattr(self, name, value)
 
     def __repr__(self):
-        return "<JobSetup runner={} timeout={} relay={} exclusive={}>".format(
-            self.runner_name, self.timeout, self.relay, self.exclusive
+        return "<JobSetup runner={} timeout={} relay={} exclusive={} capture={}>".format(
+            self.runner_name, self.timeout, self.relay, self.exclusive, self.capture
         )
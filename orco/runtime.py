@@ -4,7 +4,8 @@ import threading
 import time
 
 from .builder import Builder, BuilderProxy
-from .internals.database import Database, JobState
+from .internals.blobstore import FsBlobStore
+from .internals.database import JobState, open_database
 from .internals.executor import Executor
 from .internals.key import make_key
 from .internals.plan import Plan
@@ -37,13 +38,53 @@ class Runtime:
     For Postgress:
 
     >>> runtime = Runtime("postgresql://<USERNAME>:<PASSWORD>@<HOSTNAME>/<DATABASE>")
+
+    With `daemon`, computations are not executed by a new executor but they are
+    sent to a daemon started by `python3 -m orco daemon`. The value is a path to the daemon's
+    socket or True for the default path.
+
+    With `blob_store`, large blob bodies are stored outside of the database.
+    The value is a path to a directory (see `FsBlobStore`) or an instance of
+    `BlobStore`. The setting is stored in the database, hence it is used by all
+    runtimes and workers that open the database afterwards.
+
+    With `sqlite_profile`, connections to a SQLite file are configured by
+    the given profile; "fast" uses WAL journal (readers like the browser
+    do not block workers), relaxed synchronization, memory mapping and
+    a longer busy timeout. It is also stored in the database.
+
+    With `value_cache_size` (in bytes of serialized data), workers keep
+    caches of deserialized values of dependencies, so a value used by many
+    jobs is loaded only once. The caches are disabled by default (0). When
+    they are enabled, the same deserialized object is given to all jobs that
+    use it in a worker, hence a job that modifies a value of its dependency
+    changes it also for other jobs.
+
+    A runtime may be used from more threads (e.g. reading or computing jobs
+    concurrently); each thread uses its own database connection.
     """
 
     def __init__(
-        self, db_path: str, global_builders=True, executor_name=None, n_processes=None
+        self,
+        db_path: str,
+        global_builders=True,
+        executor_name=None,
+        n_processes=None,
+        daemon=None,
+        blob_store=None,
+        sqlite_profile=None,
+        value_cache_size=None,
     ):
-        self.db = Database(db_path)
+        self.db = open_database(db_path)
+        if daemon and self.db.is_memory:
+            raise Exception("In-memory database cannot be used with a daemon")
         self.db.init()
+        if blob_store is not None:
+            if isinstance(blob_store, str):
+                blob_store = FsBlobStore(blob_store)
+            self.db.set_blob_store(blob_store)
+        if sqlite_profile is not None:
+            self.db.set_sqlite_profile(sqlite_profile)
 
         self._builders = {}
         self._lock = threading.Lock()
@@ -53,8 +94,10 @@ class Runtime:
         self.executor_args = {
             "name": executor_name,
             "n_processes": n_processes,
+            "value_cache_size": value_cache_size,
         }
         self.runners = {}
+        self.daemon = daemon
 
         logging.debug("Starting runtime %s (db=%s)", self, db_path)
 
@@ -76,6 +119,8 @@ class Runtime:
     def add_runner(self, name, runner):
         if self.executor:
             raise Exception("Runners cannot be added when the executor is started")
+        if self.daemon:
+            raise Exception("Runners of a daemon cannot be changed by its clients")
         assert isinstance(runner, JobRunner)
         assert isinstance(name, str)
         if name in self.runners:
@@ -94,7 +139,16 @@ class Runtime:
         if self.executor:
             raise Exception("Executor is already dunning")
         logger.debug("Registering executor %s")
-        executor = Executor(self, self.runners, **self.executor_args)
+        if self.daemon:
+            from .internals.daemon import DaemonExecutor, default_socket_path
+
+            if self.daemon is True:
+                socket_path = default_socket_path()
+            else:
+                socket_path = self.daemon
+            executor = DaemonExecutor(self, socket_path)
+        else:
+            executor = Executor(self, self.runners, **self.executor_args)
         executor.start()
         self.executor = executor
         return executor
@@ -149,25 +203,41 @@ class Runtime:
 
     def try_read(self, job, reattach=False):
         _check_unattached_job(job, reattach)
-        job_id, state = self.db.get_active_job_id_and_state(job.key)
-        if state != JobState.FINISHED:
+        r = self.db.read_finished([job.key]).get(job.key)
+        if r is None:
             return None
-        job.set_job_id(job_id, self.db, state)
+        job_id, value = r
+        job.set_job_id(job_id, self.db, JobState.FINISHED, value)
         return job
 
     def read_jobs(self, job):
         return self.db.read_jobs(job.key, job.builder_name)
 
     def read_many(self, jobs, *, reattach=False, drop_missing=False):
-        # TODO: Read from DB in one query
+        jobs = list(jobs)
+        for job in jobs:
+            _check_unattached_job(job, reattach)
+        finished = self.db.read_finished(job.key for job in jobs)
         results = []
         for job in jobs:
-            if self.try_read(job, reattach):
+            r = finished.get(job.key)
+            if r is not None:
+                job_id, value = r
+                job.set_job_id(job_id, self.db, JobState.FINISHED, value)
                 results.append(job)
             elif not drop_missing:
                 results.append(None)
         return results
 
+    def concat_tables(self, jobs, name, columns=None, filter=None):
+        """
+        Concatenates tables attached to jobs by `orco.ext.arrow.attach_table`.
+        See `orco.ext.arrow.concat_tables`.
+        """
+        from orco.ext.arrow import concat_tables
+
+        return concat_tables(self, jobs, name, columns, filter)
+
     def drop(self, job, drop_inputs=False):
         return self.drop_many([job], drop_inputs)
 
@@ -275,8 +345,10 @@ class Runtime:
         for job in jobs:
             _check_unattached_job(job, reattach)
 
-        if self.executor is None:
-            self.start_executor()
+        # Runtime may be used from more threads, the executor is started only once
+        with self._lock:
+            if self.executor is None:
+                self.start_executor()
 
         plan = Plan(jobs, continue_on_error)
 
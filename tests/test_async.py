@@ -0,0 +1,156 @@
+import asyncio
+import time
+
+import pytest
+
+import orco
+from orco import JobFailedException, JobSetup, attach_text, builder, deps_done
+from orco.internals.database import Database
+
+
+def test_async_builder(env):
+    @builder()
+    def sync_dep(x):
+        return x + 1
+
+    @builder()
+    async def fetch(x):
+        await asyncio.sleep(0.01)
+        await deps_done()
+        await asyncio.sleep(0.5)
+        attach_text("info", "fetched {}".format(x))
+        return x * 2
+
+    @builder()
+    async def collect(n):
+        items = [fetch(x) for x in range(n)]
+        d = sync_dep(n)
+        await deps_done()
+        return sum(i.value for i in items) + d.value
+
+    runtime = env.test_runtime()
+
+    start = time.time()
+    r = runtime.compute(collect(50))
+    end = time.time()
+    assert r.value == 2 * sum(range(50)) + 51
+    assert end - start < 10
+    assert r.metadata().job_setup.runner_name == "asyncio"
+
+    f = runtime.read(fetch(3))
+    assert f.value == 6
+    assert f.get_text("info") == "fetched 3"
+
+
+def test_async_builder_concurrency(env):
+    @builder()
+    async def sleeper(x):
+        await deps_done()
+        await asyncio.sleep(1)
+        return x
+
+    runtime = env.test_runtime()
+    start = time.time()
+    jobs = runtime.compute_many([sleeper(x) for x in range(200)])
+    end = time.time()
+    assert [j.value for j in jobs] == list(range(200))
+    assert end - start < 5
+
+
+def test_async_builder_concurrency_limit(env):
+    @builder()
+    async def sleeper(x):
+        await deps_done()
+        await asyncio.sleep(0.5)
+        return x
+
+    runtime = env.test_runtime()
+    runtime.add_runner("asyncio", orco.internals.runner.LocalAsyncRunner(2))
+    start = time.time()
+    runtime.compute_many([sleeper(x) for x in range(6)])
+    end = time.time()
+    assert 1.5 <= end - start < 3
+
+
+def test_async_builder_errors(env):
+    @builder()
+    async def no_deps_done(x):
+        return x
+
+    @builder()
+    async def failing(x):
+        await deps_done()
+        raise Exception("MyError")
+
+    @builder(job_setup=JobSetup("asyncio", timeout=0.5))
+    async def slow(x):
+        await deps_done()
+        await asyncio.sleep(5)
+
+    runtime = env.test_runtime()
+    with pytest.raises(Exception, match="did not await deps_done"):
+        runtime.compute(no_deps_done(1))
+    with pytest.raises(JobFailedException, match="MyError"):
+        runtime.compute(failing(1))
+    with pytest.raises(JobFailedException, match="timeouted"):
+        runtime.compute(slow(1))
+
+
+def test_async_builder_catching_exceptions(env):
+    @builder()
+    def sync_dep(x):
+        return x + 1
+
+    @builder()
+    async def guarded(x):
+        d = sync_dep(x)
+        try:
+            await deps_done()
+        except Exception:
+            pass
+        return d.value * 2
+
+    runtime = env.test_runtime()
+    assert runtime.compute(guarded(1)).value == 4
+
+
+def test_async_database_does_not_block_loop(env, monkeypatch):
+    @builder()
+    async def item(x):
+        await deps_done()
+        return x
+
+    set_running = Database.set_running
+
+    def slow_set_running(self, job_id):
+        time.sleep(0.3)
+        return set_running(self, job_id)
+
+    runtime = env.test_runtime()
+    monkeypatch.setattr(Database, "set_running", slow_set_running)
+    start = time.time()
+    jobs = runtime.compute_many([item(x) for x in range(10)])
+    end = time.time()
+    assert [j.value for j in jobs] == list(range(10))
+    assert end - start < 2
+
+
+def test_async_builder_in_process_runner(env):
+    @builder(job_setup="local")
+    async def fetch(x):
+        await deps_done()
+        await asyncio.sleep(0.1)
+        return x * 3
+
+    runtime = env.test_runtime()
+    assert runtime.compute(fetch(3)).value == 9
+
+
+def test_async_runner_rejects_sync_builder(env):
+    @builder(job_setup="asyncio")
+    def sync(x):
+        return x
+
+    runtime = env.test_runtime()
+    with pytest.raises(JobFailedException, match="not a coroutine"):
+        runtime.compute(sync(1))
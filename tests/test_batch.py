@@ -0,0 +1,150 @@
+import os
+import signal
+import sys
+import textwrap
+import time
+
+import pytest
+
+from conftest import ROOT_DIR
+from orco import JobFailedException, JobState, builder
+from orco.internals.batch import BatchRunner
+
+# Fake batch scheduler; a batch job is a background process in its own session
+FAKE_SBATCH = """
+import os, subprocess, sys
+state = {state!r}
+batch_id = str(len(os.listdir(state)) + 1)
+env = os.environ.copy()
+env["PYTHONPATH"] = {root!r}
+with open(os.path.join(state, batch_id + ".out"), "w") as out:
+    p = subprocess.Popen(
+        ["sh", sys.argv[-1]], env=env, stdout=out, stderr=out, start_new_session=True
+    )
+with open(os.path.join(state, batch_id), "w") as f:
+    f.write(str(p.pid))
+print(batch_id)
+"""
+
+FAKE_SQUEUE = """
+import os
+state = {state!r}
+for name in os.listdir(state):
+    if name.endswith(".out"):
+        continue
+    with open(os.path.join(state, name)) as f:
+        pid = f.read()
+    try:
+        with open("/proc/{{}}/stat".format(pid)) as f:
+            if f.read().split(")")[-1].split()[0] != "Z":
+                print(name)
+    except OSError:
+        pass
+"""
+
+
+class FakeScheduler:
+    def __init__(self, tmpdir):
+        self.state = str(tmpdir.mkdir("scheduler"))
+        self.sbatch = self._write_script(tmpdir, "sbatch.py", FAKE_SBATCH)
+        self.squeue = self._write_script(tmpdir, "squeue.py", FAKE_SQUEUE)
+
+    def _write_script(self, tmpdir, name, template):
+        path = str(tmpdir.join(name))
+        with open(path, "w") as f:
+            f.write(textwrap.dedent(template.format(state=self.state, root=ROOT_DIR)))
+        return path
+
+    def batch_pids(self):
+        pids = []
+        for name in os.listdir(self.state):
+            if not name.endswith(".out"):
+                with open(os.path.join(self.state, name)) as f:
+                    pids.append(int(f.read()))
+        return pids
+
+    def create_runner(self, tmpdir, **kwargs):
+        return BatchRunner(
+            str(tmpdir.join("batch")),
+            submit_command=[sys.executable, self.sbatch],
+            status_command=[sys.executable, self.squeue],
+            cancel_command=["true"],
+            poll_interval=0.2,
+            **kwargs
+        )
+
+    def kill_all(self):
+        for pid in self.batch_pids():
+            try:
+                os.killpg(pid, signal.SIGKILL)
+            except OSError:
+                pass
+
+
+@pytest.fixture()
+def scheduler(tmpdir):
+    s = FakeScheduler(tmpdir)
+    yield s
+    s.kill_all()
+
+
+def test_batch_runner_packing(env, tmpdir, scheduler):
+    @builder(job_setup="batch")
+    def batch_job(x):
+        time.sleep(0.3)
+        return x * 10, os.getppid()
+
+    @builder()
+    def collect(n):
+        jobs = [batch_job(x) for x in range(n)]
+        yield
+        return [j.value for j in jobs]
+
+    runner = scheduler.create_runner(tmpdir, n_slots=4, max_jobs=5)
+    runtime = env.test_runtime()
+    runtime.add_runner("batch", runner)
+
+    result = runtime.compute(collect(8)).value
+    assert [r[0] for r in result] == [x * 10 for x in range(8)]
+
+    # 8 jobs packed into 2 allocations
+    pids = scheduler.batch_pids()
+    assert len(pids) == 2
+    assert set(r[1] for r in result) == set(pids)
+
+
+def test_batch_runner_errors(env, tmpdir, scheduler):
+    @builder(job_setup="batch")
+    def failing(x):
+        raise Exception("MyError")
+
+    @builder(job_setup="batch")
+    def crashing(x):
+        os.kill(os.getppid(), signal.SIGKILL)
+        time.sleep(10)
+
+    runner = scheduler.create_runner(tmpdir, status_grace_period=0)
+    runtime = env.test_runtime()
+    runtime.add_runner("batch", runner)
+
+    with pytest.raises(JobFailedException, match="MyError"):
+        runtime.compute(failing(1))
+    with pytest.raises(JobFailedException, match="ended before"):
+        runtime.compute(crashing(1))
+
+    # Jobs of a dead allocation are marked as failed in the database
+    runtime.compute(crashing(2), continue_on_error=True)
+    assert [j.state for j in runtime.read_jobs(crashing(2))] == [JobState.ERROR]
+
+
+def test_batch_runner_grace_period(env, tmpdir, scheduler):
+    @builder(job_setup="batch")
+    def job(x):
+        return x * 10
+
+    # The scheduler does not list the batch job (yet)
+    runner = scheduler.create_runner(tmpdir, status_grace_period=60)
+    runner.status_command = ["true"]
+    runtime = env.test_runtime()
+    runtime.add_runner("batch", runner)
+    assert runtime.compute(job(1)).value == 10
@@ -1,8 +1,17 @@
 import os
 
 import pytest
+import sqlalchemy as sa
 
-from orco import builder, attach_object, attach_file, attach_directory, attach_text
+from orco import (
+    JobSetup,
+    attach_directory,
+    attach_file,
+    attach_object,
+    attach_stream,
+    attach_text,
+    builder,
+)
 
 
 def test_blob_validate_name(env):
@@ -137,3 +146,247 @@ def test_blob_attach_directory(env):
     runtime = env.test_runtime()
     a = runtime.compute(cc(x=20))
     assert a.value == "Ok"
+
+
+def test_blob_store(env, tmpdir):
+    store_path = str(tmpdir.join("store"))
+
+    def stored_files():
+        return sorted(
+            name
+            for _, _, names in os.walk(store_path)
+            for name in names
+        )
+
+    @builder()
+    def bb(x):
+        os.mkdir("testdir")
+        with open("testdir/aa.txt", "w") as f:
+            f.write("Content " * 1000)
+        attach_directory("testdir")
+        attach_text("small", "Hello")
+        attach_text("large", "Large " * 1000)
+        return "x" * 5000
+
+    @builder()
+    def cc(x):
+        a = bb(x)
+        yield
+        a.extract_tar("testdir", target="out")
+        with open("out/aa.txt") as f:
+            assert f.read() == "Content " * 1000
+        a.get_blob_as_file("large", "large.txt")
+        with open("large.txt") as f:
+            assert f.read() == "Large " * 1000
+        return a.value
+
+    runtime = env.test_runtime(blob_store=store_path)
+    a = runtime.compute(cc(x=1)).value
+    assert a == "x" * 5000
+    b = runtime.compute(bb(x=1))
+    assert b.get_text("small") == "Hello"
+    assert b.get_text("large") == "Large " * 1000
+    assert b.open_blob("large").read() == ("Large " * 1000).encode()
+    # value, directory and "large"; "small" is stored in DB
+    assert len(stored_files()) == 3
+
+    blobs = {b["name"]: b for b in runtime.db.blob_summaries(b._job_id)}
+    assert blobs["large"]["size"] == 6000
+    assert blobs["large"]["value"] == "Large " * 1000
+    assert blobs["small"]["value"] == "Hello"
+
+    # Setting is stored in DB
+    runtime2 = env.test_runtime()
+    assert runtime2.db.blob_store.path == store_path
+    assert runtime2.read(bb(x=1)).get_text("large") == "Large " * 1000
+
+    # Identical bodies are stored once (tar archives differ in mtimes)
+    runtime.compute(bb(x=2))
+    assert len(stored_files()) == 4
+    runtime.free(bb(x=1))
+    assert len(stored_files()) == 3
+    runtime.drop(bb(x=2))
+    # Value of cc(1) is equal to value of bb(x)
+    assert len(stored_files()) == 1
+    runtime.drop(cc(x=1))
+    assert len(stored_files()) == 0
+
+
+def test_blob_store_failed_insert(env, tmpdir, monkeypatch):
+    store_path = str(tmpdir.join("store"))
+
+    @builder()
+    def bb(x):
+        return x
+
+    runtime = env.test_runtime(blob_store=store_path)
+    job = runtime.compute(bb(x=1))
+    db = runtime.db
+    add_body_ref = db._add_body_ref
+
+    def failing_add_body_ref(*args):
+        add_body_ref(*args)
+        raise Exception("MyError")
+
+    # Body put into the store by a rolled back transaction is removed
+    monkeypatch.setattr(db, "_add_body_ref", failing_add_body_ref)
+    with pytest.raises(Exception, match="MyError"):
+        db.insert_blob(job._job_id, "large", b"x" * 10000, "text/plain", None)
+    monkeypatch.undo()
+    assert not any(names for _, _, names in os.walk(store_path))
+
+    # A file left in the store is overwritten
+    blob_hash = db.insert_blob(job._job_id, "large", b"x" * 10000, "text/plain", None)
+    path = db.blob_store.get_path(blob_hash)
+    with open(path, "wb") as f:
+        f.write(b"broken")
+    db.blob_store.put(b"x" * 10000)
+    with open(path, "rb") as f:
+        assert f.read() == b"x" * 10000
+
+
+def test_blob_dedup(env):
+    @builder()
+    def bb(x):
+        attach_text("banner", "Banner " * 100)
+        attach_text("own", "Own {} ".format(x) * 100)
+        attach_text("small", "Small")
+
+    @builder()
+    def cc(x):
+        attach_text("banner", "Banner " * 100)
+
+    def bodies():
+        c = runtime.db.blob_bodies.c
+        return sorted(
+            r.refs for r in runtime.db.conn.execute(sa.select([c.refs]))
+        )
+
+    runtime = env.test_runtime()
+    runtime.compute_many([bb(1), bb(2), cc(1)])
+    assert bodies() == [1, 1, 3]
+    assert runtime.compute(bb(2)).get_text("banner") == "Banner " * 100
+
+    summaries = {s["name"]: s for s in runtime.db.builder_summaries([])}
+    assert summaries["bb"]["logical_size"] == 2 * (700 + 600 + 5)
+    assert summaries["cc"]["logical_size"] == 700
+    assert summaries["cc"]["physical_size"] == 233
+    total = sum(s["physical_size"] for s in summaries.values())
+    assert total == 700 + 600 + 600 + 5 + 5
+
+    runtime.free(bb(1))
+    assert bodies() == [1, 2]
+    runtime.drop(cc(1))
+    assert bodies() == [1, 1]
+    runtime.drop_builder("bb")
+    assert bodies() == []
+
+
+def test_blob_chunks(env, tmpdir, monkeypatch):
+    monkeypatch.setattr("orco.internals.database.CHUNK_SIZE", 1000)
+    data = bytes(range(256)) * 20
+
+    d = tmpdir.mkdir("dir")
+    d.join("a.txt").write("Hello world")
+    d.join("b.bin").write_binary(data)
+    path = str(tmpdir.join("file.bin"))
+    with open(path, "wb") as f:
+        f.write(data)
+
+    @builder()
+    def bb(x):
+        with attach_stream("stream") as f:
+            for i in range(10):
+                f.write(data)
+        with attach_stream("small", repr="Small") as f:
+            f.write(b"Small")
+        with pytest.raises(Exception, match="MyError"):
+            with attach_stream("failed") as f:
+                f.write(data)
+                raise Exception("MyError")
+        attach_file(path, "file")
+        attach_directory(str(d), "dir")
+
+    @builder(job_setup=JobSetup(compression="zlib"))
+    def compressed(x):
+        with attach_stream("stream") as f:
+            for i in range(10):
+                f.write(b"a" * 1000 + data)
+
+    def n_chunks():
+        c = runtime.db.blob_chunks.c
+        return runtime.db.conn.execute(sa.select([sa.func.count(c.hash)])).scalar()
+
+    runtime = env.test_runtime()
+    job = runtime.compute(bb(1))
+    assert job.get_names() == ["dir", "file", "small", "stream"]
+    assert job.get_blob("small") == (b"Small", "application/octet-stream")
+    assert job.get_blob("file")[0] == data
+    assert job.get_blob("stream")[0] == data * 10
+    with job.open_blob("stream") as f:
+        assert f.read(3000) == data[:3000]
+        assert f.read() == data[3000:] + data * 9
+    with job.open_blob("stream") as f:
+        assert b"".join(iter(lambda: f.read(7), b"")) == data * 10
+    target = str(tmpdir.join("target"))
+    job.extract_tar("dir", target)
+    with open(os.path.join(target, "a.txt")) as f:
+        assert f.read() == "Hello world"
+    with open(os.path.join(target, "b.bin"), "rb") as f:
+        assert f.read() == data
+
+    # The file and dir/b.bin are the same body
+    assert n_chunks() > 51 + 6
+
+    job = runtime.compute(compressed(1))
+    assert job.get_blob("stream")[0] == (b"a" * 1000 + data) * 10
+    c = runtime.db.blobs.c
+    assert runtime.db.conn.execute(
+        sa.select([c.codec]).where(c.job_id == job._job_id)
+    ).scalar() == "zlib"
+
+    runtime.drop_builder("bb")
+    runtime.drop_builder("compressed")
+    assert n_chunks() == 0
+
+
+def test_blob_oob_pickle(env, monkeypatch):
+    import numpy as np
+
+    monkeypatch.setattr("orco.internals.database.CHUNK_SIZE", 100000)
+
+    @builder()
+    def bb(n):
+        attach_object("arrays", {"a": np.arange(n), "b": np.ones(10)})
+        attach_object("small", np.arange(10))
+        return np.arange(n) * 2
+
+    @builder(job_setup=JobSetup(compression="zlib"))
+    def compressed(n):
+        return np.zeros(n)
+
+    def mimes(job):
+        c = runtime.db.blobs.c
+        return {
+            r.name: r.mime
+            for r in runtime.db.conn.execute(
+                sa.select([c.name, c.mime]).where(c.job_id == job._job_id)
+            )
+        }
+
+    runtime = env.test_runtime()
+    job = runtime.compute(bb(100000))
+    assert mimes(job) == {
+        None: "application/python.pickle-oob",
+        "arrays": "application/python.pickle-oob",
+        "small": "application/python.pickle",
+    }
+    np.testing.assert_array_equal(job.value, np.arange(100000) * 2)
+    arrays = job.get_object("arrays")
+    np.testing.assert_array_equal(arrays["a"], np.arange(100000))
+    np.testing.assert_array_equal(arrays["b"], np.ones(10))
+    np.testing.assert_array_equal(job.get_object("small"), np.arange(10))
+    assert job.get_object("xxx", None) is None
+
+    job = runtime.compute(compressed(100000))
+    np.testing.assert_array_equal(job.value, np.zeros(100000))
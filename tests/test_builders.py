@@ -5,7 +5,7 @@ import sys
 
 import pytest
 
-from orco import Builder, builder, JobState
+from orco import Builder, builder, JobState, JobSetup
 
 
 def adder(a, b):
@@ -113,6 +113,44 @@ def test_frozen_builder(env):
         assert runtime.compute(b0("b"))
 
 
+def test_ephemeral_builder(env):
+    @builder(ephemeral=True)
+    def step1(x):
+        return list(range(x))
+
+    @builder()
+    def step2(x):
+        s = step1(x)
+        yield
+        return sum(s.value)
+
+    @builder(job_setup="threads")
+    def step3(x):
+        s = step1(x)
+        t = step2(x)
+        yield
+        return len(s.value) + t.value
+
+    with pytest.raises(Exception, match="Frozen builder cannot be ephemeral"):
+        Builder(None, "b1", is_frozen=True, ephemeral=True)
+
+    runtime = env.test_runtime()
+    assert runtime.compute(step3(10)).value == 55
+    # Value of step1 was not stored
+    assert runtime.try_read(step1(10)) is None
+    assert runtime.read(step2(10)).value == 45
+
+    job = runtime.compute(step1(5))
+    assert job.value == [0, 1, 2, 3, 4]
+    assert runtime.try_read(step1(5)) is None
+
+    jobs = runtime.compute_many([step1(3), step2(3)], continue_on_error=True)
+    assert [j.value for j in jobs] == [[0, 1, 2], 3]
+
+    # Ephemeral job is computed again when it is needed
+    assert runtime.compute(step2(5)).value == 10
+
+
 def test_builder_upgrade(env):
     runtime = env.test_runtime(n_processes=1)
 
@@ -512,6 +550,48 @@ def test_builder_stdout(env):
     assert "XYZ" in text
 
 
+def test_builder_stdout_capture_modes(env):
+    @builder(job_setup=lambda c: JobSetup(capture=c["mode"]))
+    def bb(mode, x):
+        print("ABC")
+        print("spam", file=sys.stderr)
+        os.system("echo FROM_SUBPROCESS")
+        if x:
+            raise Exception("MyError")
+
+    @builder(job_setup=JobSetup(capture="fd-to-file", max_output_size=100))
+    def chatty(x):
+        for i in range(1000):
+            print("Line", i)
+
+    runtime = env.test_runtime()
+    a = runtime.compute(bb("fd-to-file", False))
+    text = a.get_text("!output")
+    assert "ABC" in text
+    assert "spam" in text
+    assert "FROM_SUBPROCESS" in text
+
+    with pytest.raises(Exception, match="MyError"):
+        runtime.compute(bb("fd-to-file", True))
+    text = runtime.read_jobs(bb("fd-to-file", True))[0].get_text("!output")
+    assert "ABC" in text
+
+    a = runtime.compute(bb("none", False))
+    assert "!output" not in a.get_names()
+    with pytest.raises(Exception, match="not found"):
+        a.get_text("!output")
+
+    a = runtime.compute(chatty(1))
+    text = a.get_text("!output")
+    assert text.startswith("[... ")
+    assert "truncated" in text
+    assert text.endswith("Line 999\n")
+    assert "Line 0\n" not in text
+
+    with pytest.raises(ValueError, match="Invalid capture mode"):
+        JobSetup(capture="xxx")
+
+
 def test_already_attached(env):
     @builder()
     def bb(x):
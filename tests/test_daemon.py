@@ -0,0 +1,139 @@
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from conftest import ROOT_DIR
+from orco import JobFailedException, JobState, Runtime, builder
+from orco.internals.daemon import Daemon, default_socket_path
+
+
+@pytest.fixture()
+def daemon(tmpdir):
+    d = Daemon(str(tmpdir.join("orco.sock")), n_processes=4)
+    d.start()
+    thread = threading.Thread(target=d.serve_forever)
+    thread.start()
+    yield d
+    d.stop()
+    thread.join()
+
+
+def test_daemon_compute(env, daemon):
+    @builder()
+    def pid_job(x):
+        return x, os.getpid()
+
+    @builder()
+    def collect(n):
+        jobs = [pid_job(x) for x in range(n)]
+        yield
+        return [j.value for j in jobs]
+
+    runtime = env.test_runtime(daemon=daemon.socket_path)
+    r1 = runtime.compute(collect(4)).value
+    runtime.stop()
+
+    runtime = env.test_runtime(daemon=daemon.socket_path)
+    assert runtime.compute(collect(4)).value == r1
+    r2 = runtime.compute(collect(8)).value
+
+    assert [x for x, _ in r2] == list(range(8))
+    pids = set(pid for _, pid in r1 + r2)
+    assert os.getpid() not in pids
+    # Processes of the daemon are reused
+    assert len(pids) <= 4
+
+
+def test_daemon_concurrent_clients(env, tmpdir, daemon):
+    @builder()
+    def slow(x):
+        time.sleep(0.5)
+        return x
+
+    results = {}
+
+    def client(name):
+        with Runtime("sqlite:///" + str(tmpdir.join(name)), daemon=daemon.socket_path) as rt:
+            results[name] = [j.value for j in rt.compute_many([slow(1), slow(2)])]
+
+    start = time.time()
+    threads = [threading.Thread(target=client, args=(n,)) for n in ("db1", "db2")]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert time.time() - start < 0.95
+    assert results == {"db1": [1, 2], "db2": [1, 2]}
+
+
+def test_daemon_errors(env, tmpdir, daemon):
+    @builder()
+    def failing(x):
+        if x == 1:
+            raise Exception("MyError")
+        return x
+
+    runtime = env.test_runtime(daemon=daemon.socket_path)
+    with pytest.raises(JobFailedException, match="MyError"):
+        runtime.compute(failing(1))
+
+    jobs = runtime.compute_many([failing(1), failing(2)], continue_on_error=True)
+    assert jobs[0].state != JobState.FINISHED
+    assert jobs[1].value == 2
+
+    runtime = env.test_runtime(daemon=str(tmpdir.join("nonexisting.sock")))
+    with pytest.raises(Exception, match="Runners of a daemon"):
+        runtime.add_runner("other", None)
+    with pytest.raises(Exception, match="Cannot connect to daemon"):
+        runtime.compute(failing(2))
+
+
+def test_daemon_cli(env, tmpdir):
+    @builder()
+    def job(x):
+        return x * 2
+
+    socket_path = str(tmpdir.join("cli.sock"))
+    env_vars = os.environ.copy()
+    env_vars["PYTHONPATH"] = ROOT_DIR
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-c",
+            "import orco; orco.run_cli()",
+            "daemon",
+            "--socket",
+            socket_path,
+            "--processes",
+            "2",
+        ],
+        env=env_vars,
+    )
+    try:
+        end = time.time() + 10
+        while not os.path.exists(socket_path):
+            assert time.time() < end
+            time.sleep(0.05)
+        runtime = env.test_runtime(daemon=socket_path)
+        assert runtime.compute(job(21)).value == 42
+    finally:
+        process.send_signal(signal.SIGINT)
+        process.wait(10)
+    assert not os.path.exists(socket_path)
+
+
+def test_daemon_default_socket_path(tmpdir, monkeypatch):
+    runtime_dir = tmpdir.join("run")
+    runtime_dir.mkdir()
+    runtime_dir.chmod(0o700)
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(runtime_dir))
+    assert default_socket_path() == str(runtime_dir.join("orco.sock"))
+
+    runtime_dir.chmod(0o777)
+    with pytest.raises(Exception, match="not a private directory"):
+        default_socket_path()
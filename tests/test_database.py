@@ -1,3 +1,5 @@
+import sqlite3
+import threading
 import time
 
 import pytest
@@ -139,3 +141,136 @@ def test_xdb_unannounce_with_blobs(env):
     rt.db.insert_blob(job_id, "hello", b"1234", consts.MIME_BYTES, "xxx")
 
     rt.db.unannounce_jobs(plan)
+
+
+def test_xdb_upgrade_schema(env):
+    @builder()
+    def c(x):
+        return x
+
+    rt = env.test_runtime()
+    rt.compute(c(1))
+    rt.stop()
+
+    conn = sqlite3.connect(env.db_path())
+    conn.execute("ALTER TABLE jobs DROP COLUMN attempts")
+    conn.commit()
+    conn.close()
+
+    rt = env.test_runtime()
+    assert rt.read(c(1)).value == 1
+    assert rt.read(c(1)).metadata().attempts == []
+    assert rt.compute(c(2)).value == 2
+
+
+def test_xdb_inline_values(env):
+    @builder()
+    def bb(x):
+        return "v" * x
+
+    def inline_values():
+        c = runtime.db.jobs.c
+        return sorted(
+            r.value is not None
+            for r in runtime.db.conn.execute(sa.select([c.value]))
+        )
+
+    runtime = env.test_runtime()
+    jobs = runtime.compute_many([bb(10), bb(1000)])
+    assert inline_values() == [False, True]
+    assert jobs[0]._pickled_value is not None
+    assert [j.value for j in jobs] == ["v" * 10, "v" * 1000]
+
+    jobs = runtime.read_many([bb(10), bb(1000), bb(3)])
+    assert jobs[0]._pickled_value is not None
+    assert jobs[1]._pickled_value is None
+    assert jobs[2] is None
+    assert jobs[0].value == "v" * 10
+    assert jobs[1].value == "v" * 1000
+
+    job = runtime.read(bb(10))
+    assert job._pickled_value is not None
+    assert runtime.db.read_blobs([job._job_id]) == {
+        job._job_id: (job._pickled_value, consts.MIME_PICKLE)
+    }
+
+    runtime.free(bb(10))
+    assert inline_values() == [False, False]
+
+
+def test_xdb_sqlite_profile(env):
+    @builder()
+    def c(x):
+        return x
+
+    def pragma(db, name):
+        return db.conn.execute("PRAGMA {}".format(name)).scalar()
+
+    with pytest.raises(ValueError, match="Invalid SQLite profile"):
+        env.test_runtime(sqlite_profile="xxx")
+
+    rt = env.test_runtime(sqlite_profile="fast")
+    assert pragma(rt.db, "journal_mode") == "wal"
+    assert pragma(rt.db, "busy_timeout") == 30000
+    assert rt.compute(c(1)).value == 1
+    rt.stop()
+
+    # The profile is stored in the database
+    rt = env.test_runtime()
+    assert rt.db.sqlite_profile == "fast"
+    assert pragma(rt.db, "synchronous") == 1
+    assert rt.read(c(1)).value == 1
+
+    # Writes are repeated while the database is locked;
+    # workers are started before, they must not be forked with the lock
+    rt.start_executor()
+    rt.db.conn.execute("PRAGMA busy_timeout=0")
+    conn = sqlite3.connect(env.db_path(), check_same_thread=False)
+    conn.execute("BEGIN EXCLUSIVE")
+    timer = threading.Timer(0.3, conn.rollback)
+    timer.start()
+    assert rt.compute(c(2)).value == 2
+    timer.join()
+    conn.close()
+
+
+def test_xdb_upgrade_indexes(env):
+    @builder()
+    def c(x):
+        return x
+
+    def index_names(table):
+        return set(r[1] for r in conn.execute("PRAGMA index_list({})".format(table)))
+
+    rt = env.test_runtime()
+    rt.compute(c(1))
+    rt.stop()
+
+    conn = sqlite3.connect(env.db_path())
+    assert {"key_state_idx", "builder_state_idx"} <= index_names("jobs")
+    assert index_names("job_deps") == {"job_deps_source_idx", "job_deps_target_idx"}
+    # Indexes of an older version
+    for name in (
+        "key_state_idx",
+        "builder_state_idx",
+        "job_deps_source_idx",
+        "job_deps_target_idx",
+    ):
+        conn.execute("DROP INDEX {}".format(name))
+    conn.execute("CREATE INDEX key_idx ON jobs (key)")
+    conn.execute("CREATE INDEX builder_idx ON jobs (builder)")
+    conn.commit()
+
+    rt = env.test_runtime()
+    assert rt.read(c(1)).value == 1
+    rt.stop()
+
+    assert "key_idx" not in index_names("jobs")
+    assert "builder_idx" not in index_names("jobs")
+    assert {"key_state_idx", "builder_state_idx"} <= index_names("jobs")
+    assert index_names("job_deps") == {"job_deps_source_idx", "job_deps_target_idx"}
+    plan = conn.execute(
+        "EXPLAIN QUERY PLAN SELECT source_id FROM job_deps WHERE target_id = 1"
+    ).fetchall()
+    assert "job_deps_target_idx" in str(plan)
+    conn.close()
@@ -0,0 +1,49 @@
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+
+from orco import attach_text, builder  # noqa
+from orco.ext.arrow import attach_table, concat_tables, get_table  # noqa
+
+
+def make_table(x, n=100):
+    return pa.table(
+        {"x": [x] * n, "i": list(range(n)), "s": [str(i) for i in range(n)]}
+    )
+
+
+@pytest.mark.parametrize("format", ["parquet", "arrow"])
+@pytest.mark.parametrize("blob_store", [False, True])
+def test_arrow_tables(env, tmpdir, format, blob_store):
+    @builder()
+    def tables(x):
+        attach_table("table", make_table(x), format=format, row_group_size=10)
+        attach_table("frame", make_table(x).to_pandas(), format=format)
+        attach_text("text", "Hello")
+
+    if blob_store:
+        runtime = env.test_runtime(blob_store=str(tmpdir.join("blobs")))
+    else:
+        runtime = env.test_runtime()
+    jobs = runtime.compute_many([tables(x) for x in range(5)])
+
+    table = jobs[1].get_table("table")
+    assert table.equals(make_table(1))
+    assert get_table(jobs[1], "frame").to_pandas()["i"].tolist() == list(range(100))
+
+    table = jobs[2].get_table("table", columns=["i"], filter=[("i", "<", 5)])
+    assert table.column_names == ["i"]
+    assert table["i"].to_pylist() == [0, 1, 2, 3, 4]
+
+    with pytest.raises(Exception, match="not a table"):
+        jobs[0].get_table("text")
+
+    table = runtime.concat_tables(
+        jobs, "table", columns=["x", "i"], filter=[("i", "=", 7)]
+    )
+    assert sorted(table["x"].to_pylist()) == [0, 1, 2, 3, 4]
+    assert table["i"].to_pylist() == [7] * 5
+    assert concat_tables(runtime, jobs, "table").num_rows == 500
+
+    with pytest.raises(Exception, match="not found"):
+        runtime.concat_tables(jobs, "xxx")
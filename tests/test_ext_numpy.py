@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from orco import JobSetup, attach_text, builder
+from orco.ext.numpy import attach_array, get_array
+
+
+def test_numpy_arrays(env, tmpdir):
+    @builder()
+    def arrays(n):
+        attach_array("big", np.arange(n, dtype=np.float64).reshape(-1, 10))
+        attach_array("small", [1, 2, 3])
+        attach_text("text", "Hello")
+        with pytest.raises(ValueError):
+            attach_array("objects", np.array([object()]))
+
+    @builder(job_setup=JobSetup(compression="zlib"))
+    def compressed(n):
+        attach_array("big", np.zeros(n))
+
+    runtime = env.test_runtime(blob_store=str(tmpdir.join("blobs")))
+    job = runtime.compute(arrays(10000))
+    big = job.get_array("big")
+    assert isinstance(big, np.memmap)
+    assert big.shape == (1000, 10)
+    assert big[999, 9] == 9999
+    assert not isinstance(get_array(job, "big", mmap=False), np.memmap)
+    np.testing.assert_array_equal(get_array(job, "big", mmap=False), big)
+
+    small = job.get_array("small")
+    assert not isinstance(small, np.memmap)
+    assert list(small) == [1, 2, 3]
+
+    with pytest.raises(Exception, match="not an array"):
+        job.get_array("text")
+    with pytest.raises(Exception, match="not found"):
+        job.get_array("objects")
+
+    job = runtime.compute(compressed(10000))
+    big = job.get_array("big")
+    assert not isinstance(big, np.memmap)
+    assert big.shape == (10000,)
@@ -49,3 +49,13 @@ def test_builder_to_pandas_kwargs(env):
     assert list(frame["arg.a"]) == [1, 3, 42]
     assert list(frame["arg.b"]) == [2, 999, 1]
     assert list(frame["arg.c"]) == [999, 999, 8]
+
+
+def test_builder_to_pandas_values(env):
+    runtime = env.test_runtime()
+
+    col1 = runtime.register_builder(Builder(lambda c: [c] * c, "col1"))
+    runtime.compute_many([col1(x) for x in [1, 2, 300]])
+    frame = export_builder(runtime, col1.name, value_column="value")
+    frame = frame.sort_values("arg.c")
+    assert list(frame["value"]) == [[1], [2, 2], [300] * 300]
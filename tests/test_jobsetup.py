@@ -1,6 +1,11 @@
-import orco
+import os
 import time
 
+import pytest
+import sqlalchemy as sa
+
+import orco
+
 
 def test_setup_exclusive(env):
 
@@ -65,3 +70,194 @@ def test_setup_exclusive2(env):
     runtime.compute_many([builder3(21), builder3(22)])
 
 
+def test_setup_retries(env):
+    counter = env.file_storage("counter", 0)
+
+    @orco.builder(job_setup=orco.JobSetup(retries=3, retry_delay=0.2, retry_backoff=2))
+    def flaky(x):
+        orco.attach_text("attempt", "x")
+        count = counter.read()
+        counter.write(count + 1)
+        if count < 2:
+            raise Exception("Flaky error")
+        return x
+
+    @orco.builder()
+    def consumer(x):
+        f = flaky(x)
+        yield
+        return f.value + 1
+
+    runtime = env.test_runtime()
+    start = time.time()
+    job = runtime.compute(consumer(10))
+    end = time.time()
+    assert job.value == 11
+    assert counter.read() == 3
+    assert 0.6 <= end - start
+
+    flaky_job = runtime.read(flaky(10))
+    assert flaky_job.get_text("attempt") == "x"
+    assert len(runtime.read_jobs(flaky(10))) == 1
+    attempts = flaky_job.metadata().attempts
+    assert len(attempts) == 2
+    assert all("Flaky error" in a["error"] for a in attempts)
+    assert all(a["computation_time"] >= 0 for a in attempts)
+    assert job.metadata().attempts == []
+
+
+def test_setup_retries_exhausted(env):
+    counter = env.file_storage("counter", 0)
+
+    @orco.builder(job_setup=orco.JobSetup(retries=2, retry_delay=0.1))
+    def failing(x):
+        counter.write(counter.read() + 1)
+        raise Exception("Permanent error")
+
+    @orco.builder(job_setup=orco.JobSetup(retries=2, retry_delay=0.1, retry_on=OSError))
+    def not_retried(x):
+        counter.write(counter.read() + 1)
+        raise Exception("Other error")
+
+    runtime = env.test_runtime()
+    with pytest.raises(orco.JobFailedException, match="Permanent error"):
+        runtime.compute(failing(1))
+    assert counter.read() == 3
+    jobs = runtime.read_jobs(failing(1))
+    assert len(jobs) == 1
+    assert jobs[0].state == orco.JobState.ERROR
+    assert len(jobs[0].metadata().attempts) == 2
+
+    counter.write(0)
+    with pytest.raises(orco.JobFailedException, match="Other error"):
+        runtime.compute(not_retried(1))
+    assert counter.read() == 1
+
+
+def test_setup_compression(env, tmpdir):
+    @orco.builder(job_setup=orco.JobSetup(compression="zlib", compression_threshold=100))
+    def compressed(x):
+        print("Output " * 200)
+        orco.attach_text("text", "Text " * 200)
+        orco.attach_text("small", "Small")
+        os.mkdir("dir")
+        with open("dir/file.txt", "w") as f:
+            f.write("Content " * 1000)
+        orco.attach_directory("dir")
+        return [x] * 1000
+
+    @orco.builder(job_setup=orco.JobSetup("threads", compression="lzma"))
+    def compressed2(x):
+        orco.attach_text("text", "Text " * 2000)
+        return x
+
+    runtime = env.test_runtime()
+    job = runtime.compute(compressed(1))
+    assert job.value == [1] * 1000
+    assert job.get_text("text") == "Text " * 200
+    assert job.get_text("small") == "Small"
+    assert job.get_text("!output").startswith("Output " * 200)
+    job.extract_tar("dir", str(tmpdir.join("out")))
+    with open(str(tmpdir.join("out/file.txt"))) as f:
+        assert f.read() == "Content " * 1000
+    with job.open_blob("text") as f:
+        assert f.read() == ("Text " * 200).encode()
+
+    blobs = {b["name"]: b for b in runtime.db.blob_summaries(job._job_id)}
+    assert blobs["text"]["size"] == 1000
+    assert blobs["text"]["value"] == "Text " * 200
+
+    db = runtime.db
+    c = db.blobs.c
+    rows = {
+        r.name: r
+        for r in db.conn.execute(
+            sa.select([c.name, c.codec, sa.func.length(c.data).label("length")])
+        )
+    }
+    assert rows["text"].codec == "zlib"
+    assert rows["text"].length < 100
+    assert rows["small"].codec is None
+    assert rows["!output"].codec == "zlib"
+    assert rows[None].codec == "zlib"
+
+    runtime = env.test_runtime(blob_store=str(tmpdir.join("store")))
+    job = runtime.compute(compressed2(1))
+    assert job.get_text("text") == "Text " * 2000
+    with job.open_blob("text") as f:
+        assert f.read(5) == b"Text "
+        assert f.read() == ("Text " * 1999).encode()
+
+    with pytest.raises(ValueError, match="Invalid compression"):
+        orco.JobSetup(compression="xxx")
+
+
+class Point:
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+class PointSerializer(orco.Serializer):
+    name = "point"
+    mime = "application/x-point"
+
+    def dumps(self, value):
+        return "{},{}".format(value.x, value.y).encode()
+
+    def loads(self, data):
+        return Point(*map(int, data.decode().split(",")))
+
+
+def test_setup_serializer(env, monkeypatch):
+    import numpy as np
+
+    from orco.internals import serialization
+
+    monkeypatch.setattr(serialization, "_TYPE_SERIALIZERS", [])
+    monkeypatch.setattr(serialization, "_SERIALIZERS", dict(serialization._SERIALIZERS))
+    monkeypatch.setattr(
+        serialization, "_MIME_SERIALIZERS", dict(serialization._MIME_SERIALIZERS)
+    )
+    orco.register_serializer(PointSerializer(), types=[Point])
+
+    with pytest.raises(ValueError, match="Invalid serializer"):
+        orco.JobSetup(serializer="xxx")
+
+    @orco.builder(job_setup=orco.JobSetup(serializer="json"))
+    def json_job(x):
+        return {"x": [x, x + 1]}
+
+    @orco.builder(job_setup=orco.JobSetup(serializer="npy"))
+    def npy_job(x):
+        return np.arange(x)
+
+    @orco.builder()
+    def point_job(x):
+        orco.attach_object("point", Point(x, 1))
+        return Point(x, 2)
+
+    def mimes(job):
+        c = runtime.db.blobs.c
+        return {
+            r.name: r.mime
+            for r in runtime.db.conn.execute(
+                sa.select([c.name, c.mime]).where(c.job_id == job._job_id)
+            )
+        }
+
+    runtime = env.test_runtime()
+    job = runtime.compute(json_job(1))
+    assert mimes(job) == {None: "application/json"}
+    assert runtime.read(json_job(1), reattach=True).value == {"x": [1, 2]}
+
+    job = runtime.compute(npy_job(5))
+    assert mimes(job) == {None: "application/x-npy"}
+    assert list(runtime.read(npy_job(5), reattach=True).value) == [0, 1, 2, 3, 4]
+
+    job = runtime.compute(point_job(7))
+    assert mimes(job) == {None: "application/x-point", "point": "application/x-point"}
+    job = runtime.read(point_job(7), reattach=True)
+    assert (job.value.x, job.value.y) == (7, 2)
+    point = job.get_object("point")
+    assert (point.x, point.y) == (7, 1)
@@ -0,0 +1,114 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+from conftest import ROOT_DIR
+from orco import JobFailedException, JobState, builder
+from orco.internals.remote import RemoteRunner
+
+
+def start_worker(port, slots, secret=None):
+    env = os.environ.copy()
+    env["PYTHONPATH"] = ROOT_DIR
+    args = [
+        sys.executable,
+        "-c",
+        "import orco; orco.run_cli()",
+        "worker",
+        "127.0.0.1:{}".format(port),
+        "--slots",
+        str(slots),
+    ]
+    if secret:
+        args += ["--secret", secret]
+    return subprocess.Popen(args, env=env, start_new_session=True)
+
+
+@pytest.fixture()
+def workers():
+    processes = []
+
+    def start(port, n_workers, slots, secret=None):
+        for _ in range(n_workers):
+            processes.append(start_worker(port, slots, secret))
+
+    yield start
+    for p in processes:
+        # Kill also process pool of the worker
+        os.killpg(p.pid, signal.SIGKILL)
+        p.wait()
+
+
+def wait_for_workers(runner, count):
+    end = time.time() + 10
+    while runner.n_workers < count:
+        assert time.time() < end
+        time.sleep(0.05)
+
+
+def test_remote_runner(env, workers):
+    @builder(job_setup="remote")
+    def remote_job(x):
+        time.sleep(0.5)
+        return os.getppid()
+
+    @builder()
+    def collect(n):
+        jobs = [remote_job(x) for x in range(n)]
+        yield
+        return [j.value for j in jobs]
+
+    runner = RemoteRunner()
+    runtime = env.test_runtime()
+    runtime.add_runner("remote", runner)
+    runtime.start_executor()
+
+    workers(runner.port, 3, 2, runner.secret)
+    wait_for_workers(runner, 3)
+    assert "3 remote workers (6 slots)" in runner.get_resources()
+
+    start = time.time()
+    result = runtime.compute(collect(12)).value
+    end = time.time()
+    assert len(set(result)) == 3
+    assert os.getpid() not in result
+    assert end - start < 1.9
+
+
+def test_remote_runner_errors(env, workers):
+    @builder(job_setup="remote")
+    def failing(x):
+        raise Exception("MyError")
+
+    @builder(job_setup="remote")
+    def crashing(x):
+        time.sleep(0.5)
+        os.kill(os.getppid(), 9)
+
+    runner = RemoteRunner(secret="abc")
+    runtime = env.test_runtime()
+    runtime.add_runner("remote", runner)
+    runtime.start_executor()
+
+    workers(runner.port, 1, 1, secret="xyz")
+    time.sleep(0.5)
+    assert runner.n_workers == 0
+
+    workers(runner.port, 1, 1, secret="abc")
+    wait_for_workers(runner, 1)
+
+    with pytest.raises(JobFailedException, match="MyError"):
+        runtime.compute(failing(1))
+    with pytest.raises(JobFailedException, match="disconnected"):
+        runtime.compute(crashing(1))
+    assert runner.n_workers == 0
+
+    # The lost job is marked as failed in the database
+    workers(runner.port, 1, 1, secret="abc")
+    wait_for_workers(runner, 1)
+    runtime.compute(crashing(2), continue_on_error=True)
+    assert [j.state for j in runtime.read_jobs(crashing(2))] == [JobState.ERROR]
@@ -1,8 +1,15 @@
 from test_database import announce
+import os
 import time
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
 
-from orco import Builder
+import orco
+from orco import Builder, JobFailedException, JobState, Runtime
+from orco.internals import database
+from orco.internals.rawsqlite import RawSqliteDatabase
+from orco.internals.runner import LocalThreadRunner
 
 
 def test_wait_for_others(env):
@@ -23,4 +30,117 @@ def test_wait_for_others(env):
     assert 3.9 < end - start < 6
 
     r.drop_unfinished_jobs()
-    r.compute(c(x="test1"))
\ No newline at end of file
+    r.compute(c(x="test1"))
+
+
+def test_memory_runtime():
+    def square(x):
+        return x * x
+
+    def total(n):
+        xs = [sq(x) for x in range(n)]
+        yield
+        return sum(x.value for x in xs)
+
+    with Runtime("sqlite://", global_builders=False) as runtime:
+        sq = runtime.register_builder(Builder(square, "mem_square"))
+        tt = runtime.register_builder(Builder(total, "mem_total"))
+        assert runtime.compute(tt(10)).value == 285
+        runner = runtime.executor.runners["local"]
+        assert isinstance(runner, LocalThreadRunner)
+        url = runtime.db.url
+        assert list(runner.dbs) == [url]
+
+    # Nothing keeps the database after the runtime is stopped
+    assert runner.dbs == {}
+    assert url not in database._memory_engines
+
+    # Each runtime has its own database that is dropped when the runtime stops
+    with Runtime("sqlite://", global_builders=False) as runtime:
+        sq = runtime.register_builder(Builder(square, "mem_square"))
+        assert runtime.try_read(sq(3)) is None
+        assert runtime.db.url != url
+    with pytest.raises(Exception, match="does not exist"):
+        Runtime(url)
+
+    with pytest.raises(Exception, match="cannot be used with a daemon"):
+        Runtime("sqlite://", daemon=True)
+
+
+def test_runtime_stop_closes_database(tmpdir):
+    def square(x):
+        return x * x
+
+    path = str(tmpdir.join("wal.db"))
+    with Runtime(
+        "sqlite:///" + path, global_builders=False, sqlite_profile="fast"
+    ) as runtime:
+        sq = runtime.register_builder(
+            Builder(square, "wal_square", job_setup="threads")
+        )
+        assert runtime.compute(sq(3)).value == 9
+        runner = runtime.executor.runners["threads"]
+        db = runner.dbs[runtime.db.url]
+        assert os.path.exists(path + "-wal")
+
+    assert runner.dbs == {}
+    assert db._conns == [] and runtime.db._conns == []
+    # WAL file is removed when the last connection is closed
+    assert not os.path.exists(path + "-wal")
+
+
+def test_raw_sqlite_runtime(tmpdir):
+    def square(x):
+        orco.attach_text("note", "square {}".format(x))
+        return [x * x] * 100
+
+    def total(n):
+        xs = [sq(x) for x in range(n)]
+        yield
+        if n < 0:
+            raise Exception("Negative")
+        return sum(x.value[0] for x in xs)
+
+    path = str(tmpdir.join("raw.db"))
+    with Runtime("sqlite3:///" + path, global_builders=False) as runtime:
+        assert isinstance(runtime.db, RawSqliteDatabase)
+        sq = runtime.register_builder(Builder(square, "raw_square"))
+        tt = runtime.register_builder(Builder(total, "raw_total"))
+        assert runtime.compute(tt(10)).value == 285
+        assert runtime.compute(tt(10)).value == 285
+        assert runtime.read(sq(3)).get_blob("note") == (b"square 3", "text/plain")
+        assert runtime.read(sq(3)).state == JobState.FINISHED
+        with pytest.raises(JobFailedException, match="Negative"):
+            runtime.compute(tt(-1))
+
+    # The file has the same schema as with SQLAlchemy
+    with Runtime("sqlite:///" + path, global_builders=False) as runtime:
+        sq = runtime.register_builder(Builder(square, "raw_square"))
+        tt = runtime.register_builder(Builder(total, "raw_total"))
+        assert runtime.read(sq(9)).value == [81] * 100
+        assert runtime.read(tt(10)).value == 285
+        assert [j.state for j in runtime.read_jobs(tt(-1))] == [JobState.ERROR]
+
+
+def test_runtime_threads(env):
+    @orco.builder()
+    def inc(x):
+        return x + 1
+
+    runtime = env.test_runtime()
+    with ThreadPoolExecutor(4) as pool:
+        values = list(pool.map(lambda x: runtime.compute(inc(x)).value, range(8)))
+    assert values == list(range(1, 9))
+
+    with ThreadPoolExecutor(4) as pool:
+        jobs = list(pool.map(lambda x: runtime.read_many([inc(x), inc(x + 8)]), range(8)))
+    assert [j.value for j, _ in jobs] == list(range(1, 9))
+    assert all(j is None for _, j in jobs)
+
+    def in_transaction(x):
+        with runtime.db.conn.begin():
+            time.sleep(0.1)
+            return runtime.db.get_active_job_id_and_state(inc(x).key)[0]
+
+    with ThreadPoolExecutor(2) as pool:
+        assert None not in pool.map(in_transaction, range(2))
@@ -1,7 +1,21 @@
+import os
+import time
 from concurrent.futures import Future
+from multiprocessing import shared_memory
 
-from orco import Builder
-from orco.internals.runner import PoolJobRunner
+import pytest
+
+from orco import (
+    Builder,
+    JobFailedException,
+    JobSetup,
+    JobState,
+    attach_object,
+    builder,
+)
+from orco.internals import runner
+from orco.internals.database import Database
+from orco.internals.runner import LocalProcessRunner, PoolJobRunner
 
 
 class NaivePool:
@@ -51,3 +65,165 @@ def test_runner_selection(env):
     r = runtime.read(b1(10))
     assert r.metadata().job_setup.runner_name == "tr"
     assert len(testing_runner.events) == 1
+
+
+def test_thread_runner(env):
+    @builder(job_setup="threads")
+    def b1(x):
+        attach_object("pid", os.getpid())
+        time.sleep(0.5)
+        return x * 10
+
+    @builder(job_setup="threads")
+    def b2(x):
+        deps = [b1(x + i) for i in range(8)]
+        yield
+        return sum(d.value for d in deps)
+
+    runtime = env.test_runtime()
+    start = time.time()
+    r = runtime.compute(b2(1))
+    end = time.time()
+    assert r.value == 360
+    assert end - start < 2.5
+    assert r.metadata().job_setup.runner_name == "threads"
+
+    j = runtime.read(b1(1))
+    assert j.get_object("pid") == os.getpid()
+
+
+def test_thread_runner_error(env):
+    @builder(job_setup="threads")
+    def b1(x):
+        raise Exception("MyError")
+
+    runtime = env.test_runtime()
+    with pytest.raises(JobFailedException, match="MyError"):
+        runtime.compute(b1(1))
+    assert runtime.read_jobs(b1(1))[0].state == JobState.ERROR
+
+
+def test_file_capture():
+    cpt = runner._FileCapture(False, limit=10)
+    cpt.start_capture()
+    file = cpt.file
+    os.write(1, b"0123456789" * 3)
+    cpt.finish_capture()
+    assert file.closed
+    assert cpt.file is None
+    assert cpt.get_bytes() == b"[... 20 bytes of output truncated ...]\n0123456789"
+
+
+def test_value_cache(env):
+    @builder()
+    def player(x):
+        return [x] * 1000
+
+    @builder(job_setup="tr")
+    def game(a, b):
+        p1 = player(a)
+        p2 = player(b)
+        yield
+        return p1.value[0] + p2.value[0]
+
+    runner._value_cache.clear()
+    runtime = env.test_runtime(value_cache_size=1024 * 1024)
+    runtime.add_runner("tr", NaiveRunner())
+    games = [game(a, b) for a in range(4) for b in range(4) if a != b]
+    runtime.compute_many(games)
+    assert [g.value for g in games] == [
+        a + b for a in range(4) for b in range(4) if a != b
+    ]
+
+    stats = runtime.executor.get_stats()
+    assert stats["value_cache_misses"] == 4
+    assert stats["value_cache_hits"] == 2 * len(games) - 4
+
+
+def test_value_cache_disabled(env):
+    @builder()
+    def player(x):
+        return [x] * 1000
+
+    @builder(job_setup="threads")
+    def game(a, b):
+        p = player(a)
+        yield
+        # Modifies the value of its dependency in place
+        p.value.append(b)
+        return len(p.value)
+
+    runtime = env.test_runtime(value_cache_size=0)
+    runtime.compute(player(1))
+    assert [runtime.compute(game(1, b)).value for b in range(2)] == [1001, 1001]
+    stats = runtime.executor.get_stats()
+    assert stats["value_cache_misses"] == 2
+    assert "value_cache_hits" not in stats
+    assert runtime.executor.runners["local"].value_cache_size == 0
+
+
+def test_prefetch_values(env, monkeypatch):
+    @builder()
+    def item(x):
+        if x % 3 == 0:
+            attach_object("extra", x)
+            return None
+        return [x] * (x * 100)
+
+    def make_reducer(threads):
+        @builder(
+            name="reducer_{}".format(threads),
+            job_setup=JobSetup("tr", prefetch=True, prefetch_threads=threads),
+        )
+        def reducer(n):
+            data = [item(x) for x in range(n)]
+            yield
+            return [d.value for d in data + data[:2]]
+
+        return reducer
+
+    reducers = {threads: make_reducer(threads) for threads in (0, 4)}
+    runtime = env.test_runtime()
+    runtime.add_runner("tr", NaiveRunner())
+    runtime.compute_many([item(x) for x in range(20)])
+
+    def open_blob(*args, **kwargs):
+        raise Exception("Value was not prefetched")
+
+    expected = [None if x % 3 == 0 else [x] * (x * 100) for x in range(20)]
+    for reducer in reducers.values():
+        runner._value_cache.clear()
+        with monkeypatch.context() as m:
+            m.setattr(Database, "open_blob", open_blob)
+            job = runtime.compute(reducer(20))
+        assert job.value == expected + expected[:2]
+
+
+def test_shared_memory(env):
+    size = 2 * 1024 * 1024
+
+    @builder(job_setup="shm")
+    def produce(x):
+        return bytearray([x]) * size
+
+    @builder(job_setup="shm")
+    def consume(x):
+        data = produce(x)
+        yield
+        return bytes(data.value[:3]), len(data.value)
+
+    shm_runner = LocalProcessRunner(2, shared_memory_size=5 * 1024 * 1024)
+    runtime = env.test_runtime()
+    runtime.add_runner("shm", shm_runner)
+    jobs = runtime.compute_many([consume(x) for x in range(3)])
+    assert [j.value for j in jobs] == [(bytes([x]) * 3, size) for x in range(3)]
+    assert runtime.executor.get_stats()["shared_memory_hits"] == 3
+
+    # The oldest segment was released to keep the limit
+    segments = list(shm_runner.shared_segments.segments)
+    assert len(segments) == 2
+    runtime.stop()
+    assert shm_runner.shared_segments is None
+    for name in segments:
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name)